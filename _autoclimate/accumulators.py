@@ -0,0 +1,190 @@
+import datetime as dt
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from _autoclimate.utils import climate_name
+from adplus import Hass
+
+"""
+Accumulators - on / off / occupied hours per climate, over a rolling day and
+week, kept up to date from the events the app already gets (climate state
+changes in Laston, occupancy changes in Occupancy). At startup they are
+seeded once from the history prefetched for startup (recorder_db only), so
+a restart doesn't reset the totals.
+
+Each (climate, metric) has a ring of one-hour buckets covering a week, plus
+running day and week totals, so an event and a read are O(1). "Day" is the
+current hour so far plus the 23 before it.
+
+Published every 15 minutes as:
+    sensor.{appname}_{climate}_on_hours
+    sensor.{appname}_{climate}_off_hours
+    sensor.{appname}_{climate}_occupied_hours
+State: hours in the last day. Attributes: week (hours), and for occupied_hours,
+fraction_day / fraction_week.
+"""
+
+
+def _epoch(value) -> float:
+    if isinstance(value, str):
+        value = dt.datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+class BucketRing:
+    """Seconds per bucket, over the last `size` buckets, with running totals."""
+
+    def __init__(
+        self, bucket_seconds: float = 3600, size: int = 7 * 24, day: int = 24
+    ):
+        self.bucket_seconds = bucket_seconds
+        self.size = size
+        self.day = day  # buckets in the short window
+        self.buckets = [0.0] * size
+        self.current: Optional[int] = None  # Absolute bucket number
+        self.day_total = 0.0
+        self.week_total = 0.0
+
+    def _advance(self, bucket: int):
+        if self.current is None or bucket - self.current >= self.size:
+            self.buckets = [0.0] * self.size
+            self.day_total = self.week_total = 0.0
+            self.current = bucket
+            return
+        while self.current < bucket:
+            self.current += 1
+            # Bucket leaving the day window
+            self.day_total -= self.buckets[(self.current - self.day) % self.size]
+            # Slot reused for the new bucket - leaving the week window
+            slot = self.current % self.size
+            self.week_total -= self.buckets[slot]
+            self.buckets[slot] = 0.0
+
+    def add(self, start: float, end: float):
+        """Credit the interval [start, end) (epoch seconds)"""
+        if end <= start:
+            return
+        self._advance(int(end // self.bucket_seconds))
+        first = max(
+            int(start // self.bucket_seconds),
+            self.current - self.size + 1,  # type: ignore
+        )
+        for bucket in range(first, self.current + 1):  # type: ignore
+            lo = max(start, bucket * self.bucket_seconds)
+            hi = min(end, (bucket + 1) * self.bucket_seconds)
+            if hi <= lo:
+                continue
+            self.buckets[bucket % self.size] += hi - lo
+            self.week_total += hi - lo
+            if self.current - bucket < self.day:  # type: ignore
+                self.day_total += hi - lo
+
+    def totals(self, now: float) -> tuple:
+        """(day, week) seconds"""
+        self._advance(int(now // self.bucket_seconds))
+        return max(0.0, self.day_total), max(0.0, self.week_total)
+
+
+class Tracker:
+    """One climate. status: current value of each metric (True = counting)."""
+
+    METRICS = ["on", "off", "occupied"]
+
+    def __init__(self):
+        self.rings = {metric: BucketRing() for metric in self.METRICS}
+        self.status = {metric: False for metric in self.METRICS}
+        self.since = {metric: time.time() for metric in self.METRICS}
+
+    def set(self, metric: str, value: bool, now: float):
+        if self.status[metric]:
+            self.rings[metric].add(self.since[metric], now)
+        self.status[metric] = value
+        self.since[metric] = now
+
+
+class Accumulators:
+    PUBLISH_INTERVAL = 15 * 60
+
+    def __init__(self, hass: Hass, appname: str, climates: list):
+        self.hass = hass
+        self.appname = appname
+        self.climates = climates
+        self._lock = threading.Lock()
+        self.trackers: Dict[str, Tracker] = {
+            climate: Tracker() for climate in climates
+        }
+        self._published: Dict[str, tuple] = {}
+
+    def start(self, kwargs):
+        # Startup stage - after seed()
+        self.hass.run_every(self.publish, "now", self.PUBLISH_INTERVAL)
+
+    def climate_state(self, climate: str, state: str, now: Optional[float] = None):
+        """state - summarized: on / off / error_off / offline"""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            tracker = self.trackers[climate]
+            tracker.set("on", state == "on", now)
+            tracker.set("off", state in ["off", "error_off"], now)
+
+    def occupancy(self, climate: str, occupied: bool, now: Optional[float] = None):
+        if now is None:
+            now = time.time()
+        with self._lock:
+            self.trackers[climate].set("occupied", occupied, now)
+
+    def seed(
+        self,
+        climate: str,
+        climate_states: Iterable[Tuple[str, str]],
+        occupancy: Iterable[Tuple[str, bool]],
+    ):
+        """
+        Replay history, oldest first - before any live event.
+        climate_states - (last_updated, summarized state)
+        occupancy - (last_updated, occupied)
+        Follow with the current values (climate_state(), occupancy()) to
+        count up to now.
+        """
+        for last_updated, state in climate_states:
+            self.climate_state(climate, state, _epoch(last_updated))
+        for last_updated, occupied in occupancy:
+            self.occupancy(climate, occupied, _epoch(last_updated))
+
+    def sensor_name(self, climate: str, metric: str) -> str:
+        return f"sensor.{self.appname}_{climate_name(climate)}_{metric}_hours"
+
+    def hours(self, climate: str, now: Optional[float] = None) -> Dict[str, tuple]:
+        """{metric: (day hours, week hours)}, including the interval still open"""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            tracker = self.trackers[climate]
+            result = {}
+            for metric in Tracker.METRICS:
+                if tracker.status[metric]:
+                    tracker.rings[metric].add(tracker.since[metric], now)
+                    tracker.since[metric] = now
+                day, week = tracker.rings[metric].totals(now)
+                result[metric] = (round(day / 3600, 2), round(week / 3600, 2))
+        return result
+
+    def publish(self, kwargs=None):
+        now = time.time()
+        for climate in self.climates:
+            for metric, (day, week) in self.hours(climate, now).items():
+                sensor_name = self.sensor_name(climate, metric)
+                if self._published.get(sensor_name) == (day, week):
+                    continue
+                self._published[sensor_name] = (day, week)
+                attributes = {
+                    "week": week,
+                    "unit_of_measurement": "h",
+                    "friendly_name": f"{climate_name(climate)} - {metric} hours (24h)",
+                }
+                if metric == "occupied":
+                    attributes["fraction_day"] = round(day / 24, 3)
+                    attributes["fraction_week"] = round(week / (7 * 24), 3)
+                self.hass.update_state(sensor_name, state=day, attributes=attributes)
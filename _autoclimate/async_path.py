@@ -0,0 +1,156 @@
+import asyncio
+
+from _autoclimate.laston import Laston, TurnonState
+from _autoclimate.occupancy import Occupancy
+from _autoclimate.profiler import profiled
+from _autoclimate.state import State
+from _autoclimate.turn_off import TurnOff
+
+"""
+Async versions of the hot callbacks. Selected with `async_callbacks: true`.
+
+AppDaemon runs these on its event loop instead of holding a worker thread.
+All the hass reads a callback needs are awaited together (asyncio.gather).
+What's left is CPU-only work on data already read. It goes to
+run_in_executor(), because the shared logic calls sync-wrapped hass methods
+(eg: get_now) that only return values off the event loop.
+
+Writes (update_state, fire_event, call_service) made on the loop are
+scheduled by AppDaemon and not awaited.
+"""
+
+
+class AsyncState(State):
+    @profiled
+    async def get_and_publish_state(self, *args, **kwargs):
+        mock_data = kwargs.get("mock_data")
+        trigger = args[0] if args and isinstance(args[0], str) else "poll"
+        new = args[3] if len(args) > 3 and isinstance(args[3], dict) else None
+        if self.lag:
+            handle, shedding = self.lag.should_evaluate("state", new)
+            if not handle:
+                return
+            if shedding:
+                new = None
+
+        climates = [
+            climate for climate in self.climates if self.should_read(climate, trigger)
+        ]
+        results = await asyncio.gather(
+            *[
+                self._event_state(new)
+                if climate == trigger and new is not None
+                else self.hass.get_state(climate, attribute="all")
+                for climate in climates
+            ],
+            *[
+                self.hass.get_state(self.unoccupied_sensor_name(climate))
+                for climate in climates
+            ],
+        )
+        fetched = {
+            climate: (results[i], results[len(climates) + i])
+            for i, climate in enumerate(climates)
+        }
+        await self.hass.run_in_executor(
+            self.update_and_publish_state, mock_data, trigger, fetched
+        )
+
+    @staticmethod
+    async def _event_state(new: dict) -> dict:
+        # The trigger climate's state comes with its event - no read
+        return new
+
+    def update_and_publish_state(self, mock_data, trigger, fetched):
+        self.get_all_entities_state(
+            mock_data=mock_data, trigger=trigger, fetched=fetched
+        )
+        self.publish_state()
+
+
+class AsyncLaston(Laston):
+    async def initialize_states(self, kwargs):
+        await self.hass.run_in_executor(self.history.prefetch, self.climates)
+        turnon_states = await asyncio.gather(
+            *[
+                self.hass.run_in_executor(
+                    TurnonState, self.hass, self.aconfig, climate, self.history
+                )
+                for climate in self.climates
+            ]
+        )
+        self.climate_states.update(zip(self.climates, turnon_states))
+
+    @profiled
+    async def update_laston_sensors(self, climate, attribute, old, new, kwargs):
+        if self.lag and not await self.lag.ashould_handle("laston", climate, new):
+            return
+        sensor_name, laston_date = self.add_climate_state(climate, new)
+        sensor_state = await self.hass.get_state(sensor_name)
+        self.publish_laston(sensor_name, laston_date, sensor_state)
+
+
+class AsyncOccupancy(Occupancy):
+    async def create_occupancy_sensors(self, kwargs):
+        await self.hass.run_in_executor(
+            self.history.prefetch,
+            list({self.get_sensor(climate=climate) for climate in self.climates}),
+        )
+        last_on_dates = await asyncio.gather(
+            *[
+                self.hass.run_in_executor(self.history_last_on_date, climate)
+                for climate in self.climates
+            ]
+        )
+        for climate, last_on_date in zip(self.climates, last_on_dates):
+            self.create_occupancy_sensor(climate, last_on_date)
+
+    @profiled
+    async def update_occupancy_sensor(self, entity, attribute, old, new, kwargs):
+        # No reads - the only hass call is update_state
+        super().update_occupancy_sensor(entity, attribute, old, new, kwargs)
+
+
+class AsyncTurnOff(TurnOff):
+    @profiled
+    async def autooff_scheduled_cb(self, kwargs):
+        climates = list(self.climate_state.keys())
+        lastons = await asyncio.gather(
+            *[
+                self.hass.get_state(
+                    Laston.laston_sensor_name_static(self.appname, climate)
+                )
+                for climate in climates
+            ]
+        )
+        await self.hass.run_in_executor(
+            self.run_autooff, dict(zip(climates, lastons))
+        )
+
+    @profiled
+    async def cb_turn_off_climate(self, event_name, data, kwargs):
+        climate = data["climate"]
+        if not self.dedupe(event_name, data, [climate]):
+            return
+        if not self.health.attempt(climate):
+            self.log_offline(climate)
+            return
+        stateobj = await self.hass.get_state(climate, attribute="all")
+        await self.hass.run_in_executor(
+            self.turn_off_climate,
+            climate,
+            config=data.get("config"),
+            test_mode=data.get("test_mode"),
+            stateobj=stateobj,
+        )
+
+    @profiled
+    async def cb_turn_off_all(self, event_name, data, kwargs):
+        requested = self.dedupe(event_name, data, self.climates)
+        climates = [climate for climate in requested if self.health.attempt(climate)]
+        stateobjs = await asyncio.gather(
+            *[self.hass.get_state(climate, attribute="all") for climate in climates]
+        )
+        await self.hass.run_in_executor(
+            self.turn_off_all, data, dict(zip(climates, stateobjs)), requested
+        )
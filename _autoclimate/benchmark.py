@@ -0,0 +1,451 @@
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from _autoclimate import columnar
+from _autoclimate.laston import TurnonState
+from _autoclimate.occupancy import Occupancy
+from _autoclimate.replay import NoHistory, ReplayHass
+from _autoclimate.state import State
+from _autoclimate.turn_off import TurnOff
+from _autoclimate.utils import in_inactive_period
+
+"""
+Benchmark - micro-benchmarks for the hot, pure functions, on synthetic data,
+compared to committed baselines.
+
+    python -m _autoclimate.benchmark                 # small, compare to baseline
+    python -m _autoclimate.benchmark --scale medium --only offstate
+    python -m _autoclimate.benchmark --scale large --save   # record baselines
+
+Scales: (climates, history records)
+    small   - 10 climates, 2,880 records (10 days at 5 minutes)
+    medium  - 1,000 climates, 100,000 records
+    large   - 10,000 climates, 1,000,000 records
+
+Times are the median of --repeat runs (each at least 0.2s), per operation,
+with the run to run noise: (slowest - fastest) / median. A benchmark is a
+regression - exit code 1 - if it is slower than its baseline by more than
+--threshold (default 20%), or by more than the noise of either measurement
+if that is bigger, so a noisy machine doesn't flag noise. Baselines are per
+machine: record your own with --save before changing anything, then compare.
+A baseline from another machine is not compared against (and not committed -
+benchmark_baseline.json is in .gitignore).
+
+in_inactive_period and hours_since_laston don't depend on the scale, so
+they have one baseline, not one per scale.
+"""
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+SCALES = {
+    "small": (10, 2_880),
+    "medium": (1_000, 100_000),
+    "large": (10_000, 1_000_000),
+}
+START = dt.datetime(2021, 1, 1, tzinfo=dt.timezone.utc)
+OFF_STATES = [
+    {"state": "off"},
+    {"state": "away", "temp": 50},
+    {"state": "away"},
+    {"state": "perm_hold", "temp": 55, "perm_hold_string": "Permanent Hold"},
+]
+
+# A workload: () -> number of operations it ran
+Workload = Callable[[], int]
+# {"per_op": seconds (median), "noise": (slowest - fastest) / median}
+# Baselines also keep "sessions": per_op of the last --save runs
+Measurement = Dict[str, float]
+
+
+#
+# Synthetic data
+#
+def synthetic_config(n_climates: int) -> dict:
+    """entity_rules, cycling through every off_state variant"""
+    return {
+        f"climate.bench_{i}": {
+            "off_state": dict(OFF_STATES[i % len(OFF_STATES)]),
+            "occupancy_sensor": f"binary_sensor.bench_{i // 4}_occupancy",
+            "auto_off_hours": 24,
+        }
+        for i in range(n_climates)
+    }
+
+
+def synthetic_attributes(off_state: dict, rng: random.Random) -> dict:
+    """Climate attributes: offline, off, on, and on / off by the off_state rule"""
+    roll = rng.random()
+    attributes = {"current_temperature": round(rng.uniform(45, 75), 1)}
+    if roll < 0.05:
+        return attributes  # Offline - no "temperature"
+    if roll < 0.15:
+        attributes["temperature"] = None  # Thermostat off
+        return attributes
+    proper = roll < 0.6
+    if off_state["state"] == "perm_hold":
+        attributes["preset_mode"] = (
+            off_state["perm_hold_string"] if proper else "Hold until 8:00"
+        )
+        attributes["temperature"] = off_state["temp"] if proper else 68
+    else:
+        attributes["preset_mode"] = "away_indefinitely" if proper else "home"
+        attributes["temperature"] = off_state.get("temp", 50) if proper else 68
+    return attributes
+
+
+def synthetic_stateobjs(config: dict, seed: int = 1) -> List[Tuple[str, dict]]:
+    rng = random.Random(seed)
+    return [
+        (climate, {"attributes": synthetic_attributes(rule["off_state"], rng)})
+        for climate, rule in config.items()
+    ]
+
+
+def synthetic_climate_history(
+    off_state: dict, n_records: int, seed: int = 1
+) -> List[dict]:
+    """Oldest first, like RecorderHistory.history(). last_updated is a string."""
+    rng = random.Random(seed)
+    step = dt.timedelta(days=10) / n_records
+    return [
+        {
+            "last_updated": (START + i * step).isoformat(),
+            "attributes": synthetic_attributes(off_state, rng),
+        }
+        for i in range(n_records)
+    ]
+
+
+def synthetic_occupancy_history(n_records: int) -> List[dict]:
+    """Newest first. Occupied only in the oldest record - the longest scan."""
+    step = dt.timedelta(days=10) / n_records
+    return [
+        {
+            "state": "on" if i == n_records - 1 else "off",
+            "last_updated": (START + (n_records - 1 - i) * step).isoformat(),
+        }
+        for i in range(n_records)
+    ]
+
+
+class ListHistory:
+    def __init__(self, records: List[dict]):
+        self.records = records
+
+    def history(self, entity_id: str, days: int = 10, newest_first: bool = False):
+        return self.records
+
+
+#
+# Workloads
+#
+def bench_offstate(hass: ReplayHass, n_climates: int, n_records: int) -> Workload:
+    config = synthetic_config(n_climates)
+    stateobjs = synthetic_stateobjs(config)
+    inactive_period = ((7, 1), (9, 1))
+
+    def run() -> int:
+        for climate, stateobj in stateobjs:
+            State.offstate(climate, stateobj, config[climate], hass, False, None, None)
+            State.offstate(
+                climate, stateobj, config[climate], hass, False, None, inactive_period
+            )
+        return 2 * len(stateobjs)
+
+    return run
+
+
+def bench_turnon_add_state(
+    hass: ReplayHass, n_climates: int, n_records: int
+) -> Workload:
+    config = synthetic_config(len(OFF_STATES))
+    histories = {
+        climate: synthetic_climate_history(rule["off_state"], n_records // 4 or 1)
+        for climate, rule in config.items()
+    }
+
+    def run() -> int:
+        count = 0
+        for climate, records in histories.items():
+            turnon_state = TurnonState(
+                hass, config, climate, history=NoHistory()  # type: ignore
+            )
+            for stateobj in records:
+                turnon_state.add_state(stateobj)
+            turnon_state.last_turned_on
+            count += len(records)
+        return count
+
+    return run
+
+
+def bench_turnon_batch(hass: ReplayHass, n_climates: int, n_records: int) -> Workload:
+    """The same histories as turnon_add_state, through columnar (needs numpy)"""
+    config = synthetic_config(len(OFF_STATES))
+    histories = {
+        climate: synthetic_climate_history(rule["off_state"], n_records // 4 or 1)
+        for climate, rule in config.items()
+    }
+
+    def run() -> int:
+        count = 0
+        for climate, records in histories.items():
+            columnar.last_states(records, config[climate]["off_state"])
+            count += len(records)
+        return count
+
+    return run
+
+
+def bench_publish_flatten(
+    hass: ReplayHass, n_climates: int, n_records: int
+) -> Workload:
+    states = {
+        climate: {
+            "offline": False,
+            "state": "on",
+            "unoccupied": 2.5,
+            "state_reason": "Not away mode, but should be",
+        }
+        for climate in synthetic_config(n_climates)
+    }
+
+    def run() -> int:
+        State.flatten_states(states)
+        return 1
+
+    return run
+
+
+def bench_occupancy_scan(hass: ReplayHass, n_climates: int, n_records: int) -> Workload:
+    occupancy = Occupancy(
+        hass,  # type: ignore
+        config={},
+        appname="bench",
+        climates=[],
+        test_mode=False,
+        history=ListHistory(synthetic_occupancy_history(n_records)),  # type: ignore
+    )
+
+    def run() -> int:
+        occupancy._history_occupancy_info("binary_sensor.bench_occupancy")
+        return 1
+
+    return run
+
+
+def bench_in_inactive_period(
+    hass: ReplayHass, n_climates: int, n_records: int
+) -> Workload:
+    inactive_period = ((7, 1), (9, 1))
+
+    def run() -> int:
+        for _ in range(1000):
+            in_inactive_period(hass, inactive_period)
+        return 1000
+
+    return run
+
+
+def bench_hours_since_laston(
+    hass: ReplayHass, n_climates: int, n_records: int
+) -> Workload:
+    lastons = [None, (START - dt.timedelta(hours=30)).isoformat(), START]
+
+    def run() -> int:
+        for _ in range(1000):
+            for laston in lastons:
+                TurnOff.hours_since_laston_static(hass, laston)  # type: ignore
+        return 1000 * len(lastons)
+
+    return run
+
+
+UNSCALED = {"in_inactive_period", "hours_since_laston"}
+SESSIONS = 5  # --save runs kept per baseline
+BENCHMARKS: Dict[str, Callable[[ReplayHass, int, int], Workload]] = {
+    "offstate": bench_offstate,
+    "turnon_add_state": bench_turnon_add_state,
+    "turnon_batch": bench_turnon_batch,
+    "publish_flatten": bench_publish_flatten,
+    "occupancy_scan": bench_occupancy_scan,
+    "in_inactive_period": bench_in_inactive_period,
+    "hours_since_laston": bench_hours_since_laston,
+}
+
+
+#
+# Running and comparing
+#
+def measure(workload: Workload, repeat: int, min_time: float = 0.2) -> Measurement:
+    """
+    Median seconds per operation of `repeat` runs, and their noise. A run
+    calls the workload until it has taken at least min_time, so small
+    workloads are timed too.
+    """
+    times = []
+    for _ in range(repeat):
+        ops = 0
+        started = time.perf_counter()
+        while True:
+            ops += workload()
+            elapsed = time.perf_counter() - started
+            if elapsed >= min_time:
+                break
+        times.append(elapsed / ops)
+    median = statistics.median(times)
+    return {
+        "per_op": float(f"{median:.4g}"),
+        "noise": round((max(times) - min(times)) / median, 3),
+    }
+
+
+def result_name(name: str, scale: str) -> str:
+    return name if name in UNSCALED else f"{name}[{scale}]"
+
+
+def run_benchmarks(
+    scale: str, repeat: int, only: Optional[List[str]] = None
+) -> Dict[str, Measurement]:
+    """{"name[scale]": Measurement}"""
+    n_climates, n_records = SCALES[scale]
+    hass = ReplayHass()
+    hass.now = START + dt.timedelta(days=10)
+    results = {}
+    for name, factory in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        if name == "turnon_batch" and columnar.np is None:
+            print("Skipping turnon_batch: needs numpy")
+            continue
+        workload = factory(hass, n_climates, n_records)
+        results[result_name(name, scale)] = measure(workload, repeat)
+    return results
+
+
+def load_baseline(path: str = BASELINE_FILE) -> dict:
+    try:
+        with open(path) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        return {"machine": {}, "results": {}}
+    # Older baselines: seconds per operation, no noise
+    baseline["results"] = {
+        name: value if isinstance(value, dict) else {"per_op": value, "noise": 0.0}
+        for name, value in baseline["results"].items()
+    }
+    return baseline
+
+
+def this_machine() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.machine(),
+    }
+
+
+def save_baseline(results: Dict[str, Measurement], path: str = BASELINE_FILE):
+    """
+    Keeps the last SESSIONS saves per benchmark, on the same machine. per_op
+    is their median and noise covers the spread between them too, so run
+    --save a few times (at different times) for a realistic noise band.
+    """
+    baseline = load_baseline(path)
+    machine = this_machine()
+    if baseline["machine"] != machine:
+        baseline = {"machine": machine, "results": {}}
+    for name, result in results.items():
+        previous = baseline["results"].get(name, {})
+        sessions = [*previous.get("sessions", []), result["per_op"]][-SESSIONS:]
+        median = statistics.median(sessions)
+        baseline["results"][name] = {
+            "per_op": float(f"{median:.4g}"),
+            "noise": round(
+                max(result["noise"], (max(sessions) - min(sessions)) / median), 3
+            ),
+            "sessions": sessions,
+        }
+    baseline["results"] = dict(sorted(baseline["results"].items()))
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+
+
+def compare(
+    results: Dict[str, Measurement],
+    baseline: Dict[str, Measurement],
+    threshold: float,
+    missing: str = "(no baseline)",
+) -> List[str]:
+    """
+    Prints a table. Returns the names that regressed: slower by more than
+    the threshold, or than the noise of either measurement if that's bigger.
+    missing - shown for results without a baseline
+    """
+    regressions = []
+    print(
+        f"{'benchmark':35} {'per op':>12} {'baseline':>12} {'change':>8} {'allowed':>8}"
+    )
+    for name, result in results.items():
+        base = baseline.get(name)
+        per_op = result["per_op"]
+        if base is None:
+            change, allowed, flag = "", "", missing
+        else:
+            ratio = per_op / base["per_op"]
+            band = max(threshold, base["noise"], result["noise"])
+            change = f"{100 * (ratio - 1):+.1f}%"
+            allowed = f"{100 * band:+.0f}%"
+            flag = "REGRESSION" if ratio > 1 + band else ""
+            if flag:
+                regressions.append(name)
+        base_text = f"{base['per_op'] * 1e6:.3f}us" if base is not None else "-"
+        print(
+            f"{name:35} {per_op * 1e6:10.3f}us {base_text:>12} {change:>8} {allowed:>8} {flag}"
+        )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmarks for autoclimate's hot functions"
+    )
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--repeat", type=int, default=5, help="Median of n runs")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS))
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="Regression: slower by more than"
+    )
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument(
+        "--save", action="store_true", help="Record the results as the baseline"
+    )
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scale, args.repeat, args.only)
+    baseline = load_baseline(args.baseline)
+    if baseline["machine"] and baseline["machine"] != this_machine():
+        print(f"Baseline recorded on another machine: {baseline['machine']}")
+        regressions = compare(
+            results, {}, args.threshold, missing="(no baseline for this machine)"
+        )
+    else:
+        regressions = compare(results, baseline["results"], args.threshold)
+    if args.save:
+        save_baseline(results, args.baseline)
+        print(f"Saved baseline: {args.baseline}")
+    elif regressions:
+        print(f"Regressions (slower than the allowed band): {regressions}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import datetime as dt
+from typing import List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Optional - TurnonState falls back to one record at a time
+    np = None  # type: ignore
+
+"""
+Columnar - classify a climate's whole history at once, for TurnonState.
+
+TurnonState.add_state runs State.offstate on one record at a time. For a
+long history this does the same in bulk: the records become columns
+(timestamps, has-temperature, temperature, preset_mode codes), every record
+gets its on / off / error_off / offline verdict from vectorized operations
+on the compiled off_state rule, and the state changes are found with an
+array diff.
+
+The rules are the ones in State.offstate, without mocks and inactive_period
+(TurnonState uses neither). For anything it would not handle exactly like
+add_state - odd attribute or time types, records that make offstate raise,
+history out of order - it returns None and the caller falls back to
+add_state.
+
+Extracting the columns is still a pass over the records in Python, so the
+gain is the classification and transition scan, not the dict access.
+"""
+
+OFFLINE, ON, OFF, ERROR_OFF = 0, 1, 2, 3
+CODE_STATES = {OFFLINE: "offline", ON: "on", OFF: "off", ERROR_OFF: "error_off"}
+MISSING = object()  # No "temperature" attribute
+NAIVE_EPOCH = dt.datetime(1970, 1, 1)
+
+
+class Columns:
+    """One climate's history as arrays. Build with from_records()."""
+
+    def __init__(
+        self,
+        times: List[dt.datetime],
+        in_order: bool,
+        has_temp: "np.ndarray",
+        temp_none: "np.ndarray",
+        temp: "np.ndarray",
+        preset: "np.ndarray",
+        presets: List[Optional[str]],
+    ):
+        self.times = times  # datetimes
+        self.in_order = in_order  # Never goes back in time
+        self.has_temp = has_temp  # bool - "temperature" in attributes (else offline)
+        self.temp_none = temp_none  # bool - temperature is None (thermostat off)
+        self.temp = temp  # float64, NaN where not a number
+        self.preset = preset  # int32 - index into presets
+        self.presets = presets  # Distinct preset_mode values
+
+    @classmethod
+    def from_records(cls, records: List[dict]) -> Optional["Columns"]:
+        """
+        None if a record has something only the scalar path handles.
+        Per record work is in list comprehensions and map(), not numpy item
+        assignment - that would cost more than the classification saves.
+        """
+        n = len(records)
+        times = [rec.get("last_updated") for rec in records]
+        kinds = set(map(type, times))
+        if kinds == {str}:
+            times = list(map(dt.datetime.fromisoformat, times))
+        elif kinds - {str, dt.datetime}:
+            return None
+        elif str in kinds:
+            times = [
+                dt.datetime.fromisoformat(time) if isinstance(time, str) else time
+                for time in times
+            ]
+        aware = {time.tzinfo is not None for time in times}
+        if aware == {True}:
+            epoch = np.fromiter(map(dt.datetime.timestamp, times), np.float64, n)
+        elif aware == {False}:
+            epoch = np.fromiter(
+                ((time - NAIVE_EPOCH).total_seconds() for time in times), np.float64, n
+            )
+        else:
+            return None  # Mixed naive / aware - add_state raises on those
+        in_order = not (np.diff(epoch) < 0).any()
+
+        attributes = [rec["attributes"] if rec else {} for rec in records]
+        values = [attrs.get("temperature", MISSING) for attrs in attributes]
+        if set(map(type, values)) - {int, float, type(None), type(MISSING)}:
+            return None
+        temps = np.array(values, dtype=object)
+        has_temp = temps != MISSING
+        temp_none = np.equal(temps, None)
+        temp = np.where(has_temp & ~temp_none, temps, np.nan).astype(np.float64)
+
+        preset_modes = [attrs.get("preset_mode") for attrs in attributes]
+        presets = list(dict.fromkeys(preset_modes))
+        codes = {value: code for code, value in enumerate(presets)}
+        preset = np.fromiter(map(codes.__getitem__, preset_modes), np.int32, n)
+
+        return cls(times, in_order, has_temp, temp_none, temp, preset, presets)
+
+    def preset_mask(self, predicate) -> "np.ndarray":
+        """bool per record - predicate(preset_mode), run once per distinct value"""
+        lookup = np.array([predicate(value) for value in self.presets], dtype=bool)
+        return lookup[self.preset]
+
+
+def classify(columns: Columns, offconfig: dict) -> Optional["np.ndarray"]:
+    """int8 code per record (OFFLINE / ON / OFF / ERROR_OFF). None - use add_state"""
+    state = offconfig["state"]
+    codes = np.full(len(columns.times), ON, dtype=np.int8)
+    thermostat_on = columns.has_temp & ~columns.temp_none
+
+    if state == "off":
+        pass  # Thermostat on => "on"
+    elif state == "away":
+        on = thermostat_on
+        if any(value is None for value in columns.presets):
+            # preset_mode None while on => offstate raises
+            if (on & columns.preset_mask(lambda value: value is None)).any():
+                return None
+        if any(not isinstance(v, (str, type(None))) for v in columns.presets):
+            return None
+        is_away = columns.preset_mask(
+            lambda value: value is not None and value.lower() == "away_indefinitely"
+        )
+        off_temp = offconfig.get("temp")
+        if off_temp is None:
+            codes[on & is_away] = OFF
+        else:
+            codes[on & is_away & (columns.temp == off_temp)] = OFF
+    elif state == "perm_hold":
+        if "perm_hold_string" not in offconfig or "temp" not in offconfig:
+            return None
+        is_hold = columns.preset_mask(
+            lambda value: value == offconfig["perm_hold_string"]
+        )
+        codes[thermostat_on & is_hold & (columns.temp <= offconfig["temp"])] = OFF
+    else:
+        return None
+
+    codes[columns.temp_none] = OFF if state == "off" else ERROR_OFF
+    codes[~columns.has_temp] = OFFLINE
+    return codes
+
+
+def transitions(codes: "np.ndarray") -> "np.ndarray":
+    """Indexes of the records where the (non offline) state changed"""
+    online = np.flatnonzero(codes != OFFLINE)
+    if not len(online):
+        return online
+    sequence = codes[online]
+    changed = np.empty(len(sequence), dtype=bool)
+    changed[0] = True
+    np.not_equal(sequence[1:], sequence[:-1], out=changed[1:])
+    return online[changed]
+
+
+def last_states(
+    records: List[dict], offconfig: dict
+) -> Optional[Tuple[list, List[dt.datetime]]]:
+    """
+    ([curr_m2, curr_m1, curr], [dt_m1, dt]) after the whole history - what
+    TurnonState would have after add_state on each record. None - use add_state.
+    """
+    if np is None or not records:
+        return None
+    columns = Columns.from_records(records)
+    if columns is None:
+        return None
+    if not columns.in_order:
+        return None  # Out of order - add_state decides whether that's an error
+    codes = classify(columns, offconfig)
+    if codes is None:
+        return None
+    changes = transitions(codes)[-3:]
+    states = [None] * (3 - len(changes)) + [CODE_STATES[int(c)] for c in codes[changes]]
+    times = [None] * (3 - len(changes)) + [columns.times[i] for i in changes]
+    return states, times[1:]  # type: ignore
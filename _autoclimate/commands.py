@@ -0,0 +1,314 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from _autoclimate.health import HealthTracker
+from _autoclimate.utils import climate_name
+from _autoclimate.zones import zones_from_rules
+from adplus import Hass
+
+"""
+CommandQueue - all thermostat service calls go through here.
+
+* One pending command per climate. A new command for a climate replaces
+  (collapses) the one still waiting, so the latest intent wins and
+  double-taps become a single call.
+* The same command for a climate, within `coalesce_seconds` of being sent,
+  is dropped as a duplicate.
+* Turn-offs are sent before turn-ons.
+* Each integration has a token bucket: `burst` calls at once, then
+  `rate_per_minute`.
+* Commands for an offline climate are held until its HealthTracker backoff
+  allows an attempt, or it comes back online.
+* Commands with the same calls, for climates in the same zone (see zones.py)
+  and integration, are sent together: one service call per (service,
+  parameters) with an entity_id list. Submit them with drain=False, then
+  drain().
+
+Metrics are published to sensor.{appname}_command_queue
+"""
+
+Call = Tuple[str, dict]  # (service, service_kwargs) - entity_id is added on send
+
+
+class Command:
+    PRIORITY = {"off": 0, "on": 1}
+
+    def __init__(self, climate: str, kind: str, calls: List[Call]):
+        self.climate = climate
+        self.kind = kind  # "off" / "on"
+        self.calls = calls
+        self.enqueued = time.monotonic()
+        self.rate_limited = False  # Counted in stats - once, however long it waits
+        self.held_offline = False
+
+    @property
+    def priority(self) -> int:
+        return self.PRIORITY.get(self.kind, len(self.PRIORITY))
+
+    def same_as(self, other: "Command") -> bool:
+        return self.kind == other.kind and self.calls == other.calls
+
+    @property
+    def calls_key(self) -> tuple:
+        return tuple(
+            (service, tuple(sorted(service_kwargs.items())))
+            for service, service_kwargs in self.calls
+        )
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60  # tokens per second
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def take(self, count: int) -> bool:
+        self._refill()
+        # A command bigger than the bucket can still go out once the bucket is full
+        count = min(count, self.capacity)
+        if self.tokens >= count:
+            self.tokens -= count
+            return True
+        return False
+
+    def seconds_until(self, count: int) -> float:
+        self._refill()
+        count = min(count, self.capacity)
+        if self.rate <= 0:
+            return 60
+        return max(0.0, (count - self.tokens) / self.rate)
+
+
+class CommandQueue:
+    def __init__(
+        self,
+        hass: Hass,
+        config: dict,
+        appname: str,
+        rate_per_minute: float,
+        burst: int,
+        coalesce_seconds: float = 10,
+        health: Optional[HealthTracker] = None,
+    ):
+        self.hass = hass
+        self.aconfig = config
+        self.appname = appname
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.coalesce_seconds = coalesce_seconds
+        self.health = health
+        self.sensor_name = f"sensor.{self.appname}_command_queue"
+
+        self._lock = threading.RLock()
+        self._pending: Dict[str, Command] = {}  # {climate: Command}
+        self._buckets: Dict[str, TokenBucket] = {}  # {integration: TokenBucket}
+        self._last_sent: Dict[str, Tuple[Command, float]] = {}  # {climate: (cmd, t)}
+        self._drain_handle = None
+        self.zones = zones_from_rules(config)
+        self.zone_of = {
+            climate: zone
+            for zone, climates in self.zones.items()
+            for climate in climates
+        }
+
+        self.stats = {
+            "submitted": 0,
+            "coalesced": 0,
+            "superseded": 0,
+            "sent": 0,
+            "calls": 0,
+            "batched": 0,
+            "rate_limited": 0,
+            "held_offline": 0,
+            "coalesced_requests": 0,
+            "max_wait": 0.0,
+            "last_wait": 0.0,
+            "total_wait": 0.0,
+        }
+
+        if self.health:
+            self.health.on_recover.append(lambda climate: self.drain())
+
+    def integration(self, climate: str) -> str:
+        return self.aconfig.get(climate, {}).get("integration", "default")
+
+    def bucket(self, integration: str) -> TokenBucket:
+        if integration not in self._buckets:
+            self._buckets[integration] = TokenBucket(self.rate_per_minute, self.burst)
+        return self._buckets[integration]
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def submit(
+        self,
+        climate: str,
+        kind: str,
+        calls: List[Call],
+        drain: bool = True,
+        force: bool = False,
+    ) -> bool:
+        """
+        Queue a command for climate. kind: "off" or "on"
+        calls: [(service, kwargs), ...] sent in order, with entity_id=climate
+        force - skip duplicate detection (eg: a deliberate retry)
+        Returns False if it was coalesced into one already pending or just sent.
+        """
+        command = Command(climate, kind, calls)
+        with self._lock:
+            self.stats["submitted"] += 1
+            pending = self._pending.get(climate)
+            if not force and self._recently_sent(command):
+                self.stats["coalesced"] += 1
+                self.hass.log(f"{climate} - {kind} command just sent. Coalesced.")
+                return False
+            if pending and pending.same_as(command) and not force:
+                self.stats["coalesced"] += 1
+                self.hass.log(f"{climate} - duplicate {kind} command coalesced")
+                return False
+            if pending:
+                self.stats["superseded"] += 1
+                self.hass.log(
+                    f"{climate} - pending {pending.kind} command superseded by {kind}"
+                )
+                # Keep the original enqueue time so waiting is measured end-to-end
+                command.enqueued = pending.enqueued
+            self._pending[climate] = command
+
+        if drain:
+            self.drain()
+        return True
+
+    def coalesced_request(self, count: int = 1):
+        """A duplicate turn off request, absorbed before it made any commands"""
+        with self._lock:
+            self.stats["coalesced_requests"] += count
+        self.publish_metrics()
+
+    def _recently_sent(self, command: Command) -> bool:
+        if command.climate not in self._last_sent:
+            return False
+        sent, sent_at = self._last_sent[command.climate]
+        return (
+            sent.same_as(command)
+            and time.monotonic() - sent_at < self.coalesce_seconds
+        )
+
+    def drain(self, kwargs: Optional[dict] = None):
+        """
+        Send everything the rate limits allow. Reschedules itself for the rest.
+        Batches are picked under the lock, and sent after it is released, so
+        a slow integration doesn't block submit().
+        """
+        to_send = []
+        with self._lock:
+            if kwargs is not None:
+                # Called from our own timer
+                self._drain_handle = None
+            ordered = sorted(
+                self._pending.values(), key=lambda cmd: (cmd.priority, cmd.enqueued)
+            )
+            retry_in = None
+            ready = []
+            for command in ordered:
+                climate = command.climate
+                offline = self.health is not None and self.health.is_offline(climate)
+                if offline and self.health.next_attempt_in(climate) > 0:  # type: ignore
+                    if not command.held_offline:
+                        command.held_offline = True
+                        self.stats["held_offline"] += 1
+                    wait = self.health.next_attempt_in(climate)  # type: ignore
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                    continue
+                ready.append(command)
+
+            for batch in self._batches(ready):
+                n_calls = len(batch[0].calls)
+                bucket = self.bucket(self.integration(batch[0].climate))
+                if not bucket.take(n_calls):
+                    for command in batch:
+                        if not command.rate_limited:
+                            command.rate_limited = True
+                            self.stats["rate_limited"] += 1
+                    wait = bucket.seconds_until(n_calls)
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                    continue
+                now = time.monotonic()
+                for command in batch:
+                    if self.health and self.health.is_offline(command.climate):
+                        self.health.attempt(command.climate)
+                    del self._pending[command.climate]
+                    # Set now, so a duplicate submitted while sending is coalesced
+                    self._last_sent[command.climate] = (command, now)
+                to_send.append(batch)
+
+            if retry_in is not None and self._pending and self._drain_handle is None:
+                self._drain_handle = self.hass.run_in(self.drain, max(retry_in, 0.1))
+
+        for batch in to_send:
+            self._send(batch)
+        self.publish_metrics()
+
+    def _batches(self, commands: List[Command]) -> List[List[Command]]:
+        """Group commands that can share service calls. Keeps the order."""
+        batches: Dict[tuple, List[Command]] = {}
+        for command in commands:
+            key = (
+                command.priority,
+                self.zone_of.get(command.climate, command.climate),
+                self.integration(command.climate),
+                command.calls_key,
+            )
+            batches.setdefault(key, []).append(command)
+        return list(batches.values())
+
+    def _send(self, batch: List[Command]):
+        """Not under the lock - service calls are network I/O"""
+        now = time.monotonic()
+        climates = [command.climate for command in batch]
+        entity_id = climates if len(climates) > 1 else climates[0]
+        for service, service_kwargs in batch[0].calls:
+            self.hass.call_service(service, entity_id=entity_id, **service_kwargs)
+
+        with self._lock:
+            for command in batch:
+                wait = now - command.enqueued
+                self.stats["sent"] += 1
+                self.stats["last_wait"] = round(wait, 3)
+                self.stats["max_wait"] = round(max(self.stats["max_wait"], wait), 3)
+                self.stats["total_wait"] += wait
+            if len(batch) > 1:
+                self.stats["batched"] += len(batch)
+            self.stats["calls"] += len(batch[0].calls)
+
+    def publish_metrics(self):
+        with self._lock:
+            sent = self.stats["sent"]
+            oldest = min(
+                (cmd.enqueued for cmd in self._pending.values()), default=None
+            )
+            attributes = {
+                key: value for key, value in self.stats.items() if key != "total_wait"
+            }
+            attributes["avg_wait"] = (
+                round(self.stats["total_wait"] / sent, 3) if sent else 0.0
+            )
+            attributes["oldest_wait"] = (
+                round(time.monotonic() - oldest, 3) if oldest is not None else 0.0
+            )
+            attributes["pending"] = [
+                f"{climate_name(cmd.climate)}:{cmd.kind}"
+                for cmd in self._pending.values()
+            ]
+            attributes["friendly_name"] = f"{self.appname} Command Queue"
+            depth = self.depth
+
+        self.hass.update_state(self.sensor_name, state=depth, attributes=attributes)
@@ -0,0 +1,207 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+from _autoclimate.commands import Call, CommandQueue
+from _autoclimate.state import State
+from _autoclimate.utils import climate_name
+from adplus import Hass
+
+"""
+Confirmations - after a turn off is sent, watch the climate's state events
+until State.offstate() says "off".
+
+* No confirmation within `timeout` seconds: re-send the commands, with the
+  timeout doubling on each retry, up to `max_retries`.
+* Records end-to-end actuation latency (request -> confirmed off) per climate
+  and per off_state type. A climate already off when the command is sent
+  sends no state event - it is confirmed at once, and counted as already_off,
+  not in the latency stats.
+
+Metrics are published to sensor.{appname}_actuation
+"""
+
+
+class Pending:
+    def __init__(self, climate: str, config: dict, calls: List[Call]):
+        self.climate = climate
+        self.config = config
+        self.calls = calls
+        self.started = time.monotonic()
+        self.attempt = 0
+        self.timer = None
+
+    @property
+    def off_type(self) -> str:
+        return self.config["off_state"]["state"]
+
+
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, latency: float):
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+        self.last = latency
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 2) if self.count else 0.0,
+            "max": round(self.max, 2),
+            "last": round(self.last, 2),
+        }
+
+
+class Confirmations:
+    def __init__(
+        self,
+        hass: Hass,
+        appname: str,
+        climates: list,
+        commands: CommandQueue,
+        timeout: float,
+        max_retries: int,
+    ):
+        self.hass = hass
+        self.appname = appname
+        self.climates = climates
+        self.commands = commands
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.sensor_name = f"sensor.{self.appname}_actuation"
+
+        self._lock = threading.RLock()
+        self._pending: Dict[str, Pending] = {}
+        self.by_climate: Dict[str, LatencyStats] = {}
+        self.by_off_type: Dict[str, LatencyStats] = {}
+        self.stats = {"confirmed": 0, "already_off": 0, "retries": 0, "failed": 0}
+
+    def init_confirm_listeners(self, kwargs):
+        for climate in self.climates:
+            self.hass.listen_state(
+                self.on_climate_state, entity_id=climate, attribute="all"
+            )
+
+    def expect(
+        self,
+        climate: str,
+        config: dict,
+        calls: List[Call],
+        stateobj: Optional[dict] = None,
+    ):
+        """
+        Start watching climate for its off_state, as defined by config.
+        stateobj - its current state, if known
+        """
+        already_off = (
+            stateobj is not None
+            and State.offstate(climate, stateobj, config, self.hass)[0] == "off"
+        )
+        if already_off:
+            with self._lock:
+                previous = self._pending.pop(climate, None)
+                if previous:
+                    self._cancel_timer(previous)
+                self.stats["already_off"] += 1
+            self.publish_metrics()
+            return
+
+        with self._lock:
+            pending = Pending(climate, config, calls)
+            previous = self._pending.get(climate)
+            if previous:
+                # Still measure from the first request
+                pending.started = previous.started
+                self._cancel_timer(previous)
+            self._pending[climate] = pending
+            self._schedule_timeout(pending)
+
+    def on_climate_state(self, climate, attribute, old, new, kwargs):
+        if climate not in self._pending:
+            return
+        self._check(climate, new)
+
+    def _check(self, climate: str, stateobj: dict) -> bool:
+        with self._lock:
+            pending = self._pending.get(climate)
+            if not pending:
+                return False
+            verdict = State.offstate(climate, stateobj, pending.config, self.hass)[0]
+            if verdict != "off":
+                return False
+
+            del self._pending[climate]
+            self._cancel_timer(pending)
+            latency = time.monotonic() - pending.started
+            self.by_climate.setdefault(climate, LatencyStats()).add(latency)
+            self.by_off_type.setdefault(pending.off_type, LatencyStats()).add(latency)
+            self.stats["confirmed"] += 1
+
+        self.hass.log(
+            f"{climate} - Confirmed off ({pending.off_type}) in {latency:.1f}s after {pending.attempt} retries"
+        )
+        self.publish_metrics()
+        return True
+
+    def on_timeout(self, kwargs):
+        climate = kwargs["climate"]
+        with self._lock:
+            pending = self._pending.get(climate)
+            if not pending:
+                return
+            pending.timer = None
+
+        # The event may have been missed (eg: app reload). Look once before retrying.
+        stateobj: dict = self.hass.get_state(climate, attribute="all")  # type: ignore
+        if self._check(climate, stateobj):
+            return
+
+        with self._lock:
+            if pending is not self._pending.get(climate):
+                return  # Superseded by a new request
+            if pending.attempt >= self.max_retries:
+                del self._pending[climate]
+                self.stats["failed"] += 1
+                self.hass.error(
+                    f"{climate} - Not confirmed off after {pending.attempt} retries. Giving up."
+                )
+            else:
+                pending.attempt += 1
+                self.stats["retries"] += 1
+                self.hass.log(
+                    f"{climate} - Not confirmed off. Retry {pending.attempt} of {self.max_retries}"
+                )
+                self.commands.submit(climate, "off", pending.calls, force=True)
+                self._schedule_timeout(pending)
+
+        self.publish_metrics()
+
+    def _schedule_timeout(self, pending: Pending):
+        delay = self.timeout * (2 ** pending.attempt)
+        pending.timer = self.hass.run_in(
+            self.on_timeout, delay, climate=pending.climate
+        )
+
+    def _cancel_timer(self, pending: Pending):
+        if pending.timer is not None:
+            self.hass.cancel_timer(pending.timer)
+            pending.timer = None
+
+    def publish_metrics(self):
+        with self._lock:
+            attributes = dict(self.stats)
+            attributes["pending"] = [climate_name(c) for c in self._pending]
+            for climate, stats in self.by_climate.items():
+                attributes[f"{climate_name(climate)}_latency"] = stats.as_dict()
+            for off_type, stats in self.by_off_type.items():
+                attributes[f"{off_type}_latency"] = stats.as_dict()
+            attributes["friendly_name"] = f"{self.appname} Actuation"
+            depth = len(self._pending)
+
+        self.hass.update_state(self.sensor_name, state=depth, attributes=attributes)
@@ -0,0 +1,165 @@
+import asyncio
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Optional
+
+import cerberus
+from adplus import Hass
+
+"""
+Dispatcher - one listener for the "autoclimate" event, routed by its
+sub_event kwarg (see AutoClimate's docstring) to the handler registered for
+it. One dict lookup per event, however many commands there are.
+
+    dispatcher.register("app.autoclimate_turn_off_all", handler, schema)
+
+* handler(event_name, data, kwargs) - like a listen_event callback. event_name
+  is the sub_event, so the same handler can also be listened to directly
+  (TurnOff does, unless direct_events: false).
+* schema - Cerberus schema for data. Its validator is built at register()
+  time. Invalid payloads are logged and counted, and the handler isn't run.
+  Unknown keys are allowed (sub_event, metadata ...).
+
+Per sub_event counts, rejections, errors and handling time (avg / max) are
+published to sensor.{appname}_events
+"""
+
+
+class SubEvent:
+    def __init__(self, name: str, handler: Callable, schema: Optional[dict]):
+        self.name = name
+        self.handler = handler
+        self.is_async = asyncio.iscoroutinefunction(handler)
+        self.validator = (
+            cerberus.Validator(schema, allow_unknown=True) if schema else None
+        )
+        self._validate_lock = threading.Lock()  # A Validator keeps per call state
+        self._lock = threading.Lock()  # Stats
+
+        self.count = 0
+        self.rejected = 0
+        self.errors = 0
+        self.total = 0.0  # seconds
+        self.max = 0.0
+
+    def validate(self, data: dict) -> Optional[dict]:
+        """Validation errors, or None if the payload is fine"""
+        if self.validator is None:
+            return None
+        with self._validate_lock:
+            if self.validator.validate(data):
+                return None
+            return self.validator.errors
+
+    def record(self, elapsed: float, error: bool):
+        with self._lock:
+            self.count += 1
+            self.errors += error
+            self.total += elapsed
+            self.max = max(self.max, elapsed)
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "avg_ms": round(1000 * self.total / self.count, 2) if self.count else 0,
+            "max_ms": round(1000 * self.max, 2),
+        }
+
+
+class Dispatcher:
+    STATS_INTERVAL = 15 * 60
+
+    def __init__(self, hass: Hass, appname: str, event: str):
+        self.hass = hass
+        self.appname = appname
+        self.event = event
+        self.sensor_name = f"sensor.{self.appname}_events"
+        self.sub_events: Dict[str, SubEvent] = {}
+        self.unknown = 0
+
+    def register(
+        self, sub_event: str, handler: Callable, schema: Optional[dict] = None
+    ):
+        if sub_event in self.sub_events:
+            raise ValueError(f"sub_event already registered: {sub_event}")
+        self.sub_events[sub_event] = SubEvent(sub_event, handler, schema)
+
+    def init_listeners(self):
+        # Async if any handler is - sync handlers then run in the executor
+        if any(sub_event.is_async for sub_event in self.sub_events.values()):
+            self.hass.listen_event(self.acb_event, event=self.event)
+        else:
+            self.hass.listen_event(self.cb_event, event=self.event)
+        self.hass.log(
+            f"Listening to event: {self.event}, sub_events: {list(self.sub_events)}"
+        )
+        self.hass.run_every(self.publish_stats, "now", self.STATS_INTERVAL)
+
+    def route(self, data: dict) -> Optional[SubEvent]:
+        """The SubEvent for data, if it is valid. Logs and counts if not."""
+        name = data.get("sub_event")
+        sub_event = self.sub_events.get(name)  # type: ignore
+        if sub_event is None:
+            # The "autoclimate" event is shared by every instance of the app
+            if str(name).startswith(f"app.{self.appname}_"):
+                self.unknown += 1
+                self.hass.warn(f"{self.event}: unknown sub_event: {name}")
+            return None
+        errors = sub_event.validate(data)
+        if errors:
+            sub_event.reject()
+            self.hass.error(f"{self.event}: invalid {name} payload: {errors}")
+            return None
+        return sub_event
+
+    def cb_event(self, event_name, data, kwargs):
+        sub_event = self.route(data)
+        if sub_event is None:
+            return
+        started = time.perf_counter()
+        error = False
+        try:
+            sub_event.handler(sub_event.name, data, kwargs)
+        except Exception as err:
+            error = True
+            self.hass.error(f"{sub_event.name} failed: {err}\n{traceback.format_exc()}")
+        finally:
+            sub_event.record(time.perf_counter() - started, error)
+
+    async def acb_event(self, event_name, data, kwargs):
+        sub_event = self.route(data)
+        if sub_event is None:
+            return
+        started = time.perf_counter()
+        error = False
+        try:
+            if sub_event.is_async:
+                await sub_event.handler(sub_event.name, data, kwargs)
+            else:
+                await self.hass.run_in_executor(
+                    sub_event.handler, sub_event.name, data, kwargs
+                )
+        except Exception as err:
+            error = True
+            self.hass.error(f"{sub_event.name} failed: {err}\n{traceback.format_exc()}")
+        finally:
+            sub_event.record(time.perf_counter() - started, error)
+
+    def publish_stats(self, kwargs: Optional[dict] = None):
+        attributes = {
+            name: sub_event.as_dict() for name, sub_event in self.sub_events.items()
+        }
+        attributes["unknown"] = self.unknown
+        attributes["friendly_name"] = f"{self.appname} Events (handled)"
+        self.hass.update_state(
+            self.sensor_name,
+            state=sum(sub_event.count for sub_event in self.sub_events.values()),
+            attributes=attributes,
+        )
@@ -0,0 +1,152 @@
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+from _autoclimate.state import State
+from adplus import Hass
+
+"""
+SnapshotEndpoint - optional, read-only local HTTP endpoint, served straight
+from State.snapshot. Never calls Home Assistant, so it can be polled often.
+
+address:
+    * "127.0.0.1:8765" - loopback TCP (only loopback hosts are allowed)
+    * "unix:/config/autoclimate.sock" - Unix socket
+
+GET /               - {"version", "summary_state", "climates": {climate: {...}}}
+GET /<climate>      - {"version", "climate": {...}}
+
+The snapshot version is the ETag. Send it back as If-None-Match and get a
+304 with no body until something changes. Bodies are encoded once per
+version, however many readers there are.
+"""
+
+LOOPBACK_HOSTS = ["127.0.0.1", "localhost", "::1"]
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _IPv6HTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_INET6
+
+
+class SnapshotEndpoint:
+    def __init__(self, hass: Hass, state_module: State, address: str):
+        self.hass = hass
+        self.state_module = state_module
+        self.address = address
+        self.server: Optional[socketserver.BaseServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._version = -1
+        self._bodies: Dict[str, bytes] = {}  # {path: body}, for self._version
+        self.requests = 0
+        self.not_modified = 0
+
+    @staticmethod
+    def is_socket(path: str) -> bool:
+        """False if nothing is there. ValueError if something that isn't a socket is."""
+        try:
+            mode = os.lstat(path).st_mode
+        except FileNotFoundError:
+            return False
+        if not stat.S_ISSOCK(mode):
+            raise ValueError(
+                f"snapshot_endpoint: {path} exists and is not a socket. Not removing it."
+            )
+        return True
+
+    @staticmethod
+    def parse_address(address: str) -> Tuple[str, object]:
+        """("unix", path) or ("tcp", (host, port))"""
+        if address.startswith("unix:"):
+            return "unix", address[len("unix:") :]
+        host, _, port = address.rpartition(":")
+        host = host.strip("[]")
+        if host not in LOOPBACK_HOSTS:
+            raise ValueError(
+                f"snapshot_endpoint must be a loopback address or unix:<path>. Got: {address}"
+            )
+        return "tcp", (host, int(port))
+
+    def start(self, kwargs):
+        # Startup stage - after the first evaluation, so it never serves empties
+        kind, address = self.parse_address(self.address)
+        handler = self._handler()
+        if kind == "unix":
+            if self.is_socket(address):  # type: ignore
+                os.remove(address)  # type: ignore  # Left by an unclean stop
+            self.server = _UnixHTTPServer(address, handler)  # type: ignore
+        elif ":" in address[0]:  # type: ignore
+            self.server = _IPv6HTTPServer(address, handler)  # type: ignore
+        else:
+            self.server = ThreadingHTTPServer(address, handler)  # type: ignore
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, name="autoclimate_endpoint", daemon=True
+        )
+        self._thread.start()
+        self.hass.log(f"Snapshot endpoint listening on {self.address}")
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+        kind, address = self.parse_address(self.address)
+        if kind == "unix" and self.is_socket(address):  # type: ignore
+            os.remove(address)  # type: ignore
+
+    def body(self, path: str) -> Tuple[int, Optional[bytes]]:
+        """(version, body). body is None for an unknown climate."""
+        snapshot = self.state_module.snapshot
+        with self._lock:
+            if snapshot.version != self._version:
+                self._version = snapshot.version
+                self._bodies = {}
+            if path not in self._bodies:
+                data = State.snapshot_as_dict(snapshot)
+                if path != "/":
+                    climate = data["climates"].get(path.lstrip("/"))
+                    if climate is None:
+                        return snapshot.version, None
+                    data = {"version": data["version"], "climate": climate}
+                self._bodies[path] = json.dumps(data, separators=(",", ":")).encode()
+            return snapshot.version, self._bodies[path]
+
+    def _handler(self):
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                endpoint.requests += 1
+                path = self.path.split("?", 1)[0]
+                version, body = endpoint.body(path)
+                if body is None:
+                    self.send_error(404, f"Unknown climate: {path.lstrip('/')}")
+                    return
+                etag = f'"{version}"'
+                if self.headers.get("If-None-Match") == etag:
+                    endpoint.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # One log line per poll would drown the AppDaemon log
+
+        return Handler
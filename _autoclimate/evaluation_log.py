@@ -0,0 +1,264 @@
+import glob
+import json
+import math
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from adplus import Hass
+
+try:
+    import numpy as np
+except ImportError:  # Only the reader needs numpy
+    np = None  # type: ignore
+
+"""
+EvaluationLog - optional, append-only local log of every climate evaluation
+State makes, for long term analysis without the HA recorder.
+
+Files: {directory}/evaluations_<epoch>.bin - an 8 byte header, then fixed
+width little endian rows:
+    epoch       float64
+    climate     uint16  - id, see {directory}/climates.json
+    state       uint8   - index in STATES
+    temp        float32 - NaN if unknown / offline
+    unoccupied  float32 - hours. 0 = occupied, NaN = unknown / offline
+A file is rotated at max_bytes, and the oldest are deleted beyond max_files.
+Epochs never go backwards in the log, so a time range is a binary search.
+
+EvaluationLogReader memory-maps the files and returns NumPy arrays. It can
+run in another process (a notebook, a script) while the app is writing.
+"""
+
+MAGIC = b"ACEVAL1\n"
+HEADER_SIZE = len(MAGIC)
+ROW = struct.Struct("<dHBff")
+STATES = [None, "on", "off", "offline", "error_off"]
+STATE_CODES = {state: code for code, state in enumerate(STATES)}
+CLIMATES_FILE = "climates.json"
+FILE_PATTERN = "evaluations_*.bin"
+
+if np is not None:
+    ROW_DTYPE = np.dtype(
+        [
+            ("epoch", "<f8"),
+            ("climate", "<u2"),
+            ("state", "u1"),
+            ("temp", "<f4"),
+            ("unoccupied", "<f4"),
+        ]
+    )  # Packed - same layout as ROW
+    assert ROW_DTYPE.itemsize == ROW.size
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("EvaluationLogReader requires numpy (pip install numpy)")
+
+
+def _float(value) -> float:
+    if value is False:
+        return 0.0  # Occupied
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return math.nan
+
+
+def load_climate_ids(directory: str) -> Dict[str, int]:
+    try:
+        with open(os.path.join(directory, CLIMATES_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def log_files(directory: str) -> List[str]:
+    """Oldest first"""
+    return sorted(
+        glob.glob(os.path.join(directory, FILE_PATTERN)),
+        key=lambda path: int(os.path.basename(path)[12:-4]),
+    )
+
+
+class EvaluationLog:
+    def __init__(
+        self,
+        hass: Hass,
+        directory: str,
+        climates: list,
+        max_bytes: int = 10 * 1024 * 1024,
+        max_files: int = 10,
+    ):
+        self.hass = hass
+        self.directory = directory
+        self.max_bytes = max(max_bytes, HEADER_SIZE + ROW.size)
+        self.max_files = max(1, max_files)
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._last_epoch = 0.0
+        self.rows_written = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self.climate_ids = load_climate_ids(directory)
+        new = [climate for climate in climates if climate not in self.climate_ids]
+        for climate in new:
+            self.climate_ids[climate] = len(self.climate_ids)
+        if new:
+            path = os.path.join(directory, CLIMATES_FILE)
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(self.climate_ids, f, indent=2)
+            os.replace(f"{path}.tmp", path)
+
+        self._resume()
+
+    def _resume(self):
+        """Keep appending to the newest file, if it has room."""
+        files = log_files(self.directory)
+        if not files:
+            return
+        path = files[-1]
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            valid = f.read(HEADER_SIZE) == MAGIC
+        if not valid or size >= self.max_bytes:
+            return
+        rows = (size - HEADER_SIZE) // ROW.size
+        self._file = open(path, "r+b")
+        self._file.truncate(HEADER_SIZE + rows * ROW.size)  # A row cut off by a crash
+        self._file.seek(0, os.SEEK_END)
+        self._size = HEADER_SIZE + rows * ROW.size
+        if rows:
+            self._file.seek(HEADER_SIZE + (rows - 1) * ROW.size)
+            self._last_epoch = ROW.unpack(self._file.read(ROW.size))[0]
+            self._file.seek(0, os.SEEK_END)
+
+    def _rotate(self, epoch: float):
+        if self._file:
+            self._file.close()
+        path = os.path.join(self.directory, f"evaluations_{int(epoch)}.bin")
+        while os.path.exists(path):  # Rotated within the same second
+            epoch += 1
+            path = os.path.join(self.directory, f"evaluations_{int(epoch)}.bin")
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._size = HEADER_SIZE
+        for old in log_files(self.directory)[: -self.max_files]:
+            os.remove(old)
+
+    def append(self, records: List[Tuple[str, Optional[str], float, object]]):
+        """records - [(climate, state, temp, unoccupied)], all at the same time"""
+        if not records:
+            return
+        with self._lock:
+            epoch = max(time.time(), self._last_epoch)
+            data = b"".join(
+                ROW.pack(
+                    epoch,
+                    self.climate_ids[climate],
+                    STATE_CODES.get(state, 0),
+                    _float(temp),
+                    _float(unoccupied),
+                )
+                for climate, state, temp, unoccupied in records
+            )
+            try:
+                if self._file is None or self._size + len(data) > self.max_bytes:
+                    self._rotate(epoch)
+                self._file.write(data)  # type: ignore
+                self._file.flush()  # type: ignore
+            except OSError as err:
+                self.hass.error(f"Evaluation log - could not write: {err}")
+                return
+            self._size += len(data)
+            self._last_epoch = epoch
+            self.rows_written += len(records)
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class EvaluationLogReader:
+    def __init__(self, directory: str):
+        _require_numpy()
+        self.directory = directory
+        self.climate_ids = load_climate_ids(directory)
+        self.climates = {cid: climate for climate, cid in self.climate_ids.items()}
+
+    @staticmethod
+    def _map(path: str) -> "np.ndarray":
+        rows = (os.path.getsize(path) - HEADER_SIZE) // ROW.size
+        if rows <= 0:
+            return np.empty(0, dtype=ROW_DTYPE)
+        with open(path, "rb") as f:
+            if f.read(HEADER_SIZE) != MAGIC:
+                raise ValueError(f"Not an evaluation log: {path}")
+        return np.memmap(
+            path, dtype=ROW_DTYPE, mode="r", offset=HEADER_SIZE, shape=(rows,)
+        )
+
+    def segments(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> Iterator["np.ndarray"]:
+        """
+        Rows with start <= epoch < end, one memory-mapped view per file.
+        Zero copy.
+        """
+        for path in log_files(self.directory):
+            rows = self._map(path)
+            if not len(rows):
+                continue
+            epochs = rows["epoch"]
+            lo = 0 if start is None else int(np.searchsorted(epochs, start))
+            hi = len(rows) if end is None else int(np.searchsorted(epochs, end))
+            if lo < hi:
+                yield rows[lo:hi]
+
+    def read(
+        self,
+        climate: Optional[str] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> Dict[str, "np.ndarray"]:
+        """
+        {climate: rows} (structured arrays, time ordered), for one climate
+        or all of them. Use STATES to decode the state column.
+        The rows are copies - picking one climate's rows out of the
+        interleaved log can't be a view. For zero copy, use segments().
+        """
+        if climate is not None and climate not in self.climate_ids:
+            return {}
+
+        parts: Dict[int, List["np.ndarray"]] = {}
+        for rows in self.segments(start, end):
+            if climate is not None:
+                cid = self.climate_ids[climate]
+                parts.setdefault(cid, []).append(rows[rows["climate"] == cid])
+                continue
+            # All climates: one stable sort by climate (keeps time order), then split
+            order = np.argsort(rows["climate"], kind="stable")
+            grouped = rows[order]
+            bounds = np.flatnonzero(np.diff(grouped["climate"])) + 1
+            for group in np.split(grouped, bounds):
+                parts.setdefault(int(group["climate"][0]), []).append(group)
+
+        result = {}
+        for cid, groups in parts.items():
+            rows = np.concatenate(groups)
+            if len(rows):
+                result[self.climates.get(cid, str(cid))] = rows
+        return result
+
+    def replay(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> Iterator[Tuple[float, str, Optional[str], float, float]]:
+        """(epoch, climate, state, temp, unoccupied) in the order they were logged"""
+        for rows in self.segments(start, end):
+            for epoch, cid, state, temp, unoccupied in rows.tolist():
+                climate = self.climates.get(cid, str(cid))
+                yield epoch, climate, STATES[state], temp, unoccupied
@@ -0,0 +1,158 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from _autoclimate.utils import climate_name
+from adplus import Hass
+
+"""
+HealthTracker - per climate online / degraded / offline, from what State sees.
+
+* online - last evaluation found the climate online.
+* degraded - offline for fewer than `offline_after` evaluations in a row.
+* offline - offline for `offline_after` evaluations in a row.
+
+Offline climates are not re-read on every event or poll, and commands to them
+are held. Probes and commands share one schedule: an attempt is allowed every
+backoff_base, 2x, 4x ... up to backoff_max seconds. A state event from the
+climate itself always counts, so it recovers as soon as it reports back.
+
+Availability stats are published to sensor.{appname}_health
+"""
+
+
+class DeviceHealth:
+    def __init__(self):
+        self.state = "online"
+        self.failures = 0  # Offline evaluations in a row
+        self.attempts = 0  # Attempts made while offline
+        self.next_attempt = 0.0
+        self.outages = 0
+        self.offline_since: Optional[float] = None
+        self.last_outage = 0.0  # seconds
+        self.since = time.monotonic()
+        self.time_in = {"online": 0.0, "degraded": 0.0, "offline": 0.0}
+
+    def set_state(self, state: str, now: float):
+        self.time_in[self.state] += now - self.since
+        self.state = state
+        self.since = now
+
+    def as_dict(self, now: float) -> dict:
+        time_in = dict(self.time_in)
+        time_in[self.state] += now - self.since
+        total = sum(time_in.values())
+        available = time_in["online"] + time_in["degraded"]
+        offline_for = now - self.offline_since if self.offline_since else 0.0
+        next_attempt_in = self.next_attempt - now if self.state == "offline" else 0.0
+        return {
+            "state": self.state,
+            "availability": round(100 * available / total, 2) if total else 100.0,
+            "outages": self.outages,
+            "last_outage": round(self.last_outage),
+            "offline_for": round(offline_for),
+            "next_attempt_in": round(max(0.0, next_attempt_in)),
+        }
+
+
+class HealthTracker:
+    STATS_INTERVAL = 15 * 60
+
+    def __init__(
+        self,
+        hass: Hass,
+        appname: str,
+        climates: list,
+        offline_after: int = 3,
+        backoff_base: float = 60,
+        backoff_max: float = 3600,
+    ):
+        self.hass = hass
+        self.appname = appname
+        self.climates = climates
+        self.offline_after = max(1, offline_after)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sensor_name = f"sensor.{self.appname}_health"
+
+        self._lock = threading.Lock()
+        self.devices: Dict[str, DeviceHealth] = {
+            climate: DeviceHealth() for climate in climates
+        }
+        self.on_recover: List[Callable[[str], None]] = []
+
+        self.hass.run_every(self.publish_stats, "now", self.STATS_INTERVAL)
+
+    def backoff(self, attempts: int) -> float:
+        return min(self.backoff_max, self.backoff_base * 2 ** attempts)
+
+    def is_offline(self, climate: str) -> bool:
+        return self.devices[climate].state == "offline"
+
+    def attempt(self, climate: str) -> bool:
+        """
+        May we read from / send to climate now? For an offline climate,
+        a True uses up an attempt and pushes the next one out.
+        """
+        device = self.devices[climate]
+        with self._lock:
+            if device.state != "offline":
+                return True
+            now = time.monotonic()
+            if now < device.next_attempt:
+                return False
+            device.attempts += 1
+            device.next_attempt = now + self.backoff(device.attempts)
+            return True
+
+    def next_attempt_in(self, climate: str) -> float:
+        device = self.devices[climate]
+        return max(0.0, device.next_attempt - time.monotonic())
+
+    def observe(self, climate: str, online: bool):
+        """Result of an evaluation (probe or state event)"""
+        device = self.devices[climate]
+        now = time.monotonic()
+        with self._lock:
+            previous = device.state
+            if online:
+                device.failures = 0
+                device.attempts = 0
+                if previous != "online":
+                    device.set_state("online", now)
+                if device.offline_since is not None:
+                    device.last_outage = now - device.offline_since
+                    device.offline_since = None
+            else:
+                device.failures += 1
+                if device.offline_since is None:
+                    device.offline_since = now
+                if device.failures >= self.offline_after:
+                    if previous != "offline":
+                        device.set_state("offline", now)
+                        device.outages += 1
+                        device.next_attempt = now + self.backoff(0)
+                elif previous == "online":
+                    device.set_state("degraded", now)
+            changed = device.state != previous
+
+        if not changed:
+            return
+        self.hass.log(f"{climate} - health: {previous} -> {device.state}")
+        if previous == "offline":
+            for callback in self.on_recover:
+                callback(climate)
+        self.publish_stats()
+
+    def publish_stats(self, kwargs: Optional[dict] = None):
+        now = time.monotonic()
+        with self._lock:
+            attributes = {
+                climate_name(climate): device.as_dict(now)
+                for climate, device in self.devices.items()
+            }
+            n_offline = sum(
+                1 for device in self.devices.values() if device.state == "offline"
+            )
+        attributes["friendly_name"] = f"{self.appname} Health (offline climates)"
+        self.hass.update_state(self.sensor_name, state=n_offline, attributes=attributes)
@@ -0,0 +1,207 @@
+import contextlib
+import datetime as dt
+import itertools
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from adplus import Hass
+
+"""
+RecorderHistory - history for entities, read straight from Home Assistant's
+recorder SQLite database (read only) when it is configured and reachable,
+otherwise from hass.get_history().
+
+Records look like get_history() records:
+    {"entity_id", "state", "attributes", "last_changed", "last_updated"}
+
+* prefetch() pulls every requested entity in one indexed query and holds the
+  rows until clear_prefetched() - after startup - so entities read more than
+  once (eg: an occupancy sensor shared by climates) are only queried once.
+* history() otherwise streams rows from the database without building a list.
+* fetch() / read() - the same, without the prefetch cache. For readers
+  outside startup (eg: autoclimate/whatif), so they don't drop rows startup
+  still needs.
+
+Requires the recorder schema with states_meta / *_ts columns (HA 2023.4+).
+"""
+
+
+class RecorderHistory:
+    # The window, plus - like get_history() - each entity's state at its start
+    # (its last row before the cutoff).
+    QUERY = """
+        SELECT m.entity_id, s.state, a.shared_attrs,
+               COALESCE(s.last_changed_ts, s.last_updated_ts), s.last_updated_ts
+        FROM states s
+        JOIN states_meta m ON s.metadata_id = m.metadata_id
+        LEFT JOIN state_attributes a ON s.attributes_id = a.attributes_id
+        WHERE m.entity_id IN ({placeholders}) AND s.last_updated_ts >= ?
+        UNION ALL
+        SELECT m.entity_id, s.state, a.shared_attrs,
+               COALESCE(s.last_changed_ts, s.last_updated_ts), s.last_updated_ts
+        FROM states_meta m
+        JOIN states s ON s.state_id = (
+            SELECT i.state_id FROM states i
+            WHERE i.metadata_id = m.metadata_id AND i.last_updated_ts < ?
+            ORDER BY i.last_updated_ts DESC
+            LIMIT 1
+        )
+        LEFT JOIN state_attributes a ON s.attributes_id = a.attributes_id
+        WHERE m.entity_id IN ({placeholders})
+        ORDER BY 1, 5 {direction}
+    """
+
+    def __init__(self, hass: Hass, db_path: Optional[str] = None):
+        self.hass = hass
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._prefetched: Dict[str, List[dict]] = {}
+        self.db_ok = bool(db_path)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(
+            f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False
+        )
+
+    def _cutoff(self, days: int) -> float:
+        now: dt.datetime = self.hass.get_now()  # type: ignore
+        return (now - dt.timedelta(days=days)).timestamp()
+
+    def _query(self, conn, entity_ids: List[str], cutoff: float, newest_first: bool):
+        query = self.QUERY.format(
+            placeholders=",".join("?" * len(entity_ids)),
+            direction="DESC" if newest_first else "ASC",
+        )
+        return conn.execute(query, [*entity_ids, cutoff, cutoff, *entity_ids])
+
+    @staticmethod
+    def _to_record(row) -> dict:
+        entity_id, state, shared_attrs, last_changed, last_updated = row
+        return {
+            "entity_id": entity_id,
+            "state": state,
+            "attributes": json.loads(shared_attrs) if shared_attrs else {},
+            "last_changed": dt.datetime.fromtimestamp(
+                last_changed, tz=dt.timezone.utc
+            ).isoformat(),
+            "last_updated": dt.datetime.fromtimestamp(
+                last_updated, tz=dt.timezone.utc
+            ).isoformat(),
+        }
+
+    def _db_failed(self, err: Exception):
+        self.db_ok = False
+        self.hass.warn(
+            f"Recorder database not readable ({self.db_path}). Using get_history. Err: {err}"
+        )
+
+    def fetch(
+        self, entity_ids: List[str], days: int = 10
+    ) -> Optional[Dict[str, List[dict]]]:
+        """
+        One query for all entity_ids: {entity_id: records, oldest first}, not
+        cached. Entities without history are left out. None if the database
+        is not available.
+        """
+        if not self.db_ok or not entity_ids:
+            return None
+
+        cutoff = self._cutoff(days)
+        try:
+            with contextlib.closing(self._connect()) as conn:
+                return {
+                    entity_id: [self._to_record(row) for row in rows]
+                    for entity_id, rows in itertools.groupby(
+                        self._query(conn, entity_ids, cutoff, newest_first=False),
+                        key=lambda row: row[0],
+                    )
+                }
+        except sqlite3.Error as err:
+            self._db_failed(err)
+            return None
+
+    def prefetch(self, entity_ids: List[str], days: int = 10) -> bool:
+        """fetch(), held for history(). Returns False if the database is not available."""
+        fetched = self.fetch(entity_ids, days)
+        if fetched is None:
+            return False
+
+        with self._lock:
+            self._prefetched.update(fetched)
+        self.hass.log(
+            f"Prefetched history for {len(entity_ids)} entities from recorder database: {sum(len(recs) for recs in fetched.values())} records"
+        )
+        return True
+
+    def clear_prefetched(
+        self, kwargs: Optional[dict] = None, entity_ids: Optional[List[str]] = None
+    ):
+        """
+        Drop the prefetched rows - for entity_ids, or all of them.
+        A startup stage, after every stage that reads history.
+        """
+        with self._lock:
+            if entity_ids is None:
+                self._prefetched = {}
+            else:
+                for entity_id in entity_ids:
+                    self._prefetched.pop(entity_id, None)
+
+    def is_prefetched(self, entity_id: str) -> bool:
+        with self._lock:
+            return entity_id in self._prefetched
+
+    def history(
+        self, entity_id: str, days: int = 10, newest_first: bool = False
+    ) -> Iterable[dict]:
+        """State history for entity_id, sorted by last_updated. Don't modify it."""
+        with self._lock:
+            prefetched = self._prefetched.get(entity_id)
+        if prefetched is not None:
+            return reversed(prefetched) if newest_first else prefetched
+        return self.read(entity_id, days, newest_first)
+
+    def read(
+        self, entity_id: str, days: int = 10, newest_first: bool = False
+    ) -> Iterable[dict]:
+        """history(), ignoring the prefetched rows"""
+        if self.db_ok:
+            try:
+                return self._stream(entity_id, days, newest_first)
+            except sqlite3.Error as err:
+                self._db_failed(err)
+
+        return self._from_hass(entity_id, days, newest_first)
+
+    def _stream(self, entity_id: str, days: int, newest_first: bool) -> Iterator[dict]:
+        cutoff = self._cutoff(days)
+        conn = self._connect()
+        try:
+            # Run the query now, so errors surface here and not mid-iteration
+            cursor = self._query(conn, [entity_id], cutoff, newest_first)
+        except sqlite3.Error:
+            conn.close()
+            raise
+
+        def rows():
+            try:
+                for row in cursor:
+                    yield self._to_record(row)
+            finally:
+                conn.close()
+
+        return rows()
+
+    def _from_hass(self, entity_id: str, days: int, newest_first: bool) -> List[dict]:
+        data: List = self.hass.get_history(entity_id=entity_id, days=days)  # type: ignore
+
+        if not data or len(data) == 0:
+            self.hass.warn(f"get_history returned no data for entity: {entity_id}.")
+            return []
+
+        # the get_history() fn doesn't say it guarantees sort (though it appears to be)
+        return sorted(
+            data[0], key=lambda rec: rec["last_updated"], reverse=newest_first
+        )
@@ -0,0 +1,104 @@
+import bisect
+import datetime as dt
+import threading
+from typing import List, Optional, Tuple, Union
+
+"""
+TransitionJournal - fixed-size, in-memory record of climate state changes.
+
+Preallocated ring buffer: append is O(1) and the oldest record is overwritten
+when full. Timestamps are kept in their own list, in time order, so a query
+bisects for the time range instead of scanning.
+
+Record: (timestamp, climate, old_state, new_state, reason, trigger)
+"""
+
+Record = Tuple[float, str, Optional[str], Optional[str], Optional[str], Optional[str]]
+TimeArg = Union[None, float, int, str, dt.datetime]
+
+
+class TransitionJournal:
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._ts: List[float] = [0.0] * self.size
+        self._records: List[Optional[Record]] = [None] * self.size
+        self._next = 0  # Next slot to write
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(
+        self,
+        timestamp: float,
+        climate: str,
+        old_state: Optional[str],
+        new_state: Optional[str],
+        reason: Optional[str],
+        trigger: Optional[str],
+    ):
+        with self._lock:
+            if self._count:
+                # Keep the buffer time ordered, even if the clock steps back
+                timestamp = max(timestamp, self._ts[self._next - 1])
+            self._ts[self._next] = timestamp
+            self._records[self._next] = (
+                timestamp,
+                climate,
+                old_state,
+                new_state,
+                reason,
+                trigger,
+            )
+            self._next = (self._next + 1) % self.size
+            self._count = min(self._count + 1, self.size)
+
+    def _segments(self) -> List[Tuple[int, int]]:
+        """Physical (lo, hi) slices of the buffer, oldest first."""
+        if self._count < self.size:
+            return [(0, self._count)]
+        return [(self._next, self.size), (0, self._next)]
+
+    def query(
+        self,
+        start: TimeArg = None,
+        end: TimeArg = None,
+        climate: Optional[str] = None,
+    ) -> List[Record]:
+        """Records with start <= timestamp <= end, oldest first."""
+        start_ts = self.to_timestamp(start, float("-inf"))
+        end_ts = self.to_timestamp(end, float("inf"))
+        with self._lock:
+            result = []
+            for lo, hi in self._segments():
+                first = bisect.bisect_left(self._ts, start_ts, lo, hi)
+                last = bisect.bisect_right(self._ts, end_ts, lo, hi)
+                result.extend(
+                    rec
+                    for rec in self._records[first:last]
+                    if climate is None or rec[1] == climate  # type: ignore
+                )
+            return result  # type: ignore
+
+    @staticmethod
+    def to_timestamp(value: TimeArg, default: float) -> float:
+        if value is None:
+            return default
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, str):
+            value = dt.datetime.fromisoformat(value)
+        return value.timestamp()
+
+    @staticmethod
+    def as_dict(record: Record, tzinfo=None) -> dict:
+        timestamp, climate, old_state, new_state, reason, trigger = record
+        return {
+            "time": dt.datetime.fromtimestamp(timestamp, tz=tzinfo).isoformat(),
+            "climate": climate,
+            "old_state": old_state,
+            "new_state": new_state,
+            "reason": reason,
+            "trigger": trigger,
+        }
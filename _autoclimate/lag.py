@@ -0,0 +1,225 @@
+import datetime as dt
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from adplus import Hass
+
+"""
+LagMonitor - how far behind the climate state listeners are, and load
+shedding when they fall too far behind.
+
+Lag: when handling starts minus the event's last_updated. When HA restarts or
+an integration reconnects, every climate reports at once, and each event
+queues a full evaluation (State) and a laston update (Laston) on
+AppDaemon's workers.
+
+* normal - every event is handled.
+* shedding - entered when the lag (moving average) passes `threshold`
+  seconds. Left when the lag is back under threshold / 2, or no events come
+  for `threshold` seconds. What is dropped depends on the callback:
+    * State (should_evaluate) - every event starts a full evaluation, which
+      reads every climate. An event from before the start of the latest
+      evaluation (running or done) is dropped - that one read its state. A
+      storm of N events then costs about one evaluation per worker, not N.
+    * Laston (should_handle) - per climate. An event is dropped if its
+      climate has a newer state already - a later event for it is queued
+      (or done), so only the latest is handled.
+
+While shedding, a state that lasted only until the next event is not
+seen by Laston, so a brief on / off in a storm can be missed.
+
+Per callback lag, shed counts and time in each mode are published to
+sensor.{appname}_lag
+"""
+
+
+def _timestamp(value) -> Optional[float]:
+    if isinstance(value, str):
+        try:
+            value = dt.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, dt.datetime):
+        return value.timestamp()
+    return None
+
+
+class LagMonitor:
+    STATS_INTERVAL = 15 * 60
+    IDLE_CHECK_INTERVAL = 60
+    ALPHA = 0.2  # Moving average weight of the newest event
+
+    def __init__(self, hass: Hass, appname: str, threshold: float = 30):
+        self.hass = hass
+        self.appname = appname
+        self.threshold = threshold  # seconds. 0 - measure only, never shed
+        self.sensor_name = f"sensor.{self.appname}_lag"
+
+        self._lock = threading.Lock()
+        self.lag = 0.0  # Moving average, seconds
+        self.mode = "normal"
+        self._since = time.monotonic()
+        self._last_event = 0.0
+        self.time_in = {"normal": 0.0, "shedding": 0.0}
+        self.episodes = 0
+        self.last_episode = 0.0  # seconds
+        self.callbacks: Dict[str, dict] = {}
+        self._evaluations: Dict[str, float] = {}  # {name: latest start, epoch}
+
+    def start(self, kwargs):
+        # Startup stage
+        self.hass.run_every(self.publish_stats, "now", self.STATS_INTERVAL)
+        if self.threshold:
+            self.hass.run_every(self.check_idle, "now", self.IDLE_CHECK_INTERVAL)
+
+    def _callback(self, name: str) -> dict:
+        return self.callbacks.setdefault(
+            name, {"count": 0, "lag_total": 0.0, "lag_max": 0.0, "shed": 0}
+        )
+
+    def _set_mode(self, mode: str, now: float):
+        """Under self._lock"""
+        duration = now - self._since
+        self.time_in[self.mode] += duration
+        if self.mode == "shedding":
+            self.last_episode = duration
+        else:
+            self.episodes += 1
+        self.mode = mode
+        self._since = now
+
+    def observe(self, name: str, new: Optional[dict]) -> bool:
+        """
+        Record the lag of an event at the start of handling.
+        Returns True if shedding - check superseded() before handling it.
+        """
+        event_time = _timestamp((new or {}).get("last_updated"))
+        if event_time is None:
+            return False
+        lag = max(0.0, time.time() - event_time)
+        now = time.monotonic()
+        with self._lock:
+            callback = self._callback(name)
+            callback["count"] += 1
+            callback["lag_total"] += lag
+            callback["lag_max"] = max(callback["lag_max"], lag)
+            self.lag += self.ALPHA * (lag - self.lag)
+            self._last_event = now
+            previous = self.mode
+            if not self.threshold:
+                pass
+            elif self.mode == "normal" and self.lag > self.threshold:
+                self._set_mode("shedding", now)
+            elif self.mode == "shedding" and self.lag < self.threshold / 2:
+                self._set_mode("normal", now)
+            mode = self.mode
+
+        if mode != previous:
+            self.log_mode()
+        return mode == "shedding"
+
+    def superseded(self, name: str, new: dict, current_last_updated) -> bool:
+        """True (and counted as shed) if the climate has a newer state than new"""
+        event_time = _timestamp(new.get("last_updated"))
+        current = _timestamp(current_last_updated)
+        if event_time is None or current is None or current <= event_time:
+            return False
+        with self._lock:
+            self._callback(name)["shed"] += 1
+        return True
+
+    def should_handle(self, name: str, entity: str, new: Optional[dict]) -> bool:
+        """observe() + superseded(). Sync callbacks only."""
+        if not self.observe(name, new):
+            return True
+        current = self.hass.get_state(entity, attribute="last_updated")
+        return not self.superseded(name, new, current)  # type: ignore
+
+    async def ashould_handle(self, name: str, entity: str, new: Optional[dict]) -> bool:
+        """should_handle() for async callbacks - the read is awaited"""
+        if not self.observe(name, new):
+            return True
+        current = await self.hass.get_state(entity, attribute="last_updated")
+        return not self.superseded(name, new, current)  # type: ignore
+
+    def should_evaluate(self, name: str, new: Optional[dict]) -> Tuple[bool, bool]:
+        """
+        For callbacks that evaluate every climate. observe(), then
+        (handle, shedding). handle is False (and counted as shed) if an
+        evaluation started after the event. Otherwise this evaluation's start
+        is recorded, and while shedding it must read the trigger climate, not
+        use new - later events for it will be dropped. new=None (poll): just
+        record the start.
+        """
+        shedding = self.observe(name, new)
+        event_time = _timestamp((new or {}).get("last_updated"))
+        now = time.time()
+        with self._lock:
+            if (
+                shedding
+                and event_time is not None
+                and event_time <= self._evaluations.get(name, 0.0)
+            ):
+                self._callback(name)["shed"] += 1
+                return False, shedding
+            self._evaluations[name] = now
+        return True, shedding
+
+    def check_idle(self, kwargs=None):
+        """Storm over, with no events to bring the average down"""
+        now = time.monotonic()
+        with self._lock:
+            idle = self.mode == "shedding" and (
+                now - self._last_event > self.threshold
+            )
+            if idle:
+                self.lag = 0.0
+                self._set_mode("normal", now)
+        if idle:
+            self.log_mode()
+
+    def log_mode(self):
+        if self.mode == "shedding":
+            self.hass.warn(
+                f"Callbacks are {self.lag:.1f}s behind (threshold: {self.threshold}s). "
+                "Shedding superseded climate events."
+            )
+        else:
+            self.hass.log(
+                f"Callback lag back to {self.lag:.1f}s. "
+                f"Stopped shedding after {self.last_episode:.0f}s."
+            )
+        self.publish_stats()
+
+    def publish_stats(self, kwargs=None):
+        now = time.monotonic()
+        with self._lock:
+            time_in = dict(self.time_in)
+            time_in[self.mode] += now - self._since
+            attributes = {
+                name: {
+                    "count": values["count"],
+                    "avg_lag": round(values["lag_total"] / values["count"], 2)
+                    if values["count"]
+                    else 0,
+                    "max_lag": round(values["lag_max"], 2),
+                    "shed": values["shed"],
+                }
+                for name, values in self.callbacks.items()
+            }
+            attributes.update(
+                {
+                    "mode": self.mode,
+                    "threshold": self.threshold,
+                    "seconds_normal": round(time_in["normal"]),
+                    "seconds_shedding": round(time_in["shedding"]),
+                    "shedding_episodes": self.episodes,
+                    "last_episode": round(self.last_episode),
+                    "shed": sum(values["shed"] for values in self.callbacks.values()),
+                    "unit_of_measurement": "s",
+                    "friendly_name": f"{self.appname} Callback lag",
+                }
+            )
+            lag = round(self.lag, 2)
+        self.hass.update_state(self.sensor_name, state=lag, attributes=attributes)
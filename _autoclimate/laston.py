@@ -1,7 +1,12 @@
 import datetime as dt
 import json
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, List, Optional
 
+from _autoclimate import columnar
+from _autoclimate.accumulators import Accumulators
+from _autoclimate.history import RecorderHistory
+from _autoclimate.lag import LagMonitor
+from _autoclimate.profiler import profiled
 from _autoclimate.state import State
 from _autoclimate.utils import climate_name
 from adplus import Hass
@@ -23,24 +28,30 @@ class Laston:
         climates: list,
         appstate_entity: str,
         test_mode: bool,
+        history: RecorderHistory,
+        on_laston: Optional[Callable[[str, Optional[dt.datetime]], None]] = None,
+        accumulators: Optional[Accumulators] = None,
+        lag: Optional[LagMonitor] = None,
     ):
+        """on_laston(climate, laston_date) - called with each climate's current laston"""
         self.hass = hass
         self.aconfig = config
         self.appname = appname
         self.test_mode = test_mode
         self.climates = climates
         self.appstate_entity = appstate_entity
+        self.history = history
+        self.on_laston = on_laston
+        self.accumulators = accumulators
+        self.lag = lag
         self.climate_states: Dict[str, TurnonState] = {}
 
-        self.hass.run_in(self.initialize_states, 0)
-
     def initialize_states(self, kwargs):
+        self.history.prefetch(self.climates)
         for climate in self.climates:
-            self.climate_states[climate] = TurnonState(self.hass, self.aconfig, climate)
-
-        # After initialization
-        self.hass.run_in(self.create_laston_sensors, 0)
-        self.hass.run_in(self.init_laston_listeners, 0.1)
+            self.climate_states[climate] = TurnonState(
+                self.hass, self.aconfig, climate, history=self.history
+            )
 
     def laston_sensor_name(self, climate):
         return self.laston_sensor_name_static(self.appname, climate)
@@ -50,10 +61,11 @@ class Laston:
         return f"sensor.{appname}_{climate_name(climate)}_laston"
 
     def create_laston_sensors(self, kwargs):
-        self.get_history_data()
         for climate in self.climates:
             laston_sensor_name = self.laston_sensor_name(climate)
             laston_date = self.climate_states[climate].last_turned_on
+            if self.on_laston:
+                self.on_laston(climate, laston_date)
             self.hass.update_state(
                 laston_sensor_name,
                 state=laston_date,
@@ -72,13 +84,29 @@ class Laston:
                 self.update_laston_sensors, entity_id=climate, attribute="all"
             )
 
+    @profiled
     def update_laston_sensors(self, climate, attribute, old, new, kwargs):
         # Listener for climate entity
-        self.climate_states[climate].add_state(new)
-        laston_date = str(self.climate_states[climate].last_turned_on)
-
-        sensor_name = self.laston_sensor_name(climate)
+        if self.lag and not self.lag.should_handle("laston", climate, new):
+            return  # Shedding - a newer event for the climate is queued
+        sensor_name, laston_date = self.add_climate_state(climate, new)
         sensor_state = self.hass.get_state(sensor_name)
+        self.publish_laston(sensor_name, laston_date, sensor_state)
+
+    def add_climate_state(self, climate: str, stateobj: dict):
+        """Returns: sensor_name, laston_date (str)"""
+        self.climate_states[climate].add_state(stateobj)
+        if self.accumulators:
+            self.accumulators.climate_state(
+                climate, self.climate_states[climate].entity_state(stateobj)
+            )
+        last_turned_on = self.climate_states[climate].last_turned_on
+        if self.on_laston:
+            self.on_laston(climate, last_turned_on)
+        laston_date = str(last_turned_on)
+        return self.laston_sensor_name(climate), laston_date
+
+    def publish_laston(self, sensor_name: str, laston_date: str, sensor_state):
         if sensor_state != laston_date:
             self.hass.update_state(sensor_name, state=laston_date)
             self.hass.log(
@@ -86,18 +114,9 @@ class Laston:
             )
 
     def get_history_data(self, days: int = 10) -> List:
-        data: List = self.hass.get_history(entity_id=self.appstate_entity, days=days)  # type: ignore
-
-        if not data or len(data) == 0:
-            self.hass.warn(
-                f"get_history returned no data for entity: {self.appstate_entity}. Exiting"
-            )
-            return []
-        edata = data[0]
-
-        # the get_history() fn doesn't say it guarantees sort (though it appears to be)
-        edata = list(reversed(sorted(edata, key=lambda rec: rec["last_updated"])))
-        return edata
+        return list(
+            self.history.history(self.appstate_entity, days=days, newest_first=True)
+        )
 
     def find_laston_from_history(self, climate: str, history: List):
         key = f"{climate_name(climate)}_state"
@@ -120,10 +139,19 @@ class TurnonState:
         This requires the current state, the previous state, and the state before that.
     """
 
-    def __init__(self, hass: Hass, config: dict, climate_entity: str) -> None:
+    BATCH_MIN_RECORDS = 200  # Below this, numpy's overhead isn't worth it
+
+    def __init__(
+        self,
+        hass: Hass,
+        config: dict,
+        climate_entity: str,
+        history: Optional[RecorderHistory] = None,
+    ) -> None:
         self.hass = hass
         self.config = config[climate_entity]
         self.climate_entity = climate_entity
+        self.history = history if history is not None else RecorderHistory(hass)
 
         # states: "on", "off" (Ignore "offline")
         self.curr: Optional[str] = None
@@ -173,28 +201,26 @@ class TurnonState:
             return None
 
     def _initialize_from_history(self):
-        history = self._get_history_data()
+        history = list(self._get_history_data())
+
+        # Long histories: classify every record at once (needs numpy)
+        if len(history) >= self.BATCH_MIN_RECORDS:
+            result = columnar.last_states(history, self.config["off_state"])
+            if result is not None:
+                states, times = result
+                self.curr_m2, self.curr_m1, self.curr = states
+                self._curr_dt_m1, self._curr_dt = times
+                return
 
         for stateobj in history:
             self.add_state(stateobj)
 
-    def _get_history_data(self, days: int = 10) -> List:
+    def _get_history_data(self, days: int = 10) -> Iterable[dict]:
         """
         returns state history for self.climate_entity
           **IN CHRONOLOGICAL ORDER**
         """
-        data: List = self.hass.get_history(entity_id=self.climate_entity, days=days)  # type: ignore
-
-        if not data or len(data) == 0:
-            self.hass.warn(
-                f"get_history returned no data for entity: {self.climate_entity}. Exiting"
-            )
-            return []
-        edata = data[0]
-
-        # the get_history() fn doesn't say it guarantees sort (though it appears to be)
-        edata = list(sorted(edata, key=lambda rec: rec["last_updated"]))
-        return edata
+        return self.history.history(self.climate_entity, days=days)
 
     def __str__(self):
         def dtstr(val: Optional[dt.datetime]):
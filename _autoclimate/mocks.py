@@ -1,4 +1,10 @@
-from typing import Callable, List
+import asyncio
+import datetime as dt
+import itertools
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
 
 from adplus import Hass
 
@@ -10,20 +16,16 @@ class Mocks:
         mock_config: dict,
         mock_callbacks: List[Callable],
         run_mocks: bool = False,
-        init_delay: int = 1,
         mock_delay: int = 1,
     ):
         self.hass = hass
         self.mconfig = mock_config
         self.run_mocks = run_mocks
         self.callbacks = mock_callbacks
-        self.init_delay = init_delay
         self.mock_delay = mock_delay
 
-        if self.run_mocks:
-            self.hass.run_in(self.init_mocks, self.init_delay)
-
     def init_mocks(self, kwargs):
+        # Startup stage, if run_mocks
         self.hass.log("Running Mocks")
         mock_delay = 0
         for mock in self.mconfig:
@@ -43,3 +45,260 @@ class Mocks:
         self.hass.log(f"\n\n==========\nMOCK: {mock_config}")
         for callback in self.callbacks:
             self.hass.run_in(callback, 0, mock_data=mock_config)
+
+
+class MockLoadGenerator:
+    """
+    Replays attribute-change streams at `rate` events/sec through the same
+    listener callbacks real state events use. State evaluates the made-up
+    state in each event.
+
+    Test mode only: the handlers write the made-up states into the app's
+    sensors (unoccupied_since, laston, *_hours, app.{appname}_state), and
+    autooff acts on them. Restart the app after a run.
+
+    * Climate events cycle through the `mocks` mock_attributes for that climate
+      (or a temperature jitter if there are none).
+    * Occupancy sensor events toggle on / off.
+
+    Events for one entity always go to the same worker, so they stay in order.
+    A full worker queue drops the event.
+
+    With snapshot_readers > 0, that many threads read State snapshots the whole
+    time and count any that are inconsistent (version going backwards, a
+    climate half updated, counts that don't match the states).
+
+    Stats are published to sensor.{appname}_load_test
+    """
+
+    def __init__(
+        self,
+        hass: Hass,
+        appname: str,
+        config: dict,
+        load_config: dict,
+        mock_config: Optional[list],
+        climate_handlers: List[Callable],
+        occupancy_handlers: List[Callable],
+        snapshot: Optional[Callable] = None,
+    ):
+        self.hass = hass
+        self.appname = appname
+        self.aconfig = config
+        self.rate = load_config["rate"]
+        self.duration = load_config["duration"]
+        self.workers = load_config["workers"]
+        self.queue_size = load_config["queue_size"]
+        self.occupancy_share = load_config["occupancy_share"]
+        self.mconfig = mock_config or []
+        self.climate_handlers = climate_handlers
+        self.occupancy_handlers = occupancy_handlers
+        self.snapshot = snapshot
+        self.snapshot_readers = load_config["snapshot_readers"] if snapshot else 0
+        self.sensor_name = f"sensor.{self.appname}_load_test"
+
+        self._queues: List[queue.Queue] = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.stats = {
+            "produced": 0,
+            "processed": 0,
+            "dropped": 0,
+            "errors": 0,
+            "snapshot_reads": 0,
+            "snapshot_violations": 0,
+        }
+
+    def start(self, kwargs=None):
+        self.hass.log(
+            f"Load test: {self.rate} events/sec for {self.duration}s on {self.workers} workers"
+        )
+        self._queues = [queue.Queue(self.queue_size) for _ in range(self.workers)]
+        self._stop.clear()
+        for index in range(self.workers):
+            threading.Thread(
+                target=self._worker,
+                args=(index,),
+                name=f"{self.appname}_load_{index}",
+                daemon=True,
+            ).start()
+        for index in range(self.snapshot_readers):
+            threading.Thread(
+                target=self._read_snapshots,
+                name=f"{self.appname}_load_reader_{index}",
+                daemon=True,
+            ).start()
+        threading.Thread(
+            target=self._produce, name=f"{self.appname}_load_producer", daemon=True
+        ).start()
+
+    def _streams(self) -> Dict[str, itertools.cycle]:
+        """{climate: cycle of attribute dicts}"""
+        streams = {}
+        for climate in self.aconfig:
+            changes = [
+                mock["mock_attributes"]
+                for mock in self.mconfig
+                if mock["entity_id"] == climate
+            ]
+            if not changes:
+                base = self._stateobj(climate)["attributes"].get(
+                    "current_temperature", 60
+                )
+                changes = [
+                    {"current_temperature": base},
+                    {"current_temperature": base + 0.1},
+                ]
+            streams[climate] = itertools.cycle(changes)
+        return streams
+
+    def _stateobj(self, entity: str) -> dict:
+        stateobj = self.hass.get_state(entity, attribute="all")  # type: ignore
+        return stateobj or {"entity_id": entity, "state": None, "attributes": {}}
+
+    def _produce(self):
+        streams = self._streams()
+        current = {climate: self._stateobj(climate) for climate in self.aconfig}
+        sensors = {}
+        for climate, rule in self.aconfig.items():
+            sensors.setdefault(rule["occupancy_sensor"], []).append(climate)
+        occupancy = {sensor: "off" for sensor in sensors}
+
+        climate_cycle = itertools.cycle(self.aconfig.keys())
+        sensor_cycle = itertools.cycle(sensors.keys())
+        occupancy_every = (
+            max(1, round(1 / self.occupancy_share)) if self.occupancy_share else 0
+        )
+
+        started = time.monotonic()
+        next_report = started + 1
+        count = 0
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if now - started >= self.duration:
+                break
+            # Stay on schedule: produce everything due by now
+            due = int((now - started) * self.rate) - count
+            for _ in range(due):
+                count += 1
+                last_updated = dt.datetime.now(dt.timezone.utc).isoformat()
+                if occupancy_every and count % occupancy_every == 0:
+                    sensor = next(sensor_cycle)
+                    old = {"entity_id": sensor, "state": occupancy[sensor]}
+                    occupancy[sensor] = "on" if occupancy[sensor] == "off" else "off"
+                    new = {
+                        "entity_id": sensor,
+                        "state": occupancy[sensor],
+                        "attributes": {},
+                        "last_updated": last_updated,
+                    }
+                    for climate in sensors[sensor]:
+                        self._enqueue(("occupancy", sensor, climate, old, new))
+                else:
+                    climate = next(climate_cycle)
+                    old = current[climate]
+                    new = dict(old)
+                    new["attributes"] = {**old["attributes"], **next(streams[climate])}
+                    new["last_updated"] = last_updated
+                    current[climate] = new
+                    self._enqueue(("climate", climate, climate, old, new))
+            if now >= next_report:
+                self.publish_stats(now - started)
+                next_report += 1
+            time.sleep(0.001)
+
+        # Let the workers finish the backlog
+        while any(not q.empty() for q in self._queues):
+            time.sleep(0.1)
+        self._stop.set()
+        self.publish_stats(time.monotonic() - started, done=True)
+
+    def _enqueue(self, event: tuple):
+        index = hash(event[1]) % self.workers
+        with self._lock:
+            self.stats["produced"] += 1
+        try:
+            self._queues[index].put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self.stats["dropped"] += 1
+
+    def _worker(self, index: int):
+        events = self._queues[index]
+        while not self._stop.is_set():
+            try:
+                kind, entity, climate, old, new = events.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                if kind == "climate":
+                    for handler in self.climate_handlers:
+                        self._call(handler, entity, "all", old, new, {})
+                else:
+                    for handler in self.occupancy_handlers:
+                        self._call(
+                            handler, entity, "all", old, new, {"climate": climate}
+                        )
+            except Exception as err:
+                with self._lock:
+                    self.stats["errors"] += 1
+                self.hass.error(f"Load test - error handling {entity}: {err}")
+            with self._lock:
+                self.stats["processed"] += 1
+
+    def _read_snapshots(self):
+        last_version = 0
+        while not self._stop.is_set():
+            snapshot = self.snapshot()  # type: ignore
+            problems = self.snapshot_problems(snapshot, last_version)
+            last_version = snapshot.version
+            with self._lock:
+                self.stats["snapshot_reads"] += 1
+                if problems:
+                    self.stats["snapshot_violations"] += 1
+            if problems:
+                self.hass.error(f"Load test - snapshot {snapshot.version}: {problems}")
+            time.sleep(0)
+
+    @staticmethod
+    def snapshot_problems(snapshot, last_version: int) -> List[str]:
+        problems = []
+        if snapshot.version < last_version:
+            problems.append(f"version went back from {last_version}")
+        counts: Dict[Optional[str], int] = {}
+        for climate, rec in snapshot.states.items():
+            counts[rec["state"]] = counts.get(rec["state"], 0) + 1
+            if rec["offline"] is not None and rec["offline"] != (
+                rec["state"] == "offline"
+            ):
+                problems.append(f"{climate} offline={rec['offline']} but {rec}")
+        if {k: v for k, v in snapshot.counts.items() if v} != counts:
+            problems.append(f"counts {dict(snapshot.counts)} != states {counts}")
+        return problems
+
+    def _call(self, handler: Callable, *args):
+        if asyncio.iscoroutinefunction(handler):
+            # async_callbacks: run it on AppDaemon's loop, like a real event
+            asyncio.run_coroutine_threadsafe(
+                handler(*args), self.hass.AD.loop
+            ).result()
+        else:
+            handler(*args)
+
+    def publish_stats(self, elapsed: float, done: bool = False):
+        with self._lock:
+            attributes = dict(self.stats)
+        attributes["elapsed"] = round(elapsed, 1)
+        attributes["processed_per_sec"] = (
+            round(attributes["processed"] / elapsed, 1) if elapsed else 0.0
+        )
+        attributes["backlog"] = sum(q.qsize() for q in self._queues)
+        attributes["target_rate"] = self.rate
+        attributes["friendly_name"] = f"{self.appname} Load Test"
+        self.hass.update_state(
+            self.sensor_name,
+            state="done" if done else "running",
+            attributes=attributes,
+        )
+        if done:
+            self.hass.log(f"Load test done: {attributes}")
@@ -1,6 +1,9 @@
 import datetime as dt
-from typing import List
+from typing import Optional
 
+from _autoclimate.accumulators import Accumulators
+from _autoclimate.history import RecorderHistory
+from _autoclimate.profiler import profiled
 from _autoclimate.utils import climate_name
 from adplus import Hass
 from dateutil import tz
@@ -31,15 +34,16 @@ class Occupancy:
         appname: str,
         climates: list,
         test_mode: bool,
+        history: RecorderHistory,
+        accumulators: Optional[Accumulators] = None,
     ):
         self.hass = hass
         self.aconfig = config
         self.appname = appname
         self.test_mode = test_mode
         self.climates = climates
-
-        self.hass.run_in(self.create_occupancy_sensors, 0)
-        self.hass.run_in(self.init_occupancy_listeners, 0.1)
+        self.history = history
+        self.accumulators = accumulators
 
     def unoccupied_sensor_name(self, climate):
         return self.unoccupied_sensor_name_static(self.appname, climate)
@@ -50,20 +54,26 @@ class Occupancy:
 
     def create_occupancy_sensors(self, kwargs):
         # Unoccupied Since  Sensors
+        self.history.prefetch(
+            list({self.get_sensor(climate=climate) for climate in self.climates})
+        )
         for climate in self.climates:
-            unoccupied_sensor_name = self.unoccupied_sensor_name(climate)
             last_on_date = self.history_last_on_date(climate=climate)
-            self.hass.update_state(
-                unoccupied_sensor_name,
-                state=last_on_date,
-                attributes={
-                    "freindly_name": f"{climate_name(climate)} - unoccupied since",
-                    "device_class": "timestamp",
-                },
-            )
-            self.hass.log(
-                f"Created sensor: {unoccupied_sensor_name}. Initial state: {last_on_date}"
-            )
+            self.create_occupancy_sensor(climate, last_on_date)
+
+    def create_occupancy_sensor(self, climate, last_on_date):
+        unoccupied_sensor_name = self.unoccupied_sensor_name(climate)
+        self.hass.update_state(
+            unoccupied_sensor_name,
+            state=last_on_date,
+            attributes={
+                "freindly_name": f"{climate_name(climate)} - unoccupied since",
+                "device_class": "timestamp",
+            },
+        )
+        self.hass.log(
+            f"Created sensor: {unoccupied_sensor_name}. Initial state: {last_on_date}"
+        )
 
     def init_occupancy_listeners(self, kwargs):
         """
@@ -81,6 +91,7 @@ class Occupancy:
                 climate=climate,
             )
 
+    @profiled
     def update_occupancy_sensor(self, entity, attribute, old, new, kwargs):
         climate = kwargs["climate"]
         # self.hass.log(f'update_occupancy_sensor: {entity} -- {climate} -- {new} -- {attribute}')
@@ -92,6 +103,8 @@ class Occupancy:
             unoccupied_sensor_name,
             state=last_on_date,
         )
+        if self.accumulators:
+            self.accumulators.occupancy(climate, new["state"] == "on")
         # self.hass.log(
         #     f"update_occupancy_sensor - {unoccupied_sensor_name} - state: {last_on_date}"
         # )
@@ -174,25 +187,25 @@ class Occupancy:
         Note - it looks like the occupancy sensor properly handles offline by returning
         an "unavailble" status. (Unlike temp sensors, which show the last value.)
         """
-        data: List = self.hass.get_history(entity_id=sensor_id, days=days)  # type: ignore
+        # Newest first. Stops reading as soon as it finds the last "on".
+        edata = iter(self.history.history(sensor_id, days=days, newest_first=True))
 
-        if not data or len(data) == 0:
+        newest = next(edata, None)
+        if newest is None:
             self.hass.warn(
                 f"get_history returned no data for entity: {sensor_id}. Exiting"
             )
             return "error", None, None
-        edata = data[0]
-
-        # the get_history() fn doesn't say it guarantees sort (though it appears to be)
-        edata = list(reversed(sorted(edata, key=lambda rec: rec["last_updated"])))
 
-        current_state = edata[0]["state"]
+        current_state = newest["state"]
         if current_state == "on":
             return "on", None, None
 
         last_on_date = None
         now: dt.datetime = self.hass.get_now()  # type: ignore
+        oldest = newest
         for rec in edata:
+            oldest = rec
             if rec.get("state") == "on":
                 last_on_date = dt.datetime.fromisoformat(rec["last_updated"])
                 duration_off_hours = round(
@@ -202,7 +215,7 @@ class Occupancy:
 
         # Can not find a last on time. Give the total time shown.
         min_time_off = round(
-            (now - dt.datetime.fromisoformat(edata[-1]["last_updated"])).seconds
+            (now - dt.datetime.fromisoformat(oldest["last_updated"])).seconds
             / (60 * 60),
             2,
         )
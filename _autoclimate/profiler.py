@@ -0,0 +1,231 @@
+import asyncio
+import cProfile
+import datetime as dt
+import functools
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+from adplus import Hass
+
+"""
+CallbackProfiler - the autoclimate/profile service. Profiles the next N
+invocations of the app's callbacks (the ones decorated with @profiled) with
+cProfile, and optionally tracemalloc.
+
+When done it writes, to `directory`:
+    * callbacks_<time>.pstats - python -m pstats <file>
+    * callbacks_<time>.tracemalloc - tracemalloc.Snapshot.load(<file>)
+and publishes a summary (per callback counts / times, top functions by
+cumulative time, top allocations) to sensor.{appname}_profile
+
+Idle cost: the @profiled wrapper checks one attribute.
+
+cProfile profiles one thread at a time, so profiled invocations run one at a
+time. An async callback is profiled only if no other invocation is being
+profiled, and its profile includes whatever else ran on the event loop
+while it was awaiting.
+"""
+
+
+def profiled(fn):
+    """Marks a callback (method of a class with self.hass) as profilable."""
+    name = fn.__qualname__
+
+    if asyncio.iscoroutinefunction(fn):
+
+        @functools.wraps(fn)
+        async def async_wrapper(self, *args, **kwargs):
+            profiler = getattr(self.hass, "callback_profiler", None)
+            if profiler is None or not profiler.remaining:
+                return await fn(self, *args, **kwargs)
+            return await profiler.arun(name, fn, self, *args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        profiler = getattr(self.hass, "callback_profiler", None)
+        if profiler is None or not profiler.remaining:
+            return fn(self, *args, **kwargs)
+        return profiler.run(name, fn, self, *args, **kwargs)
+
+    return wrapper
+
+
+class CallbackProfiler:
+    def __init__(self, hass: Hass, appname: str, directory: str):
+        self.hass = hass
+        self.appname = appname
+        self.directory = directory
+        self.sensor_name = f"sensor.{self.appname}_profile"
+
+        self.remaining = 0  # Invocations left to profile. 0 = idle.
+        self._inflight = 0
+        self._lock = threading.Lock()  # Bookkeeping
+        self._profiling = threading.Lock()  # One profiled invocation at a time
+        self._local = threading.local()
+        self._stats: Optional[pstats.Stats] = None
+        self._callbacks: Dict[str, dict] = {}
+        self._tracemalloc = False
+        self._top = 20
+
+    def register_services(self, kwargs):
+        service_name = "autoclimate/profile"
+        self.hass.register_service(service_name, self.profile, namespace="default")
+        self.hass.log(f"Registered service: {service_name}")
+
+    def profile(self, namespace, domain, service, kwargs) -> str:
+        """
+        kwargs (all optional):
+            invocations: callback invocations to profile (default 100)
+            tracemalloc: also record allocations (default False)
+            top: functions / allocations in the summary (default 20)
+            stop: True - finish now
+        """
+        if kwargs.get("stop"):
+            self.finish()
+            return "stopped"
+
+        with self._lock:
+            if self.remaining:
+                return f"already running: {self.remaining} invocations left"
+            self._stats = None
+            self._callbacks = {}
+            self._top = int(kwargs.get("top", 20))
+            self._tracemalloc = bool(kwargs.get("tracemalloc")) and (
+                not tracemalloc.is_tracing()
+            )
+            if self._tracemalloc:
+                tracemalloc.start()
+            self.remaining = int(kwargs.get("invocations", 100))
+
+        self.hass.log(f"Profiling the next {self.remaining} callback invocations")
+        self.hass.update_state(
+            self.sensor_name,
+            state="running",
+            attributes={"friendly_name": f"{self.appname} Profile"},
+        )
+        return "started"
+
+    def _claim(self) -> bool:
+        """Count this invocation against remaining. False if none are left."""
+        with self._lock:
+            if not self.remaining:
+                return False
+            self.remaining -= 1
+            self._inflight += 1
+            return True
+
+    def run(self, name: str, fn, *args, **kwargs):
+        if getattr(self._local, "active", False) or not self._claim():
+            return fn(*args, **kwargs)  # Nested in a profiled call, or done
+
+        with self._profiling:
+            self._local.active = True
+            profile = cProfile.Profile()
+            started = time.perf_counter()
+            try:
+                return profile.runcall(fn, *args, **kwargs)
+            finally:
+                self._local.active = False
+                self._record(name, profile, time.perf_counter() - started)
+
+    async def arun(self, name: str, fn, *args, **kwargs):
+        if getattr(self._local, "active", False) or not self._profiling.acquire(
+            blocking=False
+        ):
+            return await fn(*args, **kwargs)
+        try:
+            if not self._claim():
+                return await fn(*args, **kwargs)
+            self._local.active = True
+            profile = cProfile.Profile()
+            started = time.perf_counter()
+            profile.enable()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                profile.disable()
+                self._local.active = False
+                self._record(name, profile, time.perf_counter() - started)
+        finally:
+            self._profiling.release()
+
+    def _record(self, name: str, profile: cProfile.Profile, elapsed: float):
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            callback = self._callbacks.setdefault(
+                name, {"count": 0, "total": 0.0, "max": 0.0}
+            )
+            callback["count"] += 1
+            callback["total"] += elapsed
+            callback["max"] = max(callback["max"], elapsed)
+            self._inflight -= 1
+            done = self.remaining == 0 and self._inflight == 0
+        if done:
+            self.finish()
+
+    def finish(self):
+        with self._lock:
+            self.remaining = 0
+            stats, self._stats = self._stats, None
+            callbacks = self._callbacks
+            snapshot = tracemalloc.take_snapshot() if self._tracemalloc else None
+            if self._tracemalloc:
+                tracemalloc.stop()
+                self._tracemalloc = False
+
+        files: List[str] = []
+        prefix = os.path.join(
+            self.directory, f"callbacks_{dt.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        )
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if stats is not None:
+                stats.dump_stats(f"{prefix}.pstats")
+                files.append(f"{prefix}.pstats")
+            if snapshot is not None:
+                snapshot.dump(f"{prefix}.tracemalloc")
+                files.append(f"{prefix}.tracemalloc")
+        except OSError as err:
+            self.hass.error(f"Profile - could not write to {self.directory}: {err}")
+
+        attributes = {
+            "callbacks": {
+                name: {
+                    "count": values["count"],
+                    "avg": round(values["total"] / values["count"], 4),
+                    "max": round(values["max"], 4),
+                }
+                for name, values in callbacks.items()
+            },
+            "top_cumulative": self.top_functions(stats, self._top) if stats else [],
+            "files": files,
+            "friendly_name": f"{self.appname} Profile",
+        }
+        if snapshot is not None:
+            attributes["top_allocations"] = [
+                str(stat) for stat in snapshot.statistics("lineno")[: self._top]
+            ]
+        self.hass.update_state(self.sensor_name, state="done", attributes=attributes)
+        self.hass.log(f"Profile done. Files: {files}")
+
+    @staticmethod
+    def top_functions(stats: pstats.Stats, top: int) -> List[str]:
+        """eg: "get_and_publish_state (state.py:270) cum 0.0123s, 10 calls" """
+        rows = sorted(
+            stats.stats.items(),  # type: ignore
+            key=lambda item: item[1][3],  # cumulative time
+            reverse=True,
+        )[:top]
+        return [
+            f"{func} ({os.path.basename(filename)}:{line}) cum {cumtime:.4f}s, {ncalls} calls"
+            for (filename, line, func), (_, ncalls, _, cumtime, _) in rows
+        ]
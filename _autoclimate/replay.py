@@ -0,0 +1,317 @@
+import argparse
+import csv
+import datetime as dt
+import json
+from typing import Dict, Iterable, List, Optional
+
+from _autoclimate.laston import TurnonState
+from _autoclimate.occupancy import Occupancy
+from _autoclimate.state import State
+from _autoclimate.turn_off import TurnOff
+from _autoclimate.utils import in_inactive_period, parse_inactive_period
+
+"""
+Replay - what would autoclimate have done?
+
+Drives the real decision logic (State.offstate, TurnonState, TurnOff.autooff_decision)
+over exported climate and occupancy history, on a virtual clock. Nothing talks
+to Home Assistant.
+
+    python -m _autoclimate.replay --config apps.yaml --app AutoClimate \
+        climate_history.json occupancy_history.csv
+
+History files:
+    * JSON - a list of state records, or get_history() output (a list of lists).
+    * CSV - columns entity_id, state, last_updated (or last_changed). An
+      "attributes" column holds JSON. Any other column is an attribute.
+
+A climate is assumed to obey a turn off: it counts as "off" from the turn off
+until its own history shows it off, or its occupancy sensor shows occupied.
+"""
+
+
+class ReplayHass:
+    """Just enough of Hass for the decision logic, on a virtual clock."""
+
+    def __init__(self, timezone: str = "UTC", verbose: bool = False):
+        self.timezone = timezone
+        self.verbose = verbose
+        self.now: Optional[dt.datetime] = None
+
+    def get_now(self) -> Optional[dt.datetime]:
+        return self.now
+
+    def get_timezone(self) -> str:
+        return self.timezone
+
+    def log(self, msg, *args, **kwargs):
+        if self.verbose:
+            print(f"{self.now} {msg}")
+
+    info = debug = lb_log = log
+
+    def warn(self, msg, *args, **kwargs):
+        print(f"{self.now} WARNING {msg}")
+
+    error = warn
+
+
+class NoHistory:
+    """Replay feeds TurnonState itself. It starts empty."""
+
+    def history(self, entity_id: str, days: int = 10, newest_first: bool = False):
+        return []
+
+
+def parse_time(value) -> dt.datetime:
+    if isinstance(value, dt.datetime):
+        result = value
+    else:
+        result = dt.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if result.tzinfo is None:
+        result = result.replace(tzinfo=dt.timezone.utc)
+    return result
+
+
+def _csv_value(value: str):
+    if value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def load_history(path: str) -> List[dict]:
+    """Records with last_updated as a datetime. Unsorted."""
+    records: List[dict] = []
+    if path.lower().endswith(".csv"):
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                attributes = json.loads(row.pop("attributes", "") or "{}")
+                entity_id = row.pop("entity_id")
+                state = row.pop("state", None)
+                last_updated = row.pop("last_updated", None) or row.pop("last_changed")
+                row.pop("last_changed", None)
+                attributes.update(
+                    {key: _csv_value(value) for key, value in row.items()}
+                )
+                records.append(
+                    {
+                        "entity_id": entity_id,
+                        "state": state,
+                        "attributes": attributes,
+                        "last_updated": last_updated,
+                    }
+                )
+    else:
+        with open(path) as f:
+            data = json.load(f)
+        for item in data:
+            # get_history() format: one list per entity
+            records.extend(item if isinstance(item, list) else [item])
+
+    for rec in records:
+        rec["last_updated"] = parse_time(rec.get("last_updated") or rec["last_changed"])
+        rec.setdefault("attributes", {})
+    return records
+
+
+class Replay:
+    def __init__(
+        self,
+        entity_rules: dict,
+        poll_frequency: float = 1,
+        inactive_period: Optional[tuple] = None,
+        timezone: str = "UTC",
+        verbose: bool = False,
+    ):
+        self.entity_rules = entity_rules
+        self.poll_frequency = poll_frequency
+        self.inactive_period = inactive_period
+        self.hass = ReplayHass(timezone, verbose)
+        self.climates = list(entity_rules.keys())
+
+        self.sensor_climates: Dict[str, List[str]] = {}
+        for climate, rule in entity_rules.items():
+            self.sensor_climates.setdefault(rule["occupancy_sensor"], []).append(
+                climate
+            )
+
+    def run(
+        self,
+        records: Iterable[dict],
+        start: Optional[dt.datetime] = None,
+        end: Optional[dt.datetime] = None,
+    ) -> List[dict]:
+        """Returns every turn off autooff would have issued, in time order."""
+        hass = self.hass
+        records = sorted(
+            (
+                rec
+                for rec in records
+                if rec["entity_id"] in self.entity_rules
+                or rec["entity_id"] in self.sensor_climates
+            ),
+            key=lambda rec: rec["last_updated"],
+        )
+        if not records:
+            return []
+
+        start = start or records[0]["last_updated"]
+        end = end or records[-1]["last_updated"]
+        step = dt.timedelta(hours=self.poll_frequency)
+
+        self.verdicts: Dict[str, Optional[str]] = {c: None for c in self.climates}
+        self.unoccupied_since: Dict[str, Optional[dt.datetime]] = {}
+        self.virtual_off: Dict[str, bool] = {c: False for c in self.climates}
+        self.turnon_states = {
+            climate: TurnonState(hass, self.entity_rules, climate, history=NoHistory())  # type: ignore
+            for climate in self.climates
+        }
+        turn_offs: List[dict] = []
+
+        tick = start
+        for rec in records:
+            when = rec["last_updated"]
+            if when > end:
+                break
+            while tick <= when:
+                hass.now = tick
+                turn_offs.extend(self.poll())
+                tick += step
+            hass.now = when
+            self.apply(rec)
+
+        while tick <= end:
+            hass.now = tick
+            turn_offs.extend(self.poll())
+            tick += step
+
+        return turn_offs
+
+    def apply(self, rec: dict):
+        entity_id = rec["entity_id"]
+        if entity_id in self.entity_rules:
+            verdict = State.offstate(
+                entity_id,
+                rec,
+                self.entity_rules[entity_id],
+                self.hass,  # type: ignore
+                inactive_period=self.inactive_period,  # type: ignore
+            )[0]
+            self.verdicts[entity_id] = verdict
+            if verdict == "off":
+                self.virtual_off[entity_id] = False
+            self.turnon_states[entity_id].add_state(rec)
+
+        for climate in self.sensor_climates.get(entity_id, []):
+            # Same as the live unoccupied_since sensor
+            if rec["state"] == "on":
+                self.unoccupied_since[climate] = Occupancy.UNOCCUPIED_SINCE_OCCUPIED_VALUE
+                self.virtual_off[climate] = False
+            elif rec["state"] in ["off", "unavailable"]:
+                self.unoccupied_since[climate] = rec["last_updated"]
+            else:
+                self.unoccupied_since[climate] = None
+
+    def poll(self) -> List[dict]:
+        """One autooff_scheduled_cb run."""
+        hass = self.hass
+        if in_inactive_period(hass, self.inactive_period):  # type: ignore
+            return []
+
+        issued = []
+        for climate in self.climates:
+            config = self.entity_rules[climate]
+            if "auto_off_hours" not in config:
+                continue
+            verdict = self.verdicts[climate]
+            if verdict in [None, "off", "offline"] or self.virtual_off[climate]:
+                continue
+
+            since = self.unoccupied_since.get(climate)
+            hours_unoccupied = (
+                None
+                if since is None
+                else Occupancy.duration_off_static(hass, since)
+            )
+            turnon_state = self.turnon_states[climate]
+            decision, _ = TurnOff.autooff_decision(
+                hass,  # type: ignore
+                climate,
+                config,
+                hours_unoccupied,
+                get_laston=lambda: turnon_state.last_turned_on,
+            )
+            if decision == "off":
+                self.virtual_off[climate] = True
+                laston = turnon_state.last_turned_on
+                issued.append(
+                    {
+                        "time": hass.now.isoformat(),  # type: ignore
+                        "climate": climate,
+                        "off_state": config["off_state"]["state"],
+                        "hours_unoccupied": hours_unoccupied,
+                        "laston": laston.isoformat() if laston else None,
+                    }
+                )
+                hass.log(f"Replay - would turn off {climate}")
+        return issued
+
+
+def load_app_config(path: str, app: str) -> dict:
+    import yaml
+
+    with open(path) as f:
+        return yaml.safe_load(f)[app]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Replay history through the autoclimate turn off rules."
+    )
+    parser.add_argument("history", nargs="+", help="History files (.json / .csv)")
+    parser.add_argument("--config", required=True, help="AppDaemon apps yaml")
+    parser.add_argument("--app", default="AutoClimate", help="App name in --config")
+    parser.add_argument("--timezone", default="UTC")
+    parser.add_argument("--out", help="Write the turn offs here as JSON")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    config = load_app_config(args.config, args.app)
+    inactive_period = (
+        parse_inactive_period(config["inactive_period"])
+        if config.get("inactive_period")
+        else None
+    )
+    replay = Replay(
+        config["entity_rules"],
+        poll_frequency=config["poll_frequency"],
+        inactive_period=inactive_period,
+        timezone=args.timezone,
+        verbose=args.verbose,
+    )
+
+    records: List[dict] = []
+    for path in args.history:
+        records.extend(load_history(path))
+
+    started = dt.datetime.now()
+    turn_offs = replay.run(records)
+    elapsed = (dt.datetime.now() - started).total_seconds()
+
+    for turn_off in turn_offs:
+        print(
+            f'{turn_off["time"]}  {turn_off["climate"]:35} {turn_off["off_state"]:10} unoccupied: {turn_off["hours_unoccupied"]}'
+        )
+    print(
+        f"{len(turn_offs)} turn offs. {len(records)} records replayed in {elapsed:.2f}s."
+    )
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(turn_offs, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
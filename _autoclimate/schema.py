@@ -1,3 +1,10 @@
+# Defaults are in SensorPolicy, so entity_rules only override what they set
+TEMP_SENSOR_POLICY = {
+    "deadband": {"required": False, "type": "number", "min": 0},
+    "min_interval": {"required": False, "type": "number", "min": 0},
+    "heartbeat": {"required": False, "type": "number", "min": 0},
+}
+
 SCHEMA = {
     "name": {"required": True, "type": "string"},
     "poll_frequency": {"required": True, "type": "number"},
@@ -5,6 +12,36 @@ SCHEMA = {
     "run_mocks": {"required": False, "type": "boolean", "default": False},
     "create_temp_sensors": {"required": True, "type": "boolean"},
     "turn_on_error_off": {"required": False, "type": "boolean", "default": True},
+    "async_callbacks": {"required": False, "type": "boolean", "default": False},
+    "publish_mode": {
+        "required": False,
+        "type": "string",
+        "allowed": ["flat", "per_climate", "both"],
+        "default": "flat",
+    },
+    "command_rate_per_minute": {"required": False, "type": "number", "default": 6},
+    "command_burst": {"required": False, "type": "integer", "default": 4},
+    "command_coalesce_seconds": {"required": False, "type": "number", "default": 10},
+    "turn_off_dedupe_seconds": {"required": False, "type": "number", "default": 5},
+    "direct_events": {"required": False, "type": "boolean", "default": True},
+    "confirm_timeout": {"required": False, "type": "number", "default": 120},
+    "confirm_retries": {"required": False, "type": "integer", "default": 2},
+    "health_offline_after": {"required": False, "type": "integer", "default": 3},
+    "health_backoff_base": {"required": False, "type": "number", "default": 60},
+    "health_backoff_max": {"required": False, "type": "number", "default": 3600},
+    "lag_shed_threshold": {"required": False, "type": "number", "default": 30},
+    "journal_size": {"required": False, "type": "integer", "default": 2000},
+    "recorder_db": {"required": False, "type": "string"},
+    "profile_dir": {"required": False, "type": "string"},
+    "snapshot_endpoint": {"required": False, "type": "string"},
+    "evaluation_log_dir": {"required": False, "type": "string"},
+    "evaluation_log_max_mb": {"required": False, "type": "number", "default": 10},
+    "evaluation_log_max_files": {"required": False, "type": "integer", "default": 10},
+    "temp_sensor_policy": {
+        "required": False,
+        "type": "dict",
+        "schema": TEMP_SENSOR_POLICY,
+    },
     "inactive_period": {  # See "extra_validation" for validation rules
         "required": False,
         "type": "string",
@@ -31,9 +68,27 @@ SCHEMA = {
                 },
                 "occupancy_sensor": {"type": "string", "required": True},
                 "auto_off_hours": {"type": "number", "required": False},
+                "integration": {"type": "string", "required": False},
+                "temp_sensor_policy": {
+                    "type": "dict",
+                    "required": False,
+                    "schema": TEMP_SENSOR_POLICY,
+                },
             },
         },
     },
+    "load_generator": {  # Runs if run_mocks: true
+        "required": False,
+        "type": "dict",
+        "schema": {
+            "rate": {"required": False, "type": "number", "default": 100},
+            "duration": {"required": False, "type": "number", "default": 60},
+            "workers": {"required": False, "type": "integer", "default": 4},
+            "queue_size": {"required": False, "type": "integer", "default": 1000},
+            "occupancy_share": {"required": False, "type": "number", "default": 0.2},
+            "snapshot_readers": {"required": False, "type": "integer", "default": 2},
+        },
+    },
     "mocks": {
         "required": False,
         "type": "list",
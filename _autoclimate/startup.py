@@ -0,0 +1,192 @@
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from adplus import Hass
+
+"""
+Startup - runs the app's startup steps as a dependency graph.
+
+Each stage runs (via run_in, so on an AppDaemon worker or the event loop for
+async stages) as soon as every stage it depends on has finished. Independent
+stages run in parallel. No fixed delays.
+
+When all stages are done, app.{appname}_ready is fired with per stage timings.
+A stage that raises is logged, and nothing that depends on it runs. Once
+everything else is done, the ready event is still fired, with the failed
+and skipped stages, so listeners always get an outcome.
+
+start() raises ValueError on an unknown dependency or a cycle.
+"""
+
+
+class Stage:
+    def __init__(self, name: str, callback: Callable, after: List[str]):
+        self.name = name
+        self.callback = callback  # callback(kwargs), like a run_in callback
+        self.after = after
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+
+class Startup:
+    def __init__(self, hass: Hass, appname: str):
+        self.hass = hass
+        self.appname = appname
+        self.stages: Dict[str, Stage] = {}
+        self._lock = threading.Lock()
+        self._t0 = 0.0
+        self.failed: List[str] = []
+        self.is_ready = False  # Every stage finished
+        self.is_done = False  # The ready event was fired
+
+    def ready_event_name(self) -> str:
+        return f"app.{self.appname}_ready"
+
+    def add(self, name: str, callback: Callable, after: Optional[List[str]] = None):
+        self.stages[name] = Stage(name, callback, after or [])
+
+    def start(self):
+        for stage in self.stages.values():
+            for dependency in stage.after:
+                if dependency not in self.stages:
+                    raise ValueError(
+                        f"Startup stage {stage.name} depends on unknown stage {dependency}"
+                    )
+        self._check_cycles()
+        self._t0 = time.monotonic()
+        self._schedule_ready()
+
+    def _check_cycles(self):
+        """Topological sort (Kahn). Stages left over are on, or behind, a cycle."""
+        waiting = {name: len(stage.after) for name, stage in self.stages.items()}
+        dependents: Dict[str, List[str]] = {name: [] for name in self.stages}
+        for stage in self.stages.values():
+            for dependency in stage.after:
+                dependents[dependency].append(stage.name)
+        free = [name for name, count in waiting.items() if count == 0]
+        while free:
+            name = free.pop()
+            del waiting[name]
+            for dependent in dependents[name]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    free.append(dependent)
+        if waiting:
+            raise ValueError(f"Startup stages have a dependency cycle: {sorted(waiting)}")
+
+    def skipped(self) -> List[str]:
+        """Stages that will never run - they depend on a failed stage. Under the lock."""
+        blocked = set(self.failed)
+        changed = True
+        while changed:
+            changed = False
+            for stage in self.stages.values():
+                if stage.name not in blocked and any(
+                    dep in blocked for dep in stage.after
+                ):
+                    blocked.add(stage.name)
+                    changed = True
+        return [name for name in self.stages if name in blocked - set(self.failed)]
+
+    def _schedule_ready(self):
+        with self._lock:
+            ready = [
+                stage
+                for stage in self.stages.values()
+                if stage.started is None
+                and all(self.stages[dep].finished for dep in stage.after)
+            ]
+            for stage in ready:
+                stage.started = time.monotonic()
+        for stage in ready:
+            if asyncio.iscoroutinefunction(stage.callback):
+                self.hass.run_in(self._run_async_stage, 0, stage=stage.name)
+            else:
+                self.hass.run_in(self._run_stage, 0, stage=stage.name)
+
+    def _run_stage(self, kwargs):
+        stage = self.stages[kwargs["stage"]]
+        try:
+            stage.callback({})
+        except Exception as err:
+            self._failed(stage, err)
+            return
+        self._finished(stage)
+
+    async def _run_async_stage(self, kwargs):
+        stage = self.stages[kwargs["stage"]]
+        try:
+            await stage.callback({})
+        except Exception as err:
+            self._failed(stage, err)
+            return
+        self._finished(stage)
+
+    def _failed(self, stage: Stage, err: Exception):
+        with self._lock:
+            self.failed.append(stage.name)
+        self.hass.error(
+            f"Startup stage {stage.name} failed: {err}. Stages that depend on it will not run."
+        )
+        self._check_done()
+
+    def _check_done(self):
+        """After a failure: fire the ready event once nothing else can run"""
+        with self._lock:
+            skipped = self.skipped()
+            done = not self.is_done and all(
+                stage.finished or stage.name in self.failed or stage.name in skipped
+                for stage in self.stages.values()
+            )
+            if done:
+                self.is_done = True
+        if done:
+            self._ready(skipped)
+
+    def _finished(self, stage: Stage):
+        with self._lock:
+            stage.finished = time.monotonic()
+            all_done = all(s.finished for s in self.stages.values())
+            ready = all_done and not self.is_done
+            self.is_ready = all_done
+            self.is_done = self.is_done or all_done
+        self.hass.debug(
+            f"Startup stage {stage.name}: {stage.finished - stage.started:.3f}s"  # type: ignore
+        )
+        if ready:
+            self._ready([])
+        elif not all_done:
+            self._schedule_ready()
+            if self.failed:
+                self._check_done()
+
+    def timings(self) -> Dict[str, dict]:
+        """{stage: {"start": seconds from startup, "duration": seconds}}"""
+        return {
+            stage.name: {
+                "start": round(stage.started - self._t0, 3),
+                "duration": round(stage.finished - stage.started, 3),
+            }
+            for stage in self.stages.values()
+            if stage.started is not None and stage.finished is not None
+        }
+
+    def _ready(self, skipped: List[str]):
+        total = round(time.monotonic() - self._t0, 3)
+        timings = self.timings()
+        slowest = sorted(timings, key=lambda name: -timings[name]["duration"])[:3]
+        if self.failed:
+            self.hass.error(
+                f"Startup done in {total}s, with failed stages: {self.failed}. Skipped: {skipped}"
+            )
+        else:
+            self.hass.log(f"Ready in {total}s. Slowest stages: {slowest}")
+        self.hass.fire_event(
+            self.ready_event_name(),
+            total=total,
+            stages=timings,
+            failed=list(self.failed),
+            skipped=skipped,
+        )
@@ -1,16 +1,50 @@
+import datetime as dt
 import json  # noqa
 import math
-from typing import Optional, Tuple
+import queue
+import threading
+from collections import Counter
+from types import MappingProxyType
+from typing import Callable, Dict, Mapping, NamedTuple, Optional, Tuple
 
 import adplus
 from adplus import Hass
 
 adplus.importlib.reload(adplus)
+from _autoclimate.evaluation_log import EvaluationLog
+from _autoclimate.health import HealthTracker
+from _autoclimate.journal import TransitionJournal
+from _autoclimate.lag import LagMonitor
 from _autoclimate.occupancy import Occupancy
+from _autoclimate.profiler import profiled
+from _autoclimate.temp_sensors import TempSensorPublisher
 from _autoclimate.utils import climate_name, in_inactive_period
 
 
+class StateSnapshot(NamedTuple):
+    """Immutable, versioned copy of State. Safe to read from any thread."""
+
+    version: int
+    states: Mapping[str, Mapping]  # {climate: {offline, state, unoccupied, ...}}
+    temps: Mapping[str, float]  # {climate: current_temp}
+    counts: Mapping[Optional[str], int]  # {state: number of climates}
+    summary: str
+    hvac_modes: Mapping[str, Optional[str]]  # {climate: raw climate state, eg: "heat"}
+    lastons: Mapping[str, Optional[str]]  # {climate: laston isoformat}
+
+
 class State:
+    """
+    Concurrency: listener callbacks run on any AppDaemon thread. Every change
+    to self.state goes through submit(), which runs changes one at a time
+    (single writer), then publishes a new StateSnapshot. Readers (services,
+    autooff, publishing) use self.snapshot - no locks, never half-updated.
+    The snapshot version only moves when something in it changed.
+    """
+
+    COUNTED_STATES = ["on", "off", "offline", "error_off"]
+    KEEP = object()  # Placeholder in updates - leave the current value alone
+
     def __init__(
         self,
         hass: Hass,
@@ -21,6 +55,12 @@ class State:
         create_temp_sensors: bool,
         test_mode: bool,
         inactive_period: Optional[str],
+        journal_size: int = 2000,
+        temp_sensor_policy: Optional[dict] = None,
+        health: Optional[HealthTracker] = None,
+        evaluation_log: Optional[EvaluationLog] = None,
+        publish_mode: str = "flat",
+        lag: Optional[LagMonitor] = None,
     ):
         self.hass = hass
         self.aconfig = config
@@ -32,25 +72,43 @@ class State:
         self.climates = climates
         self.inactive_period = inactive_period
         self.is_initialized = False
+        self.health = health
+        self.evaluation_log = evaluation_log
+        self.publish_mode = publish_mode  # flat / per_climate / both
+        self.lag = lag
 
         self.state: dict = {}
         self._current_temps: dict = {}  # {climate: current_temp}
-        run_delay = 0
-
-        self.hass.run_in(self.autoclimate_register_services, run_delay)
-
-        self.init_states()
-
-        self.hass.run_in(self.create_hass_stateobj, run_delay)
+        self._hvac_modes: dict = {}  # {climate: raw climate state}
+        self._lastons: dict = {}  # {climate: laston isoformat}
+        self._state_counts: Counter = Counter()  # {state: number of climates}
+        self._summary_state: Optional[str] = None
+        self._summary_lock = threading.Lock()
+        self._published_version = -1
+        self._published_summary: Optional[tuple] = None
+        self._published_climates: dict = {}  # {climate: (rec, laston)}
+        self.journal = TransitionJournal(journal_size)
+
+        self._mutations: queue.SimpleQueue = queue.SimpleQueue()
+        self._writer = threading.Lock()
+        empty = MappingProxyType({})
+        self.snapshot = StateSnapshot(0, empty, empty, empty, "", empty, empty)
 
         if self.use_temp_sensors:
-            self.hass.run_in(self.create_temp_sensors, run_delay)
+            self.temp_publisher = TempSensorPublisher(
+                hass, appname, config, temp_sensor_policy
+            )
 
-        self.hass.run_in(self.init_climate_listeners, run_delay)
+        self.init_states()
+        # The rest of startup is run by AutoClimate's startup stages
 
-        self.hass.run_in(self.get_and_publish_state, run_delay + 5)  # initialize
+    def start_polling(self, kwargs):
+        # Startup stage - after the first get_and_publish_state
+        interval = 60 * 60 * self.poll_frequency
         self.hass.run_every(
-            self.get_and_publish_state, "now", 60 * 60 * self.poll_frequency
+            self.get_and_publish_state,
+            self.hass.get_now() + dt.timedelta(seconds=interval),  # type: ignore
+            interval,
         )
 
     def create_hass_stateobj(self, kwargs):
@@ -82,6 +140,93 @@ class State:
                 "unoccupied": None,
                 "state_reason": None,
             }
+        self._state_counts = Counter({None: len(self.climates)})
+        self._publish_snapshot()
+
+    def submit(self, mutation: Callable, *args):
+        """
+        Queue a change to self.state. Whichever thread holds the writer lock
+        runs all queued changes, in order, then publishes one new snapshot.
+        """
+        self._mutations.put((mutation, args))
+        while not self._mutations.empty():
+            if not self._writer.acquire(blocking=False):
+                return  # The current writer will run it
+            try:
+                while True:
+                    try:
+                        mutation, args = self._mutations.get_nowait()
+                    except queue.Empty:
+                        break
+                    try:
+                        mutation(*args)
+                    except Exception as err:
+                        self.hass.error(f"Error updating state: {err}")
+                self._publish_snapshot()
+            finally:
+                self._writer.release()
+
+    def _publish_snapshot(self):
+        """Writer only. Keeps the current snapshot (and version) if nothing changed."""
+        current = self.snapshot
+        states = MappingProxyType(
+            {
+                climate: MappingProxyType(dict(rec))
+                for climate, rec in self.state.items()
+            }
+        )
+        temps = MappingProxyType(dict(self._current_temps))
+        hvac_modes = MappingProxyType(dict(self._hvac_modes))
+        lastons = MappingProxyType(dict(self._lastons))
+        if (states, temps, hvac_modes, lastons) == (
+            current.states,
+            current.temps,
+            current.hvac_modes,
+            current.lastons,
+        ):
+            return
+
+        self.snapshot = StateSnapshot(
+            version=current.version + 1,
+            states=states,
+            temps=temps,
+            counts=MappingProxyType(dict(self._state_counts)),
+            summary=self.autoclimate_overall_state,
+            hvac_modes=hvac_modes,
+            lastons=lastons,
+        )
+
+    def set_entity_state(
+        self,
+        entity: str,
+        new_state: Optional[str],
+        reason: Optional[str] = None,
+        trigger: Optional[str] = None,
+    ):
+        """
+        All changes to an entity's "state" go through here,
+        to keep the counts and the transition journal. Writer only.
+        """
+        old_state = self.state[entity]["state"]
+        if old_state == new_state:
+            return
+        self._state_counts[old_state] -= 1
+        self._state_counts[new_state] += 1
+        self.state[entity]["state"] = new_state
+        self.journal.append(
+            self.hass.get_now().timestamp(),  # type: ignore
+            entity,
+            old_state,
+            new_state,
+            reason,
+            trigger,
+        )
+
+    def set_laston(self, entity: str, laston: Optional[dt.datetime]):
+        """Laston pushes each climate's laston here, for the states service."""
+        value = laston.isoformat() if laston else None
+        if self.snapshot.lastons.get(entity) != value:
+            self.submit(self._lastons.__setitem__, entity, value)
 
     def init_climate_listeners(self, kwargs):
         for climate in self.climates:
@@ -89,51 +234,142 @@ class State:
                 self.get_and_publish_state, entity_id=climate, attribute="all"
             )
 
+    def unoccupied_sensor_name(self, entity):
+        return Occupancy.unoccupied_sensor_name_static(self.appname, entity)
+
     def sensor_name(self, entity):
         return f"sensor.{self.appname}_{climate_name(entity)}_temperature"
 
+    def climate_state_name(self, entity):
+        return f"app.{self.appname}_{climate_name(entity)}_state"
+
     def publish_state(
         self,
     ):
         """
-        This publishes the current state, as flat attributes,
-        to APP_STATE (eg: app.autoclimate_state)
+        This publishes the current state to APP_STATE (eg: app.autoclimate_state)
+            * flat - every climate, as flat attributes. Written every time.
+            * per_climate - just the summary and counts, written when they change.
+              The attributes are replaced, so flat attributes from an earlier
+              run don't linger. Each climate gets its own
+              app.{appname}_{climate}_state, written only when that climate changed.
+            * both
+        The app state writes happen under _summary_lock, so an older snapshot
+        can't overwrite a newer one.
         """
-
-        data = {
-            f"{climate_name(entity)}_{key}": value
-            for (entity, rec) in self.state.items()
-            for (key, value) in rec.items()
-        }
+        snapshot = self.snapshot
         # app.autoclimate_state ==> autoclimate_state
-        data["summary_state"] = self.autoclimate_overall_state
+        summary_state = snapshot.summary
+        if self.publish_mode == "per_climate":
+            data = {}
+        else:
+            data = self.flatten_states(snapshot.states)
+        data["summary_state"] = summary_state
+        for state in self.COUNTED_STATES:
+            data[f"n_{state}"] = snapshot.counts.get(state, 0)
 
-        self.hass.update_state(
-            self.app_state_name, state=self.autoclimate_overall_state, attributes=data
-        )
+        with self._summary_lock:
+            if snapshot.version < self._published_version:
+                return  # Another thread already published something newer
+            self._published_version = snapshot.version
 
-        if self.use_temp_sensors:
-            for climate, current_temp in self._current_temps.items():
-                sensor_name = self.sensor_name(climate)
+            if self.publish_mode != "per_climate":
                 self.hass.update_state(
-                    sensor_name,
-                    state=(current_temp if not math.isnan(current_temp) else None),
+                    self.app_state_name, state=summary_state, attributes=data
                 )
+            elif data != self._published_summary:
+                self._published_summary = data
+                self.hass.set_state(
+                    self.app_state_name,
+                    state=summary_state,
+                    attributes={
+                        **data,
+                        "friendly_name": f"{self.appname} State",
+                    },
+                    replace=True,
+                )
+
+            if self.publish_mode != "flat":
+                self.publish_climate_states(snapshot)
+
+            previous = self._summary_state
+            self._summary_state = summary_state
+        if summary_state != previous:
+            self.hass.fire_event(
+                self.summary_event_name(),
+                summary_state=summary_state,
+                previous=previous,
+            )
+
+        if self.use_temp_sensors:
+            for climate, current_temp in snapshot.temps.items():
+                value = TempSensorPublisher.sensor_value(current_temp)
+                if self.temp_publisher.should_write(climate, value):
+                    self.hass.update_state(self.sensor_name(climate), state=value)
 
         # self.log(
         #     f"DEBUG LOGGING\nPublished State\n============\n{json.dumps(data, indent=2)}"
         # )
 
+    def publish_climate_states(self, snapshot: StateSnapshot):
+        """
+        app.{appname}_{climate}_state, for the climates that changed.
+        Caller holds _summary_lock.
+        """
+        for climate, rec in snapshot.states.items():
+            published = (rec, snapshot.lastons.get(climate))
+            if self._published_climates.get(climate) == published:
+                continue
+            self._published_climates[climate] = published
+            self.hass.update_state(
+                self.climate_state_name(climate),
+                state=snapshot.states[climate]["state"],
+                attributes={
+                    **snapshot.states[climate],
+                    "laston": snapshot.lastons.get(climate),
+                    "friendly_name": f"{climate_name(climate)} State",
+                },
+            )
+
+    @staticmethod
+    def flatten_states(states: Mapping[str, Mapping]) -> dict:
+        """{climate: {key: value}} ==> {climatename_key: value}"""
+        return {
+            f"{climate_name(entity)}_{key}": value
+            for (entity, rec) in states.items()
+            for (key, value) in rec.items()
+        }
+
+    def summary_event_name(self) -> str:
+        return f"app.{self.appname}_summary_changed"
+
+    @profiled
     def get_and_publish_state(self, *args, **kwargs):
         mock_data = kwargs.get("mock_data")
-        self.get_all_entities_state(mock_data=mock_data)  # Update state copy
+        # listen_state callback: (entity, attribute, old, new, kwargs). Else scheduled.
+        trigger = args[0] if args and isinstance(args[0], str) else "poll"
+        new = args[3] if len(args) > 3 and isinstance(args[3], dict) else None
+        if self.lag:
+            handle, shedding = self.lag.should_evaluate("state", new)
+            if not handle:
+                return  # Shedding - an evaluation since this event read it
+            if shedding:
+                new = None  # Read it - its later events are dropped
+        # Update state copy
+        self.get_all_entities_state(
+            mock_data=mock_data, trigger=trigger, event_state=new
+        )
 
         self.publish_state()
 
     def get_entity_state(
-        self, entity: str, mock_data: Optional[dict] = None
+        self,
+        entity: str,
+        mock_data: Optional[dict] = None,
+        state_obj: Optional[dict] = None,
     ) -> Tuple[str, str, float]:
-        state_obj: dict = self.hass.get_state(entity, attribute="all")  # type: ignore
+        if state_obj is None:
+            state_obj = self.hass.get_state(entity, attribute="all")  # type: ignore
         return self.offstate(
             entity,
             state_obj,
@@ -144,62 +380,148 @@ class State:
             self.inactive_period,
         )
 
-    def get_all_entities_state(self, *args, mock_data: Optional[dict] = None):
+    def should_read(self, entity: str, trigger: Optional[str]) -> bool:
+        """
+        Offline climates are only re-read on their own state events, or when
+        their backoff allows. They keep their last (offline) state meanwhile.
+        """
+        if self.health is None or entity == trigger:
+            return True
+        return self.health.attempt(entity)
+
+    def get_all_entities_state(
+        self,
+        *args,
+        mock_data: Optional[dict] = None,
+        trigger: Optional[str] = None,
+        fetched: Optional[Dict[str, tuple]] = None,
+        event_state: Optional[dict] = None,
+    ):
         """
         temp
             * value = valid setpoint
             * not found: offline
             * None = system is off
+
+        fetched - {climate: (stateobj, unoccupied_since)} already read (async path).
+            Climates not in it are skipped. If None, they are read here, one at a time.
+        event_state - the trigger climate's new state, from its event. Used
+            instead of reading it.
         """
+        updates = []
         for entity in self.climates:
+            if fetched is not None:
+                if entity not in fetched:
+                    continue
+                stateobj, unoccupied_since = fetched[entity]
+            else:
+                if not self.should_read(entity, trigger):
+                    continue
+                if entity == trigger and event_state is not None:
+                    stateobj = event_state
+                else:
+                    stateobj = self.hass.get_state(entity, attribute="all")
+                unoccupied_since = None
+            hvac_mode = stateobj.get("state") if stateobj else None
             summarized_state, state_reason, current_temp = self.get_entity_state(
-                entity, mock_data
+                entity, mock_data, stateobj
+            )
+            if self.health:
+                self.health.observe(entity, summarized_state != "offline")
+
+            #
+            # Occupancy
+            #
+            unoccupied = self.KEEP
+            if summarized_state == "offline":
+                unoccupied = "offline"
+            else:
+                try:
+                    last_on_date = (
+                        unoccupied_since
+                        if fetched is not None
+                        else self.hass.get_state(self.unoccupied_sensor_name(entity))
+                    )
+                    if last_on_date == Occupancy.UNOCCUPIED_SINCE_OCCUPIED_VALUE:
+                        unoccupied = False
+                    elif last_on_date in [None, "off"]:
+                        unoccupied = None
+                    else:
+                        unoccupied = Occupancy.duration_off_static(
+                            self.hass, last_on_date
+                        )
+                except Exception as err:
+                    self.hass.error(
+                        f"Error getting occupancy for {entity}. Err: {err}."
+                    )
+            updates.append(
+                (
+                    entity,
+                    summarized_state,
+                    state_reason,
+                    current_temp,
+                    unoccupied,
+                    hvac_mode,
+                )
             )
 
+        self.submit(self.apply_entity_states, updates, trigger)
+
+    def apply_entity_states(self, updates: list, trigger: Optional[str]):
+        """
+        Writer only. See submit()
+        trigger - the climate whose event this is, or "poll". Every climate is
+            evaluated, so the others' transitions are journaled as "reevaluation".
+        """
+        for (
+            entity,
+            summarized_state,
+            state_reason,
+            current_temp,
+            unoccupied,
+            hvac_mode,
+        ) in updates:
             #
             # Current_temp
             #
             self._current_temps[entity] = current_temp
+            self._hvac_modes[entity] = hvac_mode
 
             #
             # Offline
             #
-            if summarized_state == "offline":
-                self.state[entity] = {
-                    "offline": True,
-                    "state": "offline",
-                    "unoccupied": "offline",
-                }
-                continue
-            else:
-                self.state[entity]["offline"] = False
+            self.state[entity]["offline"] = summarized_state == "offline"
 
             #
             # State
             #
-            self.state[entity]["state"] = summarized_state
+            self.set_entity_state(
+                entity,
+                summarized_state,
+                state_reason,
+                trigger if trigger in (entity, "poll", None) else "reevaluation",
+            )
             self.state[entity]["state_reason"] = state_reason
 
             #
             # Occupancy
             #
-            if not self.state[entity]["offline"]:
-                try:
-                    last_on_date = self.hass.get_state(
-                        Occupancy.unoccupied_sensor_name_static(self.appname, entity)
-                    )
-                    if last_on_date == Occupancy.UNOCCUPIED_SINCE_OCCUPIED_VALUE:
-                        self.state[entity]["unoccupied"] = False
-                    elif last_on_date in [None, "off"]:
-                        self.state[entity]["unoccupied"] = None
-                    else:
-                        self.state[entity]["unoccupied"] = (
-                            Occupancy.duration_off_static(self.hass, last_on_date)
-                        )
-                except Exception as err:
-                    self.hass.error(
-                        f"Error getting occupancy for {entity}. Err: {err}."
+            if unoccupied is not self.KEEP:
+                self.state[entity]["unoccupied"] = unoccupied
+
+        if self.evaluation_log:
+            self.evaluation_log.append(
+                [
+                    (
+                        entity,
+                        self.state[entity]["state"],
+                        self._current_temps[entity],
+                        self.state[entity]["unoccupied"],
                     )
+                    for entity, *_ in updates
+                ]
+            )
+
         if not self.is_initialized:
             self.is_initialized = True
             self.hass.log("State is initialized. All values are now available.")
@@ -212,17 +534,20 @@ class State:
             * offline - not on and any offline
             * error - any "error_off" - meaning any are off but should not be
             * off - all properly off, confirmed.
+
+        O(1) - uses the counts kept by set_entity_state()
         """
-        substates = {entity["state"] for entity in self.state.values()}
-        if "on" in substates:
+        counts = self._state_counts
+        if counts["on"]:
             return "on"
-        elif "offline" in substates:
+        elif counts["offline"]:
             return "offline"
-        elif "error_off" in substates:
+        elif counts["error_off"]:
             return "error"
-        elif {"off"} == substates:
+        elif counts["off"] == len(self.state):
             return "off"
         else:
+            substates = {state for state, count in counts.items() if count}
             self.hass.log(f"Unexpected overall state found: {substates}")
             return "programming_error"
 
@@ -334,37 +659,84 @@ class State:
         return "none", "error - should not be here", current_temp
 
     def is_offline(self, namespace, domain, service, kwargs) -> bool:
-        return self.state[kwargs["climate"]]["offline"]
+        return self.snapshot.states[kwargs["climate"]]["offline"]
 
     def is_on(self, namespace, domain, service, kwargs) -> bool:
-        return self.state[kwargs["climate"]]["state"] == "on"
+        return self.snapshot.states[kwargs["climate"]]["state"] == "on"
 
     def is_off(self, namespace, domain, service, kwargs) -> bool:
-        return self.state[kwargs["climate"]]["state"] == "off"
+        return self.snapshot.states[kwargs["climate"]]["state"] == "off"
 
     def entity_state(self, namespace, domain, service, kwargs) -> Optional[str]:
         if not self.is_initialized:
             self.hass.warn("State is not initialized yet. All values will be None")
-            return self.state[kwargs["climate"]]["state"]
+            return self.snapshot.states[kwargs["climate"]]["state"]
         # import json
 
         # self.hass.log(
         #     f"entity_state: kwargs: {kwargs}, self.state: \n{json.dumps(self.state, indent=4)}"
         # )
         # self.hass.log(
-        #     f">>DEBUG: entity_state: {kwargs['climate']} = {self.state[kwargs['climate']]['state']}"
+        #     f">>DEBUG: entity_state: {kwargs['climate']} = {self.snapshot.states[kwargs['climate']]['state']}"
         # )
-        return self.state[kwargs["climate"]]["state"]
+        return self.snapshot.states[kwargs["climate"]]["state"]
 
     def is_hardoff(self, namespace, domain, service, kwargs) -> bool:
-        state = self.hass.get_state(entity_id=kwargs["climate"])
-        return state == "off"
+        # As of the last evaluation - every climate state change triggers one
+        return self.snapshot.hvac_modes.get(kwargs["climate"]) == "off"
 
     def is_error_off(self, namespace, domain, service, kwargs) -> bool:
-        return self.state[kwargs["climate"]]["state"] == "error_off"
+        return self.snapshot.states[kwargs["climate"]]["state"] == "error_off"
 
     def is_error(self, namespace, domain, service, kwargs) -> bool:
-        return self.state[kwargs["climate"]]["state"] == "error"
+        return self.snapshot.states[kwargs["climate"]]["state"] == "error"
+
+    def states(self, namespace, domain, service, kwargs) -> dict:
+        """
+        Every climate, from one snapshot.
+        kwargs (optional):
+            if_version: version from a previous call. If nothing has changed since,
+                returns just {"version": if_version, "unchanged": True}
+        """
+        snapshot = self.snapshot
+        if_version = kwargs.get("if_version")
+        if if_version is not None and int(if_version) == snapshot.version:
+            return {"version": snapshot.version, "unchanged": True}
+        return {"unchanged": False, **self.snapshot_as_dict(snapshot)}
+
+    @staticmethod
+    def snapshot_as_dict(snapshot: StateSnapshot) -> dict:
+        """JSON ready. Used by the states service and SnapshotEndpoint."""
+        climates = {}
+        for climate, rec in snapshot.states.items():
+            temp = snapshot.temps.get(climate)
+            climates[climate] = {
+                **rec,
+                "temperature": None if temp is None or math.isnan(temp) else temp,
+                "laston": snapshot.lastons.get(climate),
+                "hvac_mode": snapshot.hvac_modes.get(climate),
+            }
+        return {
+            "version": snapshot.version,
+            "summary_state": snapshot.summary,
+            "climates": climates,
+        }
+
+    def transitions(self, namespace, domain, service, kwargs) -> list:
+        """
+        kwargs (all optional):
+            climate: climate entity
+            start, end: datetime, isoformat string, or epoch seconds
+        """
+        tzinfo = self.hass.get_now().tzinfo  # type: ignore
+        return [
+            TransitionJournal.as_dict(record, tzinfo)
+            for record in self.journal.query(
+                start=kwargs.get("start"),
+                end=kwargs.get("end"),
+                climate=kwargs.get("climate"),
+            )
+        ]
 
     def autoclimate_register_services(self, kwargs: dict):
         callbacks = [
@@ -375,6 +747,8 @@ class State:
             self.is_hardoff,
             self.is_error_off,
             self.is_error,
+            self.states,
+            self.transitions,
         ]
         for callback in callbacks:
             service_name = f"autoclimate/{callback.__name__}"
@@ -0,0 +1,137 @@
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+from _autoclimate.utils import climate_name
+from adplus import Hass
+
+"""
+TempSensorPublisher - decides when sensor.{appname}_{climate}_temperature is
+worth writing. Every write is a recorder row, and State evaluates on every
+climate event.
+
+Policy (global temp_sensor_policy, overridden per entity_rules entry):
+* deadband - write only if the temperature moved more than this (degrees)
+  from the last written value.
+* min_interval - seconds. Never write more often than this.
+* heartbeat - seconds. Write anyway if nothing was written for this long,
+  so slow drift inside the deadband still shows up. 0 = never.
+
+Going offline / coming back (None <-> a value) is always written.
+All checks happen at an evaluation - nothing is written between them.
+
+Write-reduction stats are published to sensor.{appname}_temp_sensor_writes
+"""
+
+
+class SensorPolicy:
+    DEFAULTS = {"deadband": 0.0, "min_interval": 0, "heartbeat": 3600}
+
+    def __init__(self, deadband: float, min_interval: float, heartbeat: float):
+        self.deadband = deadband
+        self.min_interval = min_interval
+        self.heartbeat = heartbeat
+
+    @classmethod
+    def from_config(
+        cls, global_config: Optional[dict], entity_config: Optional[dict]
+    ) -> "SensorPolicy":
+        values = dict(cls.DEFAULTS)
+        values.update(global_config or {})
+        values.update(entity_config or {})
+        return cls(**values)
+
+
+class TempSensorPublisher:
+    STATS_INTERVAL = 15 * 60
+
+    def __init__(
+        self,
+        hass: Hass,
+        appname: str,
+        config: dict,
+        policy: Optional[dict],
+    ):
+        """
+        config - entity_rules
+        policy - global temp_sensor_policy
+        """
+        self.hass = hass
+        self.appname = appname
+        self.sensor_name = f"sensor.{self.appname}_temp_sensor_writes"
+        self.policies: Dict[str, SensorPolicy] = {
+            climate: SensorPolicy.from_config(policy, rule.get("temp_sensor_policy"))
+            for climate, rule in config.items()
+        }
+
+        self._lock = threading.Lock()
+        self._last: Dict[str, tuple] = {}  # {climate: (value, monotonic time)}
+        self.stats = {
+            "evaluated": 0,
+            "written": 0,
+            "heartbeats": 0,
+            "suppressed_deadband": 0,
+            "suppressed_interval": 0,
+        }
+        self.by_climate: Dict[str, Dict[str, int]] = {
+            climate: {"evaluated": 0, "written": 0} for climate in config
+        }
+
+        self.hass.run_every(self.publish_stats, "now", self.STATS_INTERVAL)
+
+    def should_write(self, climate: str, value: Optional[float]) -> bool:
+        """value - None if offline. Records the write if it returns True."""
+        policy = self.policies[climate]
+        now = time.monotonic()
+        with self._lock:
+            self.stats["evaluated"] += 1
+            self.by_climate[climate]["evaluated"] += 1
+
+            last = self._last.get(climate)
+            if last is None or (value is None) != (last[0] is None):
+                write = True
+            else:
+                last_value, written_at = last
+                elapsed = now - written_at
+                if policy.heartbeat and elapsed >= policy.heartbeat:
+                    write = True
+                    self.stats["heartbeats"] += 1
+                elif elapsed < policy.min_interval:
+                    write = False
+                    self.stats["suppressed_interval"] += 1
+                elif value is None or abs(value - last_value) <= policy.deadband:
+                    write = False
+                    self.stats["suppressed_deadband"] += 1
+                else:
+                    write = True
+
+            if write:
+                self._last[climate] = (value, now)
+                self.stats["written"] += 1
+                self.by_climate[climate]["written"] += 1
+            return write
+
+    @staticmethod
+    def reduction(evaluated: int, written: int) -> float:
+        """Percent of evaluations that did not write"""
+        return round(100 * (1 - written / evaluated), 1) if evaluated else 0.0
+
+    def publish_stats(self, kwargs):
+        with self._lock:
+            attributes = dict(self.stats)
+            for climate, counts in self.by_climate.items():
+                attributes[f"{climate_name(climate)}_reduction"] = self.reduction(
+                    counts["evaluated"], counts["written"]
+                )
+            reduction = self.reduction(self.stats["evaluated"], self.stats["written"])
+        attributes["unit_of_measurement"] = "%"
+        attributes["friendly_name"] = f"{self.appname} Temp Sensor Write Reduction"
+        self.hass.update_state(self.sensor_name, state=reduction, attributes=attributes)
+
+    @staticmethod
+    def sensor_value(current_temp: Optional[float]) -> Optional[float]:
+        """None for offline (current_temp missing or NaN)"""
+        if current_temp is None or math.isnan(current_temp):
+            return None
+        return current_temp
@@ -1,20 +1,32 @@
 # pyright: reportUnusedCoroutine=false
 
 import datetime as dt
+import hashlib
 import json  # noqa
-from typing import Optional, Union
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Mapping, Optional, Tuple, Union
 
 import adplus
 import pytz
 from adplus import Hass
 
 adplus.importlib.reload(adplus)
+from _autoclimate.commands import CommandQueue
+from _autoclimate.confirm import Confirmations
+from _autoclimate.dispatch import Dispatcher
+from _autoclimate.health import HealthTracker
 from _autoclimate.laston import Laston
+from _autoclimate.profiler import profiled
 from _autoclimate.schema import SCHEMA
+from _autoclimate.state import StateSnapshot
 from _autoclimate.utils import in_inactive_period
 
 
 class TurnOff:
+    REQUEST_ID_TTL = 10 * 60
+
     def __init__(
         self,
         hass: Hass,
@@ -24,8 +36,13 @@ class TurnOff:
         appname: str,
         climates: list,
         test_mode: bool,
-        climate_state: dict,
+        state_snapshot: Callable[[], StateSnapshot],
+        commands: CommandQueue,
+        confirmations: Confirmations,
+        health: HealthTracker,
         turn_on_error_off=False,
+        dedupe_seconds: float = 5,
+        direct_events: bool = True,
     ):
         self.hass = hass
         self.aconfig = config
@@ -35,22 +52,36 @@ class TurnOff:
         self.app_state_name = f"app.{self.appname}_state"
         self.test_mode = test_mode
         self.climates = climates
-        self.climate_state = climate_state
+        self.state_snapshot = state_snapshot
+        self.commands = commands
+        self.confirmations = confirmations
+        self.health = health
         self.turn_on_error_off = turn_on_error_off
+        self.dedupe_seconds = dedupe_seconds
+
+        self._dedupe_lock = threading.Lock()
+        self._recent: Dict[tuple, float] = {}  # {(event, climate, config hash): t}
+        self._request_ids: Dict[str, float] = {}  # {request_id: t}
 
         self.state: dict = {}
         self._current_temps: dict = {}  # {climate: current_temp}
 
-        self.init_listeners()
+        if direct_events:
+            self.init_listeners()
 
         if not self.any_autooff():
             self.hass.log("autooff: Not configured. Will not run.")
-        else:
+
+    def start_autooff(self, kwargs):
+        # Startup stage - needs State and the laston sensors
+        if self.any_autooff():
             self.hass.run_every(
                 self.autooff_scheduled_cb, "now", self.poll_frequency * 60 * 60
             )
 
     def init_listeners(self):
+        # The documented events, by name (direct_events: true, the default).
+        # The same handlers also come through the dispatcher (register_sub_events).
         self.hass.listen_event(self.cb_turn_off_all, event=self.event_all_off_name())
         self.hass.log(f"Listening to event: {self.event_all_off_name()}")
         self.hass.listen_event(
@@ -58,6 +89,23 @@ class TurnOff:
         )
         self.hass.log(f"Listening to event: {self.event_entity_off_name()}")
 
+    def register_sub_events(self, dispatcher: Dispatcher):
+        """The same two events, as sub_events of the "autoclimate" event"""
+        common = {
+            "config": {"type": "dict", "nullable": True},
+            "test_mode": {"type": "boolean", "nullable": True},
+            "request_id": {"type": ["string", "integer"], "nullable": True},
+        }
+        dispatcher.register(self.event_all_off_name(), self.cb_turn_off_all, common)
+        dispatcher.register(
+            self.event_entity_off_name(),
+            self.cb_turn_off_climate,
+            {
+                **common,
+                "climate": {"type": "string", "required": True},
+            },
+        )
+
     def event_all_off_name(self) -> str:
         return f"app.{self.appname}_turn_off_all"
 
@@ -65,7 +113,12 @@ class TurnOff:
         return f"app.{self.appname}_turn_off_climate"
 
     def turn_off_climate(
-        self, climate: str, config: dict = None, test_mode: bool = False
+        self,
+        climate: str,
+        config: dict = None,
+        test_mode: bool = False,
+        stateobj: Optional[dict] = None,
+        drain: bool = True,
     ) -> None:
         """
         Turn "off" a climate climate, where "off" is defined by an off rule such as:
@@ -73,6 +126,10 @@ class TurnOff:
             off_state: "away"
             off_temp:  55
         config - if given, will use from self.aconfig. If passed, will use passed config
+        stateobj - climate's current state, if already read. For an offline climate
+            (per HealthTracker) it is only read when its backoff allows.
+        drain - False to queue the commands only, so several climates can be
+            sent as one batch with self.commands.drain()
         """
         if config is None:
             config = self.aconfig[climate]
@@ -87,24 +144,47 @@ class TurnOff:
                 )
                 return
 
-        stateobj: dict = self.hass.get_state(climate, attribute="all")  # type: ignore
-        attributes = stateobj["attributes"]
+        if stateobj is None:
+            if not self.health.attempt(climate):
+                self.log_offline(climate)
+                return
+            stateobj = self.hass.get_state(climate, attribute="all")  # type: ignore
+        attributes = stateobj["attributes"]  # type: ignore
 
         if "temperature" not in attributes:
+            self.health.observe(climate, False)
             self.hass.log(f"{climate} - Offline. Can not turn off.")
             return
+        self.health.observe(climate, True)
 
         if not config:
             self.hass.error(f"No off_rule for climate: {climate}. Can not turn off.")
             return
 
+        calls = self.off_calls(config)
+        if calls is None:
+            self.hass.error(f"Programming error. Unexpected off_rule: {config}")
+            return
+
+        if not test_mode:
+            if self.commands.submit(climate, "off", calls, drain=drain):
+                self.confirmations.expect(climate, config, calls, stateobj)
+        self.hass.lb_log(f"{climate} - Turn off ({config['off_state']['state']})")
+
+    def log_offline(self, climate: str):
+        self.hass.log(
+            f"{climate} - Offline. Can not turn off. Next try in {self.health.next_attempt_in(climate):.0f}s."
+        )
+
+    @staticmethod
+    def off_calls(config: dict) -> Optional[list]:
+        """
+        Service calls, in order, to put a climate in its off_state.
+        Returns None for an unexpected off_rule.
+        """
         # Set to "off"
         if config["off_state"]["state"] == "off":
-            if not test_mode:
-                self.hass.call_service(
-                    "climate/turn_off", entity_id=climate
-                )
-            self.hass.lb_log(f"{climate} - Turn off")
+            return [("climate/turn_off", {})]
 
         # Set to "away"
         #
@@ -114,52 +194,130 @@ class TurnOff:
         # "away" is the ecobee preset, which will change based on the "hold behavior"
         #       setting. And if that setting is "choose at time", it will actually change at the next scheduled time!
         elif config["off_state"]["state"] == "away":
-            if not test_mode:
-                self.hass.call_service(
-                    "climate/set_preset_mode",
-                    entity_id=climate,
-                    preset_mode="away_indefinitely",
-                )
-            self.hass.lb_log(f"{climate} -  Set away mode")
+            return [
+                ("climate/set_preset_mode", {"preset_mode": "away_indefinitely"}),
+            ]
 
         # Set to "perm_hold"
         elif config["off_state"]["state"] == "perm_hold":
-            if not test_mode:
-                self.hass.call_service(
+            return [
+                (
                     "climate/set_temperature",
-                    entity_id=climate,
-                    temperature=config["off_state"]["temp"],
-                )
-                self.hass.call_service(
-                    "climate/set_preset_mode",
-                    entity_id=climate,
-                    preset_mode="Permanent Hold",
-                )
-            self.hass.log(
-                f"{climate} - Set Perm Hold to {config['off_state']['temp']}. "
-            )
+                    {"temperature": config["off_state"]["temp"]},
+                ),
+                ("climate/set_preset_mode", {"preset_mode": "Permanent Hold"}),
+            ]
 
         # Invalid config
-        else:
-            self.hass.error(f"Programming error. Unexpected off_rule: {config}")
+        return None
 
+    @profiled
     def cb_turn_off_climate(self, event_name, data, kwargs):
         """
         kwargs:
             entity: climate_string
             config: OFF_SCHEMA (see above)
             test_mode: bool (optional)
+            request_id: str (optional) - see dedupe()
         """
         climate = data["climate"]
+        if not self.dedupe(event_name, data, [climate]):
+            return
         config = data.get("config")
         test_mode = data.get("test_mode")
         return self.turn_off_climate(climate, config=config, test_mode=test_mode)
 
+    @profiled
     def cb_turn_off_all(self, event_name, data, kwargs):
+        self.turn_off_all(data, climates=self.dedupe(event_name, data, self.climates))
+
+    @staticmethod
+    def request_config(data: dict, climate: str) -> Optional[dict]:
+        """The passed-in config for climate, if any"""
+        if "climate" in data:
+            return data.get("config")
+        return data["config"].get(climate, {}) if "config" in data else None
+
+    def dedupe(self, event_name: str, data: dict, climates: List[str]) -> List[str]:
+        """
+        Returns the climates in this turn off request that are not duplicates.
+
+        A duplicate (double tap, retried script, automations firing together) is
+        * a request_id already seen, or
+        * the same (event, climate, config, test_mode) within dedupe_seconds.
+        Duplicates are logged and counted as coalesced, not executed.
+        """
+        request_id = str(data.get("request_id") or uuid.uuid4().hex[:8])
+        now = time.monotonic()
+        fresh, duplicates = [], []
+        with self._dedupe_lock:
+            self._prune(now)
+            if request_id in self._request_ids:
+                duplicates = list(climates)
+            else:
+                self._request_ids[request_id] = now
+                for climate in climates:
+                    key = (event_name, climate, self.config_hash(data, climate))
+                    if key in self._recent:  # Pruned, so within dedupe_seconds
+                        duplicates.append(climate)
+                    else:
+                        self._recent[key] = now
+                        fresh.append(climate)
+
+        if duplicates:
+            self.commands.coalesced_request(len(duplicates))
+            self.hass.log(
+                f"Turn off request {request_id} ({event_name}) - duplicate for {duplicates}. Coalesced."
+            )
+        if fresh:
+            self.hass.debug(f"Turn off request {request_id} ({event_name}) - {fresh}")
+        return fresh
+
+    def config_hash(self, data: dict, climate: str) -> str:
+        material = [self.request_config(data, climate), bool(data.get("test_mode"))]
+        return hashlib.sha1(
+            json.dumps(material, sort_keys=True, default=str).encode()
+        ).hexdigest()[:12]
+
+    def _prune(self, now: float):
+        """Lock held. request_ids are kept longer, to catch late retries."""
+        for key, seen in list(self._recent.items()):
+            if now - seen >= self.dedupe_seconds:
+                del self._recent[key]
+        for request_id, seen in list(self._request_ids.items()):
+            if now - seen >= self.REQUEST_ID_TTL:
+                del self._request_ids[request_id]
+
+    def turn_off_all(
+        self,
+        data: dict,
+        stateobjs: Optional[dict] = None,
+        climates: Optional[List[str]] = None,
+    ):
+        """
+        stateobjs - {climate: stateobj} already read (async path).
+            Climates not in it are offline and skipped.
+        climates - the climates to turn off (default: all)
+        """
         test_mode = data.get("test_mode")
-        for climate in self.climates:
-            config = data["config"].get(climate, {}) if "config" in data else None
-            self.turn_off_climate(climate, config=config, test_mode=test_mode)
+        for climate in climates if climates is not None else self.climates:
+            if stateobjs is not None and climate not in stateobjs:
+                self.log_offline(climate)
+                continue
+            config = self.request_config(data, climate)
+            self.turn_off_climate(
+                climate,
+                config=config,
+                test_mode=test_mode,
+                stateobj=stateobjs.get(climate) if stateobjs is not None else None,
+                drain=False,
+            )
+        self.commands.drain()
+
+    @property
+    def climate_state(self) -> Mapping[str, Mapping]:
+        """{climate: state record} - from the latest State snapshot"""
+        return self.state_snapshot().states
 
     def any_autooff(self):
         for climate in self.climates:
@@ -167,14 +325,23 @@ class TurnOff:
                 return True
         return False
 
+    @profiled
     def autooff_scheduled_cb(self, kwargs):
         """
         Turn off any thermostats that have been on too long.
         """
+        self.run_autooff()
+
+    def run_autooff(self, lastons: Optional[dict] = None):
+        """
+        lastons - {climate: laston sensor state} already read (async path).
+            If None, they are read as needed.
+        """
         if in_inactive_period(self.hass, self.inactive_period):
             return
 
-        for climate, state in self.climate_state.items():
+        climate_state = self.climate_state  # One consistent snapshot for this run
+        for climate, state in climate_state.items():
             self.hass.debug(f'autooff: {climate} - {state["state"]}')
 
             config = self.aconfig.get(climate)
@@ -192,47 +359,90 @@ class TurnOff:
                     f"{climate} is off but should not be! Attempting to turn on."
                 )
                 if not self.test_mode:
-                    self.hass.call_service(
-                        "climate/turn_on", entity_id=climate
+                    self.commands.submit(
+                        climate, "on", [("climate/turn_on", {})], drain=False
                     )
                 self.hass.lb_log(f"{climate} - Turned thermostat on.")
 
-            hours_unoccupied = self.climate_state[climate]["unoccupied"]
-
-            if hours_unoccupied is None:
-                self.hass.warn(
-                    f"Programming error - hours_unoccupied None for {climate}"
-                )
-            elif hours_unoccupied < 0:
-                self.hass.warn(
-                    f"Programming error - Negative duration off for {climate}: {hours_unoccupied}"
-                )
-            elif hours_unoccupied == 0:
-                # Currently off
-                pass
-            elif hours_unoccupied > config["auto_off_hours"] or self.test_mode:
-                # Maybe turn off?
-
-                # First check to see if someone turned it on since last off.
-                laston_sensor = Laston.laston_sensor_name_static(self.appname, climate)
-                laston_date = self.hass.get_state(laston_sensor)
-                if self.hours_since_laston(laston_date) < hours_unoccupied:
-                    self.hass.log(
-                        f"Autooff - NOT turning off {climate}. hours_unoccupied: {hours_unoccupied}. But last turned on: {laston_date}"
-                    )
-                    continue
+            hours_unoccupied = climate_state[climate]["unoccupied"]
+            laston_sensor = Laston.laston_sensor_name_static(self.appname, climate)
+            if lastons is None:
+                get_laston = lambda: self.hass.get_state(laston_sensor)
+            else:
+                get_laston = lambda: lastons.get(climate)  # type: ignore
+            decision, message = self.autooff_decision(
+                self.hass,
+                climate,
+                config,
+                hours_unoccupied,
+                get_laston=get_laston,
+                force=self.test_mode,
+            )
+            if decision == "error":
+                self.hass.warn(message)
+            elif message:
+                self.hass.log(message)
 
+            if decision == "off":
                 # Turn off
                 self.hass.lb_log(f"Autooff - Turning off {climate}")
                 if not self.test_mode:
-                    self.turn_off_climate(climate)
+                    self.turn_off_climate(climate, drain=False)
+
+        if self.commands.depth:
+            self.commands.drain()  # One batch per zone
+
+    @staticmethod
+    def autooff_decision(
+        hass: Hass,
+        climate: str,
+        config: dict,
+        hours_unoccupied: Optional[float],
+        get_laston: Callable[[], Union[None, str, dt.datetime]],
+        force: bool = False,
+    ) -> Tuple[str, Optional[str]]:
+        """
+        Should an "on" climate be turned off now?
+        Returns: (decision, message)
+            decision: "off" / "keep" / "error"
+        get_laston - returns the laston date. Only called if needed.
+        force - ignore auto_off_hours (test_mode)
+        """
+        if hours_unoccupied is None:
+            return "error", f"Programming error - hours_unoccupied None for {climate}"
+        elif hours_unoccupied < 0:
+            return (
+                "error",
+                f"Programming error - Negative duration off for {climate}: {hours_unoccupied}",
+            )
+        elif hours_unoccupied == 0:
+            # Currently occupied
+            return "keep", None
+        elif hours_unoccupied > config["auto_off_hours"] or force:
+            # Maybe turn off?
+
+            # First check to see if someone turned it on since last off.
+            laston_date = get_laston()
+            if TurnOff.hours_since_laston_static(hass, laston_date) < hours_unoccupied:
+                return (
+                    "keep",
+                    f"Autooff - NOT turning off {climate}. hours_unoccupied: {hours_unoccupied}. But last turned on: {laston_date}",
+                )
+            return "off", None
+        return "keep", None
 
     def hours_since_laston(self, laston_date: Union[str, dt.datetime]) -> float:
+        return self.hours_since_laston_static(self.hass, laston_date)
+
+    @staticmethod
+    def hours_since_laston_static(
+        hass: Hass, laston_date: Union[None, str, dt.datetime]
+    ) -> float:
         if laston_date in [None, "None"]:
             laston_date = dt.datetime(
-                dt.MINYEAR, 1, 1, tzinfo=pytz.timezone(str(self.hass.get_timezone()))
+                dt.MINYEAR, 1, 1, tzinfo=pytz.timezone(str(hass.get_timezone()))
             )
         elif isinstance(laston_date, str):
             laston_date = dt.datetime.fromisoformat(laston_date)
-        now = self.hass.get_now()
+        now = hass.get_now()
         return (now - laston_date).total_seconds() / (60 * 60)  # type: ignore
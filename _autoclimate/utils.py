@@ -1,4 +1,5 @@
 import datetime as dt
+import re
 
 import pytz
 from adplus import Hass
@@ -24,3 +25,23 @@ def in_inactive_period(hass: Hass, inactive_period) -> bool:
     except Exception as err:
         hass.log(f"Error testing inactive period. err: {err}, ip: {ip}")
         return False
+
+
+def parse_inactive_period(text: str) -> tuple:
+    """
+    "mm/dd - mm/dd" ==> ((m, d), (m, d))
+    Raises ValueError if invalid.
+    """
+    match = re.match(r"(\d?\d)/(\d?\d)\s*-\s*(\d?\d)/(\d?\d)", text)
+    if not match:
+        raise ValueError(f"Can not parse inactive_period ({text})")
+    start = (int(match.group(1)), int(match.group(2)))
+    end = (int(match.group(3)), int(match.group(4)))
+    if not (
+        1 <= start[0] <= 12
+        and 1 <= end[0] <= 12
+        and 1 <= start[1] <= 31
+        and 1 <= end[1] <= 31
+    ):
+        raise ValueError(f"Invalid day or month value in inactive_period ({text})")
+    return (start, end)
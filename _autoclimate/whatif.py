@@ -0,0 +1,300 @@
+import argparse
+import datetime as dt
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import adplus
+from adplus import Hass
+
+adplus.importlib.reload(adplus)
+from _autoclimate.history import RecorderHistory
+from _autoclimate.replay import ReplayHass, load_app_config, load_history
+from _autoclimate.schema import SCHEMA
+from _autoclimate.state import State
+
+try:
+    import numpy as np
+except ImportError:  # Optional - only needed for what-if analysis
+    np = None  # type: ignore
+
+"""
+WhatIf - sweep auto_off_hours over a grid, per climate, against history.
+
+For every unoccupied stretch that began while the climate was already on
+(so laston does not block it), autooff fires at unoccupied_start + hours,
+if the climate is still on and the place still empty. For each value:
+
+* saved_hours - heating hours between that turn off and when the heat
+  actually went off, or people came back (whichever was first).
+* wrongful - turn offs where people came back within `wrongful_within` hours.
+  A stretch still unoccupied at the end of the history never counts.
+
+All thresholds are computed at once with NumPy interval arithmetic.
+Ignores poll_frequency (turn offs happen exactly on the hour mark).
+
+    python -m _autoclimate.whatif --config apps.yaml --hours 1:72 \
+        climate_history.json occupancy_history.csv
+
+Also available as the autoclimate/whatif service.
+"""
+
+Intervals = Tuple["np.ndarray", "np.ndarray"]  # (starts, ends) epoch seconds
+# (starts, ends, closed) - closed: ended by an "on" record, not by the end of history
+Unoccupied = Tuple["np.ndarray", "np.ndarray", "np.ndarray"]
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("What-if analysis requires numpy: pip install numpy")
+
+
+def on_intervals(
+    climate: str, config: dict, records: Iterable[dict], hass, end: float
+) -> Intervals:
+    """When the climate was "on", by its off_state rule. Offline keeps the last state."""
+    starts, ends = [], []
+    on_since = None
+    for rec in records:
+        verdict = State.offstate(climate, rec, config, hass)[0]
+        when = _epoch(rec["last_updated"])
+        if verdict == "on" and on_since is None:
+            on_since = when
+        elif verdict in ["off", "error_off"] and on_since is not None:
+            starts.append(on_since)
+            ends.append(when)
+            on_since = None
+    if on_since is not None:
+        starts.append(on_since)
+        ends.append(end)
+    return np.array(starts, dtype=float), np.array(ends, dtype=float)
+
+
+def unoccupied_intervals(records: Iterable[dict], end: float) -> Unoccupied:
+    """Stretches where the occupancy sensor was not "on"."""
+    starts, ends, closed = [], [], []
+    empty_since = None
+    for rec in records:
+        when = _epoch(rec["last_updated"])
+        if rec["state"] == "on":
+            if empty_since is not None:
+                starts.append(empty_since)
+                ends.append(when)
+                closed.append(True)
+                empty_since = None
+        elif empty_since is None:
+            empty_since = when
+    if empty_since is not None:
+        starts.append(empty_since)
+        ends.append(end)
+        closed.append(False)  # Still empty - nobody came back
+    return (
+        np.array(starts, dtype=float),
+        np.array(ends, dtype=float),
+        np.array(closed, dtype=bool),
+    )
+
+
+def sweep(
+    on: Intervals,
+    unoccupied: Unoccupied,
+    hours: "np.ndarray",
+    wrongful_within: float = 2,
+) -> Dict[str, list]:
+    """
+    on, unoccupied - sorted, non-overlapping intervals (epoch seconds). See
+        unoccupied_intervals() for unoccupied's closed.
+    hours - auto_off_hours values to try
+    """
+    _require_numpy()
+    on_start, on_end = on
+    u_start, u_end, u_closed = unoccupied
+
+    if len(on_start) == 0 or len(u_start) == 0:
+        zeros = [0] * len(hours)
+        return {
+            "hours": hours.tolist(),
+            "saved_hours": [0.0] * len(hours),
+            "turn_offs": zeros,
+            "wrongful": zeros,
+        }
+
+    # The "on" stretch, if any, that was running when each unoccupied stretch began
+    idx = np.searchsorted(on_start, u_start, side="right") - 1
+    running = (idx >= 0) & (on_end[np.maximum(idx, 0)] > u_start)
+    u_start = u_start[running]
+    u_end = u_end[running]
+    u_closed = u_closed[running]
+    heat_end = np.minimum(on_end[idx[running]], u_end)
+
+    # (thresholds x candidates)
+    trigger = u_start[None, :] + hours[:, None] * 3600
+    fires = trigger < heat_end[None, :]
+    saved = np.where(fires, heat_end[None, :] - trigger, 0).sum(axis=1) / 3600
+    came_back = u_closed[None, :] & (u_end[None, :] - trigger < wrongful_within * 3600)
+    wrongful = (fires & came_back).sum(axis=1)
+
+    return {
+        "hours": hours.tolist(),
+        "saved_hours": np.round(saved, 2).tolist(),
+        "turn_offs": fires.sum(axis=1).tolist(),
+        "wrongful": wrongful.tolist(),
+    }
+
+
+def analyze(
+    entity_rules: dict,
+    histories: Dict[str, List[dict]],
+    hours: "np.ndarray",
+    end: dt.datetime,
+    wrongful_within: float = 2,
+    hass=None,
+) -> Dict[str, dict]:
+    """
+    histories - {entity_id: records in chronological order}, climates and occupancy sensors
+    Returns {climate: sweep()}
+    """
+    _require_numpy()
+    hass = hass or ReplayHass()
+    end_ts = end.timestamp()
+    results = {}
+    for climate, config in entity_rules.items():
+        on = on_intervals(climate, config, histories.get(climate, []), hass, end_ts)
+        unoccupied = unoccupied_intervals(
+            histories.get(config["occupancy_sensor"], []), end_ts
+        )
+        results[climate] = sweep(on, unoccupied, hours, wrongful_within)
+    return results
+
+
+def _epoch(value) -> float:
+    if isinstance(value, str):
+        value = dt.datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def parse_hours(text: str) -> "np.ndarray":
+    """ "1:72" / "1:72:0.5" / "4,8,24" ==> array of hours"""
+    _require_numpy()
+    if ":" in text:
+        parts = [float(part) for part in text.split(":")]
+        step = parts[2] if len(parts) > 2 else 1
+        return np.arange(parts[0], parts[1] + step / 2, step)
+    return np.array([float(part) for part in text.split(",")])
+
+
+class WhatIf:
+    """autoclimate/whatif service - sweep over the last `days` of history."""
+
+    def __init__(
+        self,
+        hass: Hass,
+        config: dict,
+        appname: str,
+        history: RecorderHistory,
+    ):
+        self.hass = hass
+        self.aconfig = config
+        self.appname = appname
+        self.history = history
+
+    def register_services(self, kwargs):
+        service_name = "autoclimate/whatif"
+        self.hass.register_service(service_name, self.whatif, namespace="default")
+        self.hass.log(f"Registered service: {service_name}")
+
+    def whatif(self, namespace, domain, service, kwargs) -> Optional[dict]:
+        """
+        kwargs (all optional):
+            hours: "1:72" (default) / "1:72:0.5" / "4,8,24"
+            days: history to use (default 10)
+            wrongful_within: hours (default 2)
+            entity_rules: rules to test, in the entity_rules format. Default: configured rules.
+        """
+        if np is None:
+            self.hass.error("autoclimate/whatif requires numpy: pip install numpy")
+            return None
+
+        entity_rules = self.aconfig
+        if "entity_rules" in kwargs:
+            try:
+                entity_rules = adplus.normalized_args(
+                    self.hass,
+                    {"entity_rules": SCHEMA["entity_rules"]},
+                    {"entity_rules": kwargs["entity_rules"]},
+                )["entity_rules"]
+            except adplus.ConfigException as err:
+                self.hass.error(f"autoclimate/whatif - invalid entity_rules: {err}")
+                return None
+
+        days = kwargs.get("days", 10)
+        entities = set(entity_rules) | {
+            rule["occupancy_sensor"] for rule in entity_rules.values()
+        }
+        # Not prefetch() - startup may still be reading the shared prefetched rows
+        fetched = self.history.fetch(list(entities), days=days)
+        histories = {
+            entity: fetched.get(entity, [])
+            if fetched is not None
+            else list(self.history.read(entity, days=days))
+            for entity in entities
+        }
+        return analyze(
+            entity_rules,
+            histories,
+            parse_hours(str(kwargs.get("hours", "1:72"))),
+            end=self.hass.get_now(),  # type: ignore
+            wrongful_within=kwargs.get("wrongful_within", 2),
+        )
+
+
+def main(argv: Optional[List[str]] = None):
+    import cerberus
+
+    parser = argparse.ArgumentParser(
+        description="Sweep auto_off_hours over history: heating hours saved vs. wrongful turn offs."
+    )
+    parser.add_argument("history", nargs="+", help="History files (.json / .csv)")
+    parser.add_argument("--config", required=True, help="AppDaemon apps yaml")
+    parser.add_argument("--app", default="AutoClimate", help="App name in --config")
+    parser.add_argument(
+        "--hours", default="1:72", help='eg: "1:72", "1:72:0.5", "4,8,24"'
+    )
+    parser.add_argument("--wrongful-within", type=float, default=2)
+    parser.add_argument("--out", help="Write results here as JSON")
+    args = parser.parse_args(argv)
+
+    _require_numpy()
+    config = load_app_config(args.config, args.app)
+    validator = cerberus.Validator({"entity_rules": SCHEMA["entity_rules"]})
+    if not validator.validate({"entity_rules": config["entity_rules"]}):
+        raise SystemExit(f"Invalid entity_rules: {validator.errors}")
+    entity_rules = validator.document["entity_rules"]
+
+    histories: Dict[str, List[dict]] = {}
+    for path in args.history:
+        for rec in load_history(path):
+            histories.setdefault(rec["entity_id"], []).append(rec)
+    for records in histories.values():
+        records.sort(key=lambda rec: rec["last_updated"])
+    end = max(records[-1]["last_updated"] for records in histories.values())
+
+    results = analyze(
+        entity_rules, histories, parse_hours(args.hours), end, args.wrongful_within
+    )
+    for climate, result in results.items():
+        print(climate)
+        print(f'  {"hours":>7} {"saved_h":>9} {"offs":>5} {"wrongful":>8}')
+        for row in zip(
+            result["hours"],
+            result["saved_hours"],
+            result["turn_offs"],
+            result["wrongful"],
+        ):
+            print(f"  {row[0]:7.1f} {row[1]:9.1f} {row[2]:5d} {row[3]:8d}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+from typing import Dict, List
+
+from _autoclimate.utils import climate_name
+
+"""
+Zones - climates that share an occupancy sensor and an off_state, from
+entity_rules. They are normally turned off together (autooff, turn_off_all),
+with the same service calls, so CommandQueue sends those as one call per
+(service, parameters) with an entity_id list.
+"""
+
+
+def zone_name(rule: dict) -> str:
+    """eg: "cabin_occupancy/away" """
+    return f'{climate_name(rule["occupancy_sensor"])}/{rule["off_state"]["state"]}'
+
+
+def zones_from_rules(entity_rules: dict) -> Dict[str, List[str]]:
+    """{zone: [climates]}"""
+    zones: Dict[str, List[str]] = {}
+    for climate, rule in entity_rules.items():
+        zones.setdefault(zone_name(rule), []).append(climate)
+    return zones
@@ -1,33 +1,87 @@
 import json  # noqa
-import re
-from copy import Error
+import os
+import tempfile
 
 import adplus
-from _autoclimate.utils import in_inactive_period
+from _autoclimate.utils import in_inactive_period, parse_inactive_period
 
 adplus.importlib.reload(adplus)
 import _autoclimate
+import _autoclimate.accumulators
+import _autoclimate.async_path
+import _autoclimate.columnar
+import _autoclimate.commands
+import _autoclimate.confirm
+import _autoclimate.dispatch
+import _autoclimate.endpoint
+import _autoclimate.evaluation_log
+import _autoclimate.health
+import _autoclimate.history
+import _autoclimate.journal
+import _autoclimate.lag
 import _autoclimate.laston
 import _autoclimate.mocks
 import _autoclimate.occupancy
+import _autoclimate.profiler
+import _autoclimate.replay
 import _autoclimate.schema
+import _autoclimate.startup
 import _autoclimate.state
+import _autoclimate.temp_sensors
 import _autoclimate.turn_off
+import _autoclimate.whatif
+import _autoclimate.zones
 
 adplus.importlib.reload(_autoclimate)
+adplus.importlib.reload(_autoclimate.accumulators)
+adplus.importlib.reload(_autoclimate.zones)
+adplus.importlib.reload(_autoclimate.columnar)
+adplus.importlib.reload(_autoclimate.commands)
+adplus.importlib.reload(_autoclimate.health)
+adplus.importlib.reload(_autoclimate.confirm)
+adplus.importlib.reload(_autoclimate.dispatch)
+adplus.importlib.reload(_autoclimate.history)
+adplus.importlib.reload(_autoclimate.journal)
+adplus.importlib.reload(_autoclimate.lag)
+adplus.importlib.reload(_autoclimate.evaluation_log)
+adplus.importlib.reload(_autoclimate.profiler)
+adplus.importlib.reload(_autoclimate.temp_sensors)
 adplus.importlib.reload(_autoclimate.state)
 adplus.importlib.reload(_autoclimate.mocks)
 adplus.importlib.reload(_autoclimate.occupancy)
 adplus.importlib.reload(_autoclimate.turn_off)
 adplus.importlib.reload(_autoclimate.laston)
 adplus.importlib.reload(_autoclimate.schema)
+adplus.importlib.reload(_autoclimate.replay)
+adplus.importlib.reload(_autoclimate.whatif)
+adplus.importlib.reload(_autoclimate.async_path)
+adplus.importlib.reload(_autoclimate.endpoint)
+adplus.importlib.reload(_autoclimate.startup)
 
+from _autoclimate.accumulators import Accumulators
+from _autoclimate.async_path import (
+    AsyncLaston,
+    AsyncOccupancy,
+    AsyncState,
+    AsyncTurnOff,
+)
+from _autoclimate.commands import CommandQueue
+from _autoclimate.confirm import Confirmations
+from _autoclimate.dispatch import Dispatcher
+from _autoclimate.endpoint import SnapshotEndpoint
+from _autoclimate.evaluation_log import EvaluationLog
+from _autoclimate.health import HealthTracker
+from _autoclimate.history import RecorderHistory
+from _autoclimate.lag import LagMonitor
 from _autoclimate.laston import Laston
-from _autoclimate.mocks import Mocks
+from _autoclimate.mocks import MockLoadGenerator, Mocks
 from _autoclimate.occupancy import Occupancy
+from _autoclimate.profiler import CallbackProfiler
 from _autoclimate.schema import SCHEMA
+from _autoclimate.startup import Startup
 from _autoclimate.state import State
 from _autoclimate.turn_off import TurnOff
+from _autoclimate.whatif import WhatIf
 
 
 class AutoClimate(adplus.Hass):
@@ -71,10 +125,62 @@ class AutoClimate(adplus.Hass):
         self.climates = list(self.entity_rules.keys())
         self.log(f"Climates controlled: {self.climates}")
 
+        if self.argsn["async_callbacks"]:
+            self.log("Using async callbacks")
+            StateCls, OccupancyCls, LastonCls, TurnOffCls = (
+                AsyncState,
+                AsyncOccupancy,
+                AsyncLaston,
+                AsyncTurnOff,
+            )
+        else:
+            StateCls, OccupancyCls, LastonCls, TurnOffCls = (
+                State,
+                Occupancy,
+                Laston,
+                TurnOff,
+            )
+
         #
         # Initialize sub-classes
         #
-        self.state_module = State(
+        self.callback_profiler = CallbackProfiler(
+            hass=self,
+            appname=self.appname,
+            directory=self.argsn.get("profile_dir")
+            or os.path.join(tempfile.gettempdir(), f"{self.appname}_profile"),
+        )
+
+        self.health = HealthTracker(
+            hass=self,
+            appname=self.appname,
+            climates=self.climates,
+            offline_after=self.argsn["health_offline_after"],
+            backoff_base=self.argsn["health_backoff_base"],
+            backoff_max=self.argsn["health_backoff_max"],
+        )
+
+        self.dispatcher = Dispatcher(
+            hass=self, appname=self.appname, event=self.EVENT_TRIGGER
+        )
+
+        self.lag = LagMonitor(
+            hass=self, appname=self.appname, threshold=self.argsn["lag_shed_threshold"]
+        )
+
+        self.evaluation_log = (
+            EvaluationLog(
+                hass=self,
+                directory=self.argsn["evaluation_log_dir"],
+                climates=self.climates,
+                max_bytes=int(self.argsn["evaluation_log_max_mb"] * 1024 * 1024),
+                max_files=self.argsn["evaluation_log_max_files"],
+            )
+            if self.argsn.get("evaluation_log_dir")
+            else None
+        )
+
+        self.state_module = StateCls(
             hass=self,
             config=self.entity_rules,
             poll_frequency=self.argsn["poll_frequency"],
@@ -83,27 +189,73 @@ class AutoClimate(adplus.Hass):
             create_temp_sensors=self.argsn["create_temp_sensors"],
             test_mode=self.test_mode,
             inactive_period=self.inactive_period,
+            journal_size=self.argsn["journal_size"],
+            temp_sensor_policy=self.argsn.get("temp_sensor_policy"),
+            health=self.health,
+            evaluation_log=self.evaluation_log,
+            publish_mode=self.argsn["publish_mode"],
+            lag=self.lag,
+        )
+
+        self.snapshot_endpoint = (
+            SnapshotEndpoint(
+                hass=self,
+                state_module=self.state_module,
+                address=self.argsn["snapshot_endpoint"],
+            )
+            if self.argsn.get("snapshot_endpoint")
+            else None
         )
-        self.climate_state = self.state_module.state
 
-        self.occupancy_module = Occupancy(
+        self.history = RecorderHistory(hass=self, db_path=self.argsn.get("recorder_db"))
+
+        self.accumulators = Accumulators(
+            hass=self, appname=self.appname, climates=self.climates
+        )
+
+        self.occupancy_module = OccupancyCls(
             hass=self,
             config=self.entity_rules,
             appname=self.appname,
             climates=self.climates,
             test_mode=self.test_mode,
+            history=self.history,
+            accumulators=self.accumulators,
         )
 
-        self.laston_module = Laston(
+        self.laston_module = LastonCls(
             hass=self,
             config=self.entity_rules,
             appname=self.appname,
             climates=self.climates,
             appstate_entity=self.state_module.app_state_name,
             test_mode=self.test_mode,
+            history=self.history,
+            on_laston=self.state_module.set_laston,
+            accumulators=self.accumulators,
+            lag=self.lag,
         )
 
-        self.turn_off_module = TurnOff(
+        self.command_queue = CommandQueue(
+            hass=self,
+            config=self.entity_rules,
+            appname=self.appname,
+            rate_per_minute=self.argsn["command_rate_per_minute"],
+            burst=self.argsn["command_burst"],
+            coalesce_seconds=self.argsn["command_coalesce_seconds"],
+            health=self.health,
+        )
+
+        self.confirmations = Confirmations(
+            hass=self,
+            appname=self.appname,
+            climates=self.climates,
+            commands=self.command_queue,
+            timeout=self.argsn["confirm_timeout"],
+            max_retries=self.argsn["confirm_retries"],
+        )
+
+        self.turn_off_module = TurnOffCls(
             hass=self,
             config=self.entity_rules,
             inactive_period=self.inactive_period,
@@ -111,8 +263,20 @@ class AutoClimate(adplus.Hass):
             appname=self.appname,
             climates=self.climates,
             test_mode=self.test_mode,
-            climate_state=self.climate_state,
+            state_snapshot=lambda: self.state_module.snapshot,
+            commands=self.command_queue,
+            confirmations=self.confirmations,
+            health=self.health,
             turn_on_error_off=self.argsn["turn_on_error_off"],
+            dedupe_seconds=self.argsn["turn_off_dedupe_seconds"],
+            direct_events=self.argsn["direct_events"],
+        )
+
+        self.whatif_module = WhatIf(
+            hass=self,
+            config=self.entity_rules,
+            appname=self.appname,
+            history=self.history,
         )
 
         self.mock_module = Mocks(
@@ -120,11 +284,164 @@ class AutoClimate(adplus.Hass):
             mock_config=self.argsn["mocks"],
             run_mocks=self.argsn["run_mocks"],
             mock_callbacks=[self.turn_off_module.autooff_scheduled_cb],
-            init_delay=1,
             mock_delay=1,
         )
+
+        self.load_generator = None
+        if (
+            self.argsn["run_mocks"]
+            and self.argsn.get("load_generator")
+            and not self.test_mode
+        ):
+            self.error(
+                "load_generator requires test_mode: true - it writes made-up states into the sensors autooff uses. Not running it."
+            )
+        elif self.argsn["run_mocks"] and self.argsn.get("load_generator"):
+            self.load_generator = MockLoadGenerator(
+                hass=self,
+                appname=self.appname,
+                config=self.entity_rules,
+                load_config=self.argsn["load_generator"],
+                mock_config=self.argsn.get("mocks"),
+                climate_handlers=[
+                    self.state_module.get_and_publish_state,
+                    self.laston_module.update_laston_sensors,
+                ],
+                occupancy_handlers=[self.occupancy_module.update_occupancy_sensor],
+                snapshot=lambda: self.state_module.snapshot,
+            )
+
+        self.startup = self.build_startup()
+        self.startup.start()
         self.log("Done initializing")
 
+    def build_startup(self) -> Startup:
+        """
+        Startup stages. Each runs as soon as the stages in its list are done.
+        When all are done, app.{appname}_ready is fired with the timings.
+        """
+        state = self.state_module
+        startup = Startup(hass=self, appname=self.appname)
+
+        startup.add("services", state.autoclimate_register_services)
+        startup.add("whatif_service", self.whatif_module.register_services)
+        startup.add("profile_service", self.callback_profiler.register_services)
+        startup.add("app_state", state.create_hass_stateobj)
+        startup.add("temp_sensors", self.create_temp_sensors)
+        startup.add("occupancy_sensors", self.occupancy_module.create_occupancy_sensors)
+        # Listeners feed the accumulators - after they are seeded from history
+        startup.add(
+            "occupancy_listeners",
+            self.occupancy_module.init_occupancy_listeners,
+            after=["occupancy_sensors", "accumulators"],
+        )
+        startup.add("laston_history", self.laston_module.initialize_states)
+        startup.add(
+            "laston_sensors",
+            self.laston_module.create_laston_sensors,
+            after=["laston_history"],
+        )
+        startup.add(
+            "laston_listeners",
+            self.laston_module.init_laston_listeners,
+            after=["laston_sensors", "accumulators"],
+        )
+        # State reads the unoccupied_since sensors
+        startup.add(
+            "initial_state",
+            state.get_and_publish_state,
+            after=["app_state", "temp_sensors", "occupancy_sensors"],
+        )
+        startup.add(
+            "climate_listeners",
+            state.init_climate_listeners,
+            after=["occupancy_sensors"],
+        )
+        startup.add("confirm_listeners", self.confirmations.init_confirm_listeners)
+        startup.add("lag", self.lag.start)
+        startup.add("sub_events", self.trigger_sub_events)
+        startup.add(
+            "accumulators",
+            self.seed_accumulators,
+            after=["laston_history", "occupancy_sensors"],
+        )
+        startup.add(
+            "accumulators_publish", self.accumulators.start, after=["accumulators"]
+        )
+        # Every history read at startup is done
+        startup.add(
+            "history_clear",
+            self.history.clear_prefetched,
+            after=["laston_history", "occupancy_sensors", "accumulators"],
+        )
+        startup.add("state_poll", state.start_polling, after=["initial_state"])
+        if self.snapshot_endpoint:
+            startup.add(
+                "snapshot_endpoint",
+                self.snapshot_endpoint.start,
+                after=["initial_state", "laston_sensors"],
+            )
+        # autooff reads State and the laston sensors
+        startup.add(
+            "autooff",
+            self.turn_off_module.start_autooff,
+            after=["initial_state", "laston_sensors"],
+        )
+
+        listeners = ["climate_listeners", "occupancy_listeners", "laston_listeners"]
+        if self.argsn["run_mocks"]:
+            startup.add(
+                "mocks",
+                self.mock_module.init_mocks,
+                after=["autooff", "confirm_listeners", *listeners],
+            )
+        if self.load_generator:
+            startup.add(
+                "load_generator",
+                self.load_generator.start,
+                after=["autooff", "confirm_listeners", *listeners],
+            )
+        return startup
+
+    def terminate(self):
+        if self.snapshot_endpoint:
+            self.snapshot_endpoint.stop()
+        if self.evaluation_log:
+            self.evaluation_log.close()
+
+    def seed_accumulators(self, kwargs):
+        # The last week from the history prefetched for startup (recorder_db),
+        # then now. Without it, seeding would read every history a second time.
+        seeded = 0
+        for climate in self.climates:
+            turnon_state = self.laston_module.climate_states[climate]
+            sensor = self.entity_rules[climate]["occupancy_sensor"]
+            climate_states, occupancy = [], []
+            if self.history.is_prefetched(climate):
+                climate_states = (
+                    (rec["last_updated"], turnon_state.entity_state(rec))
+                    for rec in self.history.history(climate)
+                )
+                seeded += 1
+            if self.history.is_prefetched(sensor):
+                occupancy = (
+                    (rec["last_updated"], rec["state"] == "on")
+                    for rec in self.history.history(sensor)
+                )
+            self.accumulators.seed(
+                climate, climate_states=climate_states, occupancy=occupancy
+            )
+            state = turnon_state.curr
+            if state:
+                self.accumulators.climate_state(climate, state)
+            self.accumulators.occupancy(climate, self.get_state(sensor) == "on")
+        if not seeded:
+            self.log("Hours accumulators start empty - no recorder_db history to seed")
+
+    def create_temp_sensors(self, kwargs):
+        if self.argsn["create_temp_sensors"]:
+            self.state_module.create_temp_sensors(kwargs)
+
     def extra_validation(self, argsn):
         # Validation that Cerberus doesn't do well
 
@@ -148,27 +465,15 @@ class AutoClimate(adplus.Hass):
         # inactive_period: mm/dd - mm/dd
         if argsn.get("inactive_period"):
             try:
-                match = re.match(
-                    r"(\d?\d)/(\d?\d)\s*-\s*(\d?\d)/(\d?\d)",
-                    argsn["inactive_period"],
-                )
-                start = (int(match.group(1)), int(match.group(2)))  # type: ignore
-                end = (int(match.group(3)), int(match.group(4)))  # type: ignore
-                if not (
-                    1 <= start[0] <= 12
-                    and 1 <= end[0] <= 12
-                    and 1 <= start[1] <= 31
-                    and 1 <= end[1] <= 31
-                ):
-                    raise Error(
-                        f'Invalid day or month value in inactive_period ({argsn["inactive_period"]})'
-                    )
+                inactive_period = parse_inactive_period(argsn["inactive_period"])
             except Exception as err:
                 self.error(
                     f'Invalid inactive_period format. Should be: "mm/dd - mm/dd". Error: {err}'
                 )
             else:
-                self.inactive_period = (start, end)  # ((m,d), (m,d))
+                self.inactive_period = inactive_period  # ((m,d), (m,d))
 
-    def trigger_sub_events(self):
-        pass
+    def trigger_sub_events(self, kwargs):
+        # One "autoclimate" listener for every module's sub_events
+        self.turn_off_module.register_sub_events(self.dispatcher)
+        self.dispatcher.init_listeners()
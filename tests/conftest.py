@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Run from anywhere: the app's modules are imported as _autoclimate.*
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,92 @@
+import datetime as dt
+import random
+
+import pytest
+
+from _autoclimate import columnar
+from _autoclimate.benchmark import OFF_STATES, synthetic_climate_history
+from _autoclimate.laston import TurnonState
+from _autoclimate.replay import NoHistory, ReplayHass
+
+needs_numpy = pytest.mark.skipif(columnar.np is None, reason="needs numpy")
+CLIMATE = "climate.cabin"
+
+
+class ListHistory:
+    def __init__(self, records):
+        self.records = records
+
+    def history(self, entity_id, days=10, newest_first=False):
+        return self.records
+
+
+def replayed(records, off_state):
+    """(states, times) after TurnonState.add_state on every record"""
+    turnon_state = TurnonState(
+        ReplayHass(), {CLIMATE: {"off_state": off_state}}, CLIMATE, NoHistory()
+    )
+    for rec in records:
+        turnon_state.add_state(rec)
+    return (
+        [turnon_state.curr_m2, turnon_state.curr_m1, turnon_state.curr],
+        [turnon_state._curr_dt_m1, turnon_state._curr_dt],
+    )
+
+
+@needs_numpy
+@pytest.mark.parametrize("off_state", OFF_STATES, ids=lambda rule: rule["state"])
+def test_last_states_matches_add_state(off_state):
+    rng = random.Random(7)
+    for seed in range(100):
+        records = synthetic_climate_history(off_state, rng.randint(1, 400), seed=seed)
+        assert columnar.last_states(records, off_state) == replayed(records, off_state)
+
+
+@needs_numpy
+def test_all_offline_matches_add_state():
+    records = [
+        {"last_updated": f"2021-01-01T0{i}:00:00+00:00", "attributes": {}}
+        for i in range(5)
+    ]
+    off_state = {"state": "off"}
+    assert columnar.last_states(records, off_state) == replayed(records, off_state)
+    assert columnar.last_states(records, off_state) == ([None] * 3, [None] * 2)
+
+
+def on_off(hour: int, preset="away_indefinitely", temperature=50) -> dict:
+    return {
+        "last_updated": dt.datetime(2021, 1, 1, hour, tzinfo=dt.timezone.utc),
+        "attributes": {"temperature": temperature, "preset_mode": preset},
+    }
+
+
+@needs_numpy
+@pytest.mark.parametrize(
+    "records",
+    [
+        [],
+        [on_off(2), on_off(1)],  # Out of order
+        [on_off(1), on_off(2, preset=5)],  # Non string preset_mode
+        [on_off(1), on_off(2, preset=None)],  # preset_mode None while on
+        [on_off(1), {**on_off(2), "last_updated": dt.datetime(2021, 1, 1, 3)}],  # Naive
+        [on_off(1, temperature="50")],  # Non numeric temperature
+    ],
+    ids=["empty", "unordered", "int_preset", "none_preset", "mixed_tz", "str_temp"],
+)
+def test_records_only_add_state_handles_return_none(records):
+    assert columnar.last_states(records, {"state": "away", "temp": 50}) is None
+
+
+def test_without_numpy_turnon_state_falls_back_to_add_state(monkeypatch):
+    off_state = OFF_STATES[1]
+    records = synthetic_climate_history(off_state, TurnonState.BATCH_MIN_RECORDS * 2)
+    monkeypatch.setattr(columnar, "np", None)
+    assert columnar.last_states(records, off_state) is None
+
+    turnon_state = TurnonState(
+        ReplayHass(), {CLIMATE: {"off_state": off_state}}, CLIMATE, ListHistory(records)
+    )
+    assert (
+        [turnon_state.curr_m2, turnon_state.curr_m1, turnon_state.curr],
+        [turnon_state._curr_dt_m1, turnon_state._curr_dt],
+    ) == replayed(records, off_state)
@@ -0,0 +1,209 @@
+import threading
+
+import pytest
+
+from _autoclimate import commands
+from _autoclimate.commands import CommandQueue, TokenBucket
+
+OFF = [("climate/set_preset_mode", {"preset_mode": "away"})]
+ON = [("climate/set_preset_mode", {"preset_mode": "home"})]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(commands, "time", clock)
+    return clock
+
+
+class StubHass:
+    def __init__(self):
+        self.calls = []  # (service, entity_id, kwargs)
+        self.scheduled = []  # (callback, delay)
+        self.on_call = None
+
+    def call_service(self, service, entity_id=None, **kwargs):
+        self.calls.append((service, entity_id, kwargs))
+        if self.on_call:
+            self.on_call()
+
+    def run_in(self, callback, delay, **kwargs):
+        self.scheduled.append((callback, delay))
+        return len(self.scheduled)
+
+    def log(self, msg, *args, **kwargs):
+        pass
+
+    def update_state(self, entity_id, state=None, attributes=None):
+        pass
+
+
+def rule(sensor: str, state: str = "away", **extra) -> dict:
+    return {
+        "occupancy_sensor": f"binary_sensor.{sensor}",
+        "off_state": {"state": state},
+        **extra,
+    }
+
+
+def make_queue(config=None, rate=6, burst=4, coalesce=10) -> CommandQueue:
+    config = config or {"climate.a": rule("cabin"), "climate.b": rule("garage")}
+    return CommandQueue(StubHass(), config, "test", rate, burst, coalesce)  # type: ignore
+
+
+#
+# TokenBucket
+#
+def test_bucket_burst_then_refill(clock):
+    bucket = TokenBucket(rate_per_minute=6, burst=2)  # A token every 10s
+    assert bucket.take(1) and bucket.take(1)
+    assert not bucket.take(1)
+    assert bucket.seconds_until(1) == pytest.approx(10)
+    clock.now += 4
+    assert bucket.seconds_until(1) == pytest.approx(6)
+    assert not bucket.take(1)
+    clock.now += 6
+    assert bucket.take(1)
+    clock.now += 1000
+    bucket._refill()
+    assert bucket.tokens == 2  # Never above the burst
+
+
+def test_bucket_command_bigger_than_burst_waits_for_a_full_bucket(clock):
+    bucket = TokenBucket(rate_per_minute=60, burst=2)
+    assert bucket.take(1)
+    assert bucket.seconds_until(5) == pytest.approx(1)  # Capped at capacity
+    clock.now += 1
+    assert bucket.take(5)
+
+
+def test_bucket_zero_rate(clock):
+    bucket = TokenBucket(rate_per_minute=0, burst=1)
+    assert bucket.take(1)
+    assert bucket.seconds_until(1) == 60
+
+
+#
+# Coalescing
+#
+def test_same_command_within_coalesce_seconds_is_dropped(clock):
+    queue = make_queue()
+    assert queue.submit("climate.a", "off", OFF)
+    assert not queue.submit("climate.a", "off", OFF)
+    clock.now += 9
+    assert not queue.submit("climate.a", "off", OFF)
+    clock.now += 2
+    assert queue.submit("climate.a", "off", OFF)
+    assert len(queue.hass.calls) == 2
+    assert queue.stats["coalesced"] == 2
+    assert queue.submit("climate.a", "off", OFF, force=True)  # A deliberate retry
+
+
+def test_pending_duplicate_coalesced_and_newer_intent_supersedes(clock):
+    queue = make_queue()
+    assert queue.submit("climate.a", "off", OFF, drain=False)
+    assert not queue.submit("climate.a", "off", OFF, drain=False)
+    assert queue.submit("climate.a", "on", ON, drain=False)
+    queue.drain()
+    assert queue.hass.calls == [
+        ("climate/set_preset_mode", "climate.a", {"preset_mode": "home"})
+    ]
+    assert queue.stats["superseded"] == 1
+
+
+def test_rate_limited_command_is_counted_once_and_rescheduled(clock):
+    queue = make_queue(rate=6, burst=1)
+    queue.submit("climate.a", "off", OFF)
+    queue.submit("climate.b", "on", ON)  # Another zone - its own batch
+    assert len(queue.hass.calls) == 1
+    for _ in range(3):
+        queue.drain()
+    assert queue.stats["rate_limited"] == 1
+    callback, delay = queue.hass.scheduled[0]
+    assert delay == pytest.approx(10)
+    clock.now += 10
+    callback({})
+    assert len(queue.hass.calls) == 2
+    assert queue.depth == 0
+
+
+#
+# Batching
+#
+def test_batches_group_by_priority_zone_integration_and_calls(clock):
+    config = {
+        "climate.a1": rule("cabin"),
+        "climate.a2": rule("cabin"),
+        "climate.a3": rule("cabin", integration="nest"),
+        "climate.b1": rule("garage"),
+        "climate.c1": rule("cabin", state="off"),  # Another zone: off_state differs
+    }
+    queue = make_queue(config, burst=100)
+    for climate in config:
+        queue.submit(climate, "off", OFF, drain=False)
+    queue.submit("climate.a2", "on", ON, drain=False)  # Supersedes: other priority
+    queue.drain()
+
+    entity_ids = [entity_id for _, entity_id, _ in queue.hass.calls]
+    # Turn offs before turn ons, in submit order
+    assert entity_ids == [
+        "climate.a1",
+        "climate.a3",
+        "climate.b1",
+        "climate.c1",
+        "climate.a2",
+    ]
+
+    queue = make_queue(config, burst=100)
+    queue.submit("climate.a1", "off", OFF, drain=False)
+    queue.submit("climate.a2", "off", OFF, drain=False)
+    queue.submit("climate.b1", "off", OFF, drain=False)
+    queue.drain()
+    assert [entity_id for _, entity_id, _ in queue.hass.calls] == [
+        ["climate.a1", "climate.a2"],
+        "climate.b1",
+    ]
+    assert queue.stats["batched"] == 2
+    assert queue.stats["sent"] == 3
+    assert queue.stats["calls"] == 2
+
+
+def test_different_calls_in_one_zone_are_not_batched(clock):
+    config = {"climate.a1": rule("cabin"), "climate.a2": rule("cabin")}
+    queue = make_queue(config)
+    queue.submit("climate.a1", "off", OFF, drain=False)
+    queue.submit(
+        "climate.a2", "off", [("climate/set_temperature", {"temperature": 50})], drain=False
+    )
+    queue.drain()
+    assert [entity_id for _, entity_id, _ in queue.hass.calls] == [
+        "climate.a1",
+        "climate.a2",
+    ]
+
+
+def test_service_calls_are_made_outside_the_lock(clock):
+    queue = make_queue()
+    submitted = []
+
+    def submit_from_another_worker():
+        worker = threading.Thread(
+            target=lambda: submitted.append(
+                queue.submit("climate.b", "off", OFF, drain=False)
+            )
+        )
+        worker.start()
+        worker.join(timeout=2)
+        assert not worker.is_alive(), "submit() blocked behind a service call"
+
+    queue.hass.on_call = submit_from_another_worker
+    queue.submit("climate.a", "off", OFF)
+    assert submitted == [True]
@@ -0,0 +1,145 @@
+import pytest
+
+from _autoclimate import confirm
+from _autoclimate.confirm import Confirmations
+
+CLIMATE = "climate.cabin"
+CONFIG = {"off_state": {"state": "off"}}
+CALLS = [("climate/turn_off", {})]
+ON = {"attributes": {"temperature": 68}}
+OFF = {"attributes": {"temperature": None}}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class StubHass:
+    def __init__(self):
+        self.timers = {}  # {handle: (callback, delay, kwargs)}
+        self.handles = 0
+        self.states = {CLIMATE: ON}
+        self.reads = 0
+        self.errors = []
+
+    def run_in(self, callback, delay, **kwargs):
+        self.handles += 1
+        handle = self.handles
+        self.timers[handle] = (callback, delay, kwargs)
+        return handle
+
+    def cancel_timer(self, handle):
+        del self.timers[handle]
+
+    def get_state(self, entity_id, attribute=None):
+        self.reads += 1
+        return self.states[entity_id]
+
+    def log(self, msg, *args, **kwargs):
+        pass
+
+    def error(self, msg, *args, **kwargs):
+        self.errors.append(msg)
+
+    def update_state(self, entity_id, state=None, attributes=None):
+        pass
+
+    def fire_next_timer(self):
+        handle = max(self.timers)
+        callback, delay, kwargs = self.timers.pop(handle)
+        callback(kwargs)
+        return delay
+
+
+class StubQueue:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, climate, kind, calls, drain=True, force=False):
+        self.submitted.append((climate, kind, force))
+        return True
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(confirm, "time", clock)
+    return clock
+
+
+def make_confirmations(timeout=10, max_retries=2) -> Confirmations:
+    return Confirmations(
+        StubHass(), "test", [CLIMATE], StubQueue(), timeout, max_retries  # type: ignore
+    )
+
+
+def test_confirmed_by_the_state_event(clock):
+    confirmations = make_confirmations()
+    confirmations.expect(CLIMATE, CONFIG, CALLS, ON)
+    clock.now += 3
+    confirmations.on_climate_state(CLIMATE, "all", ON, ON, {})
+    assert confirmations.stats["confirmed"] == 0
+    confirmations.on_climate_state(CLIMATE, "all", ON, OFF, {})
+    assert confirmations.stats["confirmed"] == 1
+    assert confirmations.by_climate[CLIMATE].last == 3
+    assert confirmations.by_off_type["off"].count == 1
+    assert confirmations.hass.timers == {}  # Timeout cancelled
+
+
+def test_retries_back_off_then_give_up(clock):
+    confirmations = make_confirmations(timeout=10, max_retries=2)
+    confirmations.expect(CLIMATE, CONFIG, CALLS, ON)
+    hass = confirmations.hass
+
+    delays = [hass.fire_next_timer() for _ in range(3)]
+    assert delays == [10, 20, 40]  # timeout * 2 ** attempt
+    assert confirmations.commands.submitted == [(CLIMATE, "off", True)] * 2
+    assert confirmations.stats["retries"] == 2
+    assert confirmations.stats["failed"] == 1
+    assert hass.timers == {}
+    assert len(hass.errors) == 1
+    assert CLIMATE not in confirmations._pending
+
+
+def test_timeout_rereads_the_state_before_retrying(clock):
+    confirmations = make_confirmations()
+    confirmations.expect(CLIMATE, CONFIG, CALLS, ON)
+    hass = confirmations.hass
+    hass.states[CLIMATE] = OFF  # The state event was missed
+    clock.now += 10
+    hass.fire_next_timer()
+    assert hass.reads == 1
+    assert confirmations.commands.submitted == []
+    assert confirmations.stats == {
+        "confirmed": 1,
+        "already_off": 0,
+        "retries": 0,
+        "failed": 0,
+    }
+    assert confirmations.by_climate[CLIMATE].last == 10
+
+
+def test_already_off_is_confirmed_at_once_and_not_in_latency(clock):
+    confirmations = make_confirmations()
+    confirmations.expect(CLIMATE, CONFIG, CALLS, ON)  # Pending, with a timer
+    confirmations.expect(CLIMATE, CONFIG, CALLS, OFF)
+    assert confirmations.stats["already_off"] == 1
+    assert confirmations.stats["confirmed"] == 0
+    assert confirmations.by_climate == {}
+    assert confirmations.hass.timers == {}
+    assert CLIMATE not in confirmations._pending
+
+
+def test_new_request_keeps_the_first_start_time(clock):
+    confirmations = make_confirmations()
+    confirmations.expect(CLIMATE, CONFIG, CALLS, ON)
+    clock.now += 5
+    confirmations.expect(CLIMATE, CONFIG, CALLS, ON)
+    assert len(confirmations.hass.timers) == 1  # The first timeout was cancelled
+    clock.now += 2
+    confirmations.on_climate_state(CLIMATE, "all", ON, OFF, {})
+    assert confirmations.by_climate[CLIMATE].last == 7
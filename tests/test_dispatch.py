@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from _autoclimate.dispatch import Dispatcher
+
+EVENT = "autoclimate"
+TURN_OFF = "app.test_turn_off_climate"
+SCHEMA = {
+    "climate": {"type": "string", "required": True},
+    "test_mode": {"type": "boolean", "nullable": True},
+}
+
+
+class StubHass:
+    def __init__(self):
+        self.warnings = []
+        self.errors = []
+        self.published = []
+
+    def warn(self, msg, *args, **kwargs):
+        self.warnings.append(msg)
+
+    def error(self, msg, *args, **kwargs):
+        self.errors.append(msg)
+
+    def update_state(self, entity_id, state=None, attributes=None):
+        self.published.append((entity_id, state, attributes))
+
+    async def run_in_executor(self, func, *args):
+        return func(*args)
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def dispatcher(calls) -> Dispatcher:
+    def handler(event_name, data, kwargs):
+        if data.get("fail"):
+            raise RuntimeError("boom")
+        calls.append((event_name, data))
+
+    dispatcher = Dispatcher(StubHass(), "test", EVENT)  # type: ignore
+    dispatcher.register(TURN_OFF, handler, SCHEMA)
+    return dispatcher
+
+
+def test_register_twice_raises(dispatcher):
+    with pytest.raises(ValueError):
+        dispatcher.register(TURN_OFF, lambda *args: None)
+
+
+def test_valid_payload_runs_handler_as_its_sub_event(dispatcher, calls):
+    data = {"sub_event": TURN_OFF, "climate": "climate.cabin", "metadata": {}}
+    dispatcher.cb_event(EVENT, data, {})
+    # Unknown keys (sub_event, metadata) are allowed
+    assert calls == [(TURN_OFF, data)]
+    assert dispatcher.sub_events[TURN_OFF].as_dict()["count"] == 1
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"sub_event": TURN_OFF},  # Missing climate
+        {"sub_event": TURN_OFF, "climate": 1},
+        {"sub_event": TURN_OFF, "climate": "climate.cabin", "test_mode": "yes"},
+    ],
+)
+def test_invalid_payload_is_rejected(dispatcher, calls, data):
+    dispatcher.cb_event(EVENT, data, {})
+    assert calls == []
+    stats = dispatcher.sub_events[TURN_OFF].as_dict()
+    assert (stats["count"], stats["rejected"]) == (0, 1)
+    assert len(dispatcher.hass.errors) == 1
+    assert "invalid" in dispatcher.hass.errors[0]
+
+
+def test_unknown_sub_event(dispatcher, calls):
+    dispatcher.cb_event(EVENT, {"sub_event": "app.test_turn_on"}, {})
+    assert dispatcher.unknown == 1
+    assert len(dispatcher.hass.warnings) == 1
+    # Another app instance's sub_event, or none at all - not ours, ignored
+    dispatcher.cb_event(EVENT, {"sub_event": "app.other_turn_off_climate"}, {})
+    dispatcher.cb_event(EVENT, {}, {})
+    assert dispatcher.unknown == 1
+    assert len(dispatcher.hass.warnings) == 1
+    assert calls == []
+
+
+def test_handler_error_is_counted_and_logged(dispatcher):
+    data = {"sub_event": TURN_OFF, "climate": "climate.cabin", "fail": True}
+    dispatcher.cb_event(EVENT, data, {})
+    stats = dispatcher.sub_events[TURN_OFF].as_dict()
+    assert (stats["count"], stats["errors"]) == (1, 1)
+    assert "boom" in dispatcher.hass.errors[0]
+    assert "Traceback" in dispatcher.hass.errors[0]
+
+
+def test_async_dispatch_runs_sync_handler_in_executor(dispatcher, calls):
+    data = {"sub_event": TURN_OFF, "climate": "climate.cabin"}
+    asyncio.run(dispatcher.acb_event(EVENT, data, {}))
+    asyncio.run(dispatcher.acb_event(EVENT, {**data, "fail": True}, {}))
+    assert calls == [(TURN_OFF, data)]
+    stats = dispatcher.sub_events[TURN_OFF].as_dict()
+    assert (stats["count"], stats["errors"]) == (2, 1)
+
+
+def test_publish_stats(dispatcher):
+    dispatcher.cb_event(EVENT, {"sub_event": TURN_OFF, "climate": "c.x"}, {})
+    dispatcher.cb_event(EVENT, {"sub_event": TURN_OFF}, {})
+    dispatcher.cb_event(EVENT, {"sub_event": "app.test_nope"}, {})
+    dispatcher.publish_stats()
+    entity_id, state, attributes = dispatcher.hass.published[-1]
+    assert entity_id == "sensor.test_events"
+    assert state == 1
+    assert attributes["unknown"] == 1
+    assert attributes[TURN_OFF]["count"] == 1
+    assert attributes[TURN_OFF]["rejected"] == 1
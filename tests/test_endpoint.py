@@ -0,0 +1,44 @@
+import json
+import socket
+
+import pytest
+
+from _autoclimate.endpoint import SnapshotEndpoint
+from tests.test_state_snapshots import make_state, tagged_updates
+
+
+class StubHass:
+    def log(self, msg, *args, **kwargs):
+        pass
+
+
+def test_unix_socket_path_that_is_not_a_socket_is_left_alone(tmp_path):
+    path = tmp_path / "autoclimate.sock"
+    path.write_text("not a socket")
+    endpoint = SnapshotEndpoint(StubHass(), make_state(), f"unix:{path}")  # type: ignore
+    with pytest.raises(ValueError, match="not a socket"):
+        endpoint.start({})
+    assert path.read_text() == "not a socket"
+
+
+def test_stale_unix_socket_is_replaced(tmp_path):
+    path = str(tmp_path / "autoclimate.sock")
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(path)
+    stale.close()  # Left behind, like after an unclean stop
+
+    state = make_state()
+    state.submit(state.apply_entity_states, tagged_updates(0, 0), "poll")
+    endpoint = SnapshotEndpoint(StubHass(), state, f"unix:{path}")  # type: ignore
+    endpoint.start({})
+    try:
+        client = socket.socket(socket.AF_UNIX)
+        client.connect(path)
+        client.sendall(b"GET / HTTP/1.0\r\n\r\n")
+        response = b"".join(iter(lambda: client.recv(65536), b""))
+        client.close()
+        body = json.loads(response.split(b"\r\n\r\n", 1)[1])
+        assert body["version"] == state.snapshot.version
+    finally:
+        endpoint.stop()
+    assert not (tmp_path / "autoclimate.sock").exists()
@@ -0,0 +1,153 @@
+import math
+
+import pytest
+
+from _autoclimate import evaluation_log
+from _autoclimate.evaluation_log import (
+    HEADER_SIZE,
+    ROW,
+    STATES,
+    EvaluationLog,
+    EvaluationLogReader,
+    log_files,
+)
+
+np = pytest.importorskip("numpy")
+
+CLIMATES = ["climate.a", "climate.b", "climate.c"]
+ROWS_PER_FILE = 7  # Not a multiple of an evaluation - files split them
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1_600_000_000.0
+
+    def time(self):
+        return self.now
+
+
+class StubHass:
+    def error(self, msg, *args, **kwargs):
+        raise AssertionError(msg)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(evaluation_log, "time", clock)
+    return clock
+
+
+def evaluation(i: int, climates=CLIMATES) -> list:
+    """(climate, state, temp, unoccupied) - values encode i and the climate"""
+    return [
+        (climate, STATES[1 + (i + n) % 4], 60 + i + n / 10, i if n else False)
+        for n, climate in enumerate(climates)
+    ]
+
+
+def write(directory, clock, n: int, max_files: int = 100) -> EvaluationLog:
+    log = EvaluationLog(
+        StubHass(),  # type: ignore
+        str(directory),
+        CLIMATES,
+        max_bytes=HEADER_SIZE + ROWS_PER_FILE * ROW.size,
+        max_files=max_files,
+    )
+    for i in range(n):
+        # Climates in varying subsets and order, so rows interleave
+        climates = CLIMATES[i % 3 :] + CLIMATES[: i % 3]
+        log.append(evaluation(i, climates[: 1 + i % 3]))
+        clock.now += 60
+    log.close()
+    return log
+
+
+def expected_rows(n: int) -> dict:
+    """{climate: [(epoch, state, temp, unoccupied)]}"""
+    expected = {climate: [] for climate in CLIMATES}
+    for i in range(n):
+        climates = CLIMATES[i % 3 :] + CLIMATES[: i % 3]
+        for climate, state, temp, unoccupied in evaluation(i, climates[: 1 + i % 3]):
+            hours = 0.0 if unoccupied is False else unoccupied
+            expected[climate].append((1_600_000_000.0 + 60 * i, state, temp, hours))
+    return expected
+
+
+def as_tuples(rows) -> list:
+    return [
+        (epoch, STATES[state], temp, unoccupied)
+        for epoch, _, state, temp, unoccupied in rows.tolist()
+    ]
+
+
+def test_write_rotate_read_round_trip(tmp_path, clock):
+    write(tmp_path, clock, 30)
+    assert len(log_files(str(tmp_path))) > 3  # Rotated
+
+    reader = EvaluationLogReader(str(tmp_path))
+    result = reader.read()
+    expected = expected_rows(30)
+    assert set(result) == set(CLIMATES)
+    for climate in CLIMATES:
+        got = as_tuples(result[climate])
+        assert [row[0] for row in got] == [row[0] for row in expected[climate]]
+        assert [row[1] for row in got] == [row[1] for row in expected[climate]]
+        for (_, _, temp, unoccupied), (_, _, want_temp, want_unocc) in zip(
+            got, expected[climate]
+        ):
+            assert temp == pytest.approx(want_temp, abs=1e-4)  # float32
+            assert unoccupied == want_unocc
+        # One climate: the same rows
+        assert as_tuples(reader.read(climate)[climate]) == got
+
+
+def test_read_groups_with_a_stable_sort(tmp_path, clock):
+    write(tmp_path, clock, 30)
+    reader = EvaluationLogReader(str(tmp_path))
+    for climate, rows in reader.read().items():
+        assert (rows["climate"] == reader.climate_ids[climate]).all()
+        assert (np.diff(rows["epoch"]) >= 0).all()
+    # A time range
+    start, end = 1_600_000_000.0 + 60 * 5, 1_600_000_000.0 + 60 * 20
+    for climate, rows in reader.read(start=start, end=end).items():
+        assert rows["epoch"].min() >= start and rows["epoch"].max() < end
+        in_range = [row for row in expected_rows(30)[climate] if start <= row[0] < end]
+        assert len(rows) == len(in_range)
+
+
+def test_segments_are_memory_mapped_and_read_copies(tmp_path, clock):
+    write(tmp_path, clock, 10)
+    reader = EvaluationLogReader(str(tmp_path))
+    segment = next(reader.segments())
+    assert isinstance(segment, np.memmap)  # A view of the file
+    rows = reader.read("climate.a")["climate.a"]
+    assert not isinstance(rows, np.memmap)
+    assert not np.shares_memory(rows, segment)
+
+
+def test_replay_in_logged_order(tmp_path, clock):
+    write(tmp_path, clock, 12)
+    replayed = list(EvaluationLogReader(str(tmp_path)).replay())
+    assert [epoch for epoch, *_ in replayed] == sorted(epoch for epoch, *_ in replayed)
+    assert len(replayed) == sum(len(rows) for rows in expected_rows(12).values())
+
+
+def test_oldest_files_deleted_beyond_max_files(tmp_path, clock):
+    write(tmp_path, clock, 30, max_files=2)
+    assert len(log_files(str(tmp_path))) == 2
+    rows = EvaluationLogReader(str(tmp_path)).read()
+    last = 1_600_000_000.0 + 60 * 29
+    assert max(r["epoch"].max() for r in rows.values()) == last
+
+
+def test_resume_drops_a_row_cut_off_by_a_crash(tmp_path, clock):
+    write(tmp_path, clock, 1)
+    path = log_files(str(tmp_path))[-1]
+    with open(path, "ab") as f:
+        f.write(b"\x00" * (ROW.size // 2))
+    log = write(tmp_path, clock, 1)
+    assert log.rows_written == 1
+    rows = EvaluationLogReader(str(tmp_path)).read()["climate.a"]
+    assert len(rows) == 2
+    assert not math.isnan(rows["temp"][1])
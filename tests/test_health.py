@@ -0,0 +1,121 @@
+import pytest
+
+from _autoclimate import health
+from _autoclimate.health import HealthTracker
+
+CLIMATE = "climate.cabin"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class StubHass:
+    def __init__(self):
+        self.published = []
+
+    def run_every(self, callback, start, interval):
+        pass
+
+    def log(self, msg, *args, **kwargs):
+        pass
+
+    def update_state(self, entity_id, state=None, attributes=None):
+        self.published.append((state, attributes))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(health, "time", clock)
+    return clock
+
+
+def make_tracker(offline_after=3, base=60, maximum=300) -> HealthTracker:
+    return HealthTracker(
+        StubHass(), "test", [CLIMATE], offline_after, base, maximum  # type: ignore
+    )
+
+
+def test_online_degraded_offline_and_back(clock):
+    tracker = make_tracker(offline_after=3)
+    device = tracker.devices[CLIMATE]
+    tracker.observe(CLIMATE, online=False)
+    assert device.state == "degraded"
+    tracker.observe(CLIMATE, online=False)
+    assert device.state == "degraded"
+    assert not tracker.is_offline(CLIMATE)
+    clock.now += 10
+    tracker.observe(CLIMATE, online=False)
+    assert tracker.is_offline(CLIMATE)
+    assert device.outages == 1
+    assert tracker.hass.published[-1][0] == 1  # Offline climates
+
+    clock.now += 50
+    tracker.observe(CLIMATE, online=True)
+    assert device.state == "online"
+    assert device.last_outage == 60  # From the first offline evaluation
+    assert tracker.hass.published[-1][0] == 0
+
+
+def test_degraded_recovers_without_an_outage(clock):
+    tracker = make_tracker(offline_after=3)
+    tracker.observe(CLIMATE, online=False)
+    tracker.observe(CLIMATE, online=True)
+    tracker.observe(CLIMATE, online=False)
+    tracker.observe(CLIMATE, online=False)
+    assert tracker.devices[CLIMATE].state == "degraded"  # Not 3 in a row
+    assert tracker.devices[CLIMATE].outages == 0
+
+
+def test_attempts_back_off_exponentially_up_to_the_max(clock):
+    tracker = make_tracker(offline_after=1, base=60, maximum=300)
+    assert tracker.attempt(CLIMATE)  # Online: always
+    tracker.observe(CLIMATE, online=False)
+    assert not tracker.attempt(CLIMATE)
+    assert tracker.next_attempt_in(CLIMATE) == 60
+
+    waits = []
+    for _ in range(5):
+        clock.now += tracker.next_attempt_in(CLIMATE)
+        assert tracker.attempt(CLIMATE)
+        assert not tracker.attempt(CLIMATE)  # Used up
+        waits.append(tracker.next_attempt_in(CLIMATE))
+    assert waits == [120, 240, 300, 300, 300]
+
+    # Back online: attempts reset
+    tracker.observe(CLIMATE, online=True)
+    assert tracker.attempt(CLIMATE)
+    assert tracker.devices[CLIMATE].attempts == 0
+
+
+def test_on_recover_callbacks_only_when_leaving_offline(clock):
+    tracker = make_tracker(offline_after=2)
+    recovered = []
+    tracker.on_recover.append(recovered.append)
+
+    tracker.observe(CLIMATE, online=False)  # Degraded
+    tracker.observe(CLIMATE, online=True)
+    assert recovered == []
+
+    tracker.observe(CLIMATE, online=False)
+    tracker.observe(CLIMATE, online=False)  # Offline
+    tracker.observe(CLIMATE, online=True)
+    tracker.observe(CLIMATE, online=True)
+    assert recovered == [CLIMATE]
+
+
+def test_availability_stats(clock):
+    tracker = make_tracker(offline_after=1)
+    clock.now += 300
+    tracker.observe(CLIMATE, online=False)
+    clock.now += 100
+    tracker.publish_stats()
+    stats = tracker.hass.published[-1][1]["cabin"]
+    assert stats["state"] == "offline"
+    assert stats["availability"] == 75.0
+    assert stats["offline_for"] == 100
@@ -0,0 +1,142 @@
+import datetime as dt
+import json
+import sqlite3
+
+import pytest
+
+from _autoclimate.history import RecorderHistory
+from _autoclimate.replay import ReplayHass
+
+NOW = dt.datetime(2021, 1, 11, tzinfo=dt.timezone.utc)
+DAY = 24 * 3600
+
+
+def ts(days_ago: float) -> float:
+    return NOW.timestamp() - days_ago * DAY
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A tiny recorder database: states, states_meta, state_attributes"""
+    path = str(tmp_path / "home-assistant_v2.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE states_meta (metadata_id INTEGER PRIMARY KEY, entity_id TEXT);
+        CREATE TABLE state_attributes (
+            attributes_id INTEGER PRIMARY KEY, shared_attrs TEXT
+        );
+        CREATE TABLE states (
+            state_id INTEGER PRIMARY KEY, metadata_id INTEGER, state TEXT,
+            attributes_id INTEGER, last_changed_ts REAL, last_updated_ts REAL
+        );
+        """
+    )
+    conn.executemany(
+        "INSERT INTO states_meta VALUES (?, ?)",
+        [(1, "climate.cabin"), (2, "binary_sensor.cabin_occupancy")],
+    )
+    conn.execute(
+        "INSERT INTO state_attributes VALUES (1, ?)", [json.dumps({"temperature": 55})]
+    )
+    rows = [
+        # (metadata_id, state, days_ago) - inserted out of time order
+        (1, "heat", 5),
+        (1, "off", 20),  # Before the window - the initial state
+        (1, "heat", 15),  # Before the window, and not the latest before it
+        (1, "off", 1),
+        (2, "on", 3),
+        (2, "off", 2),
+    ]
+    conn.executemany(
+        "INSERT INTO states (metadata_id, state, attributes_id, last_changed_ts,"
+        " last_updated_ts) VALUES (?, ?, 1, NULL, ?)",
+        [(meta, state, ts(days_ago)) for meta, state, days_ago in rows],
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def hass():
+    hass = ReplayHass()
+    hass.now = NOW
+    return hass
+
+
+def summary(records):
+    """[(state, days ago)]"""
+    return [
+        (rec["state"], round(NOW.timestamp() / DAY - ts_of(rec) / DAY))
+        for rec in records
+    ]
+
+
+def ts_of(rec) -> float:
+    return dt.datetime.fromisoformat(rec["last_updated"]).timestamp()
+
+
+def test_history_includes_initial_state_in_order(hass, db_path):
+    history = RecorderHistory(hass, db_path)
+    records = list(history.history("climate.cabin", days=10))
+    assert summary(records) == [("heat", 15), ("heat", 5), ("off", 1)]
+    assert records[0]["attributes"] == {"temperature": 55}
+    assert records[0]["last_changed"] == records[0]["last_updated"]
+
+
+def test_history_newest_first(hass, db_path):
+    history = RecorderHistory(hass, db_path)
+    records = list(history.history("climate.cabin", days=10, newest_first=True))
+    assert summary(records) == [("off", 1), ("heat", 5), ("heat", 15)]
+
+
+def test_no_initial_state_when_nothing_before_window(hass, db_path):
+    history = RecorderHistory(hass, db_path)
+    records = list(history.history("binary_sensor.cabin_occupancy", days=10))
+    assert summary(records) == [("on", 3), ("off", 2)]
+
+
+def test_prefetch_matches_history_and_is_kept_until_cleared(hass, db_path):
+    entities = ["climate.cabin", "binary_sensor.cabin_occupancy"]
+    expected = {
+        entity: list(RecorderHistory(hass, db_path).history(entity))
+        for entity in entities
+    }
+
+    history = RecorderHistory(hass, db_path)
+    assert history.prefetch(entities)
+    history.db_path = "/nonexistent/db"  # Any further read would fail
+    for entity in entities:
+        # Read twice, eg: an occupancy sensor shared by two climates
+        assert list(history.history(entity)) == expected[entity]
+        assert list(history.history(entity)) == expected[entity]
+    assert list(history.history("climate.cabin", newest_first=True)) == list(
+        reversed(expected["climate.cabin"])
+    )
+
+    history.clear_prefetched({})
+    history.db_path = db_path
+    assert list(history.history("climate.cabin")) == expected["climate.cabin"]
+
+
+def test_unreadable_database_falls_back_to_get_history(hass, tmp_path):
+    hass.get_history = lambda entity_id, days: [
+        [{"state": "on", "last_updated": "2021-01-10T00:00:00+00:00"}]
+    ]
+    history = RecorderHistory(hass, str(tmp_path / "missing" / "db"))
+    assert not history.prefetch(["climate.cabin"])
+    assert [rec["state"] for rec in history.history("climate.cabin")] == ["on"]
+
+
+def test_fetch_leaves_the_prefetched_rows_alone(hass, db_path):
+    history = RecorderHistory(hass, db_path)
+    assert history.prefetch(["climate.cabin"])
+    prefetched = list(history.history("climate.cabin"))
+
+    # Eg: autoclimate/whatif, with a different window, while startup still reads
+    fetched = history.fetch(["climate.cabin", "binary_sensor.cabin_occupancy"], days=4)
+    assert summary(fetched["climate.cabin"]) == [("heat", 5), ("off", 1)]
+    assert "binary_sensor.cabin_occupancy" in fetched
+    assert list(history.history("climate.cabin")) == prefetched
+    assert "binary_sensor.cabin_occupancy" not in history._prefetched
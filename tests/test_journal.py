@@ -0,0 +1,70 @@
+import datetime as dt
+
+import pytest
+
+from _autoclimate.journal import TransitionJournal
+
+SIZE = 10
+
+
+def filled(n: int) -> TransitionJournal:
+    """n records at t = 0, 1, ... n - 1, alternating two climates"""
+    journal = TransitionJournal(SIZE)
+    for t in range(n):
+        journal.append(t, f"climate.c{t % 2}", "on", "off", f"r{t}", "poll")
+    return journal
+
+
+def times(records) -> list:
+    return [record[0] for record in records]
+
+
+def test_not_full_keeps_everything():
+    journal = filled(4)
+    assert len(journal) == 4
+    assert times(journal.query()) == [0, 1, 2, 3]
+
+
+@pytest.mark.parametrize("n", [SIZE, SIZE + 1, SIZE + 3, 3 * SIZE + 7])
+def test_overfilled_keeps_the_newest_in_order(n):
+    journal = filled(n)
+    kept = list(range(n - SIZE, n))
+    assert len(journal) == SIZE
+    assert times(journal.query()) == kept
+    # Every start / end, on both sides of the wrap point
+    for start in range(n - SIZE - 2, n + 2):
+        assert times(journal.query(start=start)) == [t for t in kept if t >= start]
+        assert times(journal.query(end=start)) == [t for t in kept if t <= start]
+        assert times(journal.query(start=start, end=start + 3)) == [
+            t for t in kept if start <= t <= start + 3
+        ]
+
+
+def test_climate_filter_across_the_wrap():
+    journal = filled(SIZE + 5)
+    assert times(journal.query(start=8, climate="climate.c1")) == [9, 11, 13]
+
+
+def test_clock_stepping_back_stays_ordered():
+    journal = filled(SIZE + 2)
+    journal.append(0, "climate.c0", "off", "on", "late", "poll")
+    assert times(journal.query()) == sorted(times(journal.query()))
+    assert journal.query(start=SIZE + 1)[-1][4] == "late"
+
+
+def test_time_arguments():
+    journal = TransitionJournal(SIZE)
+    when = dt.datetime(2021, 1, 1, tzinfo=dt.timezone.utc)
+    journal.append(when.timestamp(), "climate.c0", None, "on", "r", "climate.c0")
+    assert len(journal.query(start=when)) == 1
+    assert len(journal.query(start=when.isoformat())) == 1
+    assert journal.query(start=when.timestamp() + 1) == []
+
+
+def test_transitions_service_across_the_wrap():
+    from tests.test_state_snapshots import make_state
+
+    state = make_state()
+    state.journal = filled(SIZE + 4)
+    rows = state.transitions(None, None, None, {"start": SIZE - 1})
+    assert [row["reason"] for row in rows] == [f"r{t}" for t in range(SIZE - 1, SIZE + 4)]
@@ -0,0 +1,42 @@
+import datetime as dt
+
+from _autoclimate.lag import LagMonitor
+
+
+class StubHass:
+    def log(self, msg, *args, **kwargs):
+        pass
+
+    warn = log
+
+    def update_state(self, entity_id, state=None, attributes=None):
+        pass
+
+
+def event(seconds_ago: float) -> dict:
+    when = dt.datetime.now(dt.timezone.utc) - dt.timedelta(seconds=seconds_ago)
+    return {"last_updated": when.isoformat()}
+
+
+def test_storm_coalesces_to_one_evaluation():
+    lag = LagMonitor(StubHass(), "test", threshold=30)  # type: ignore
+    storm = [event(120 - i) for i in range(100)]  # Queued before any is handled
+    handled = [lag.should_evaluate("state", new) for new in storm]
+
+    # The first event evaluates - and reads everything, so the rest are dropped
+    assert handled[0] == (True, False)
+    assert sum(handle for handle, _ in handled) == 1
+    assert all(shedding for _, shedding in handled[1:])
+    assert lag.callbacks["state"]["shed"] > 0
+
+    # An event from after the latest evaluation is still handled
+    assert lag.should_evaluate("state", event(-1)) == (True, True)
+
+
+def test_normal_mode_handles_every_event():
+    lag = LagMonitor(StubHass(), "test", threshold=30)  # type: ignore
+    assert all(
+        lag.should_evaluate("state", event(1)) == (True, False) for _ in range(10)
+    )
+    assert lag.should_evaluate("state", None) == (True, False)  # Poll
+    assert lag.callbacks["state"]["shed"] == 0
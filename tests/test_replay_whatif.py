@@ -0,0 +1,96 @@
+import datetime as dt
+
+import pytest
+
+from _autoclimate.replay import Replay
+from _autoclimate.whatif import analyze
+
+DAY = dt.datetime(2021, 1, 1, tzinfo=dt.timezone.utc)
+ON = {"temperature": 68}
+OFF = {"temperature": None}
+
+
+def at(hours: float) -> dt.datetime:
+    return DAY + dt.timedelta(hours=hours)
+
+
+def record(entity_id: str, hours: float, state=None, attributes=None) -> dict:
+    return {
+        "entity_id": entity_id,
+        "state": state,
+        "attributes": attributes or {},
+        "last_updated": at(hours),
+    }
+
+
+def rules(**auto_off_hours) -> dict:
+    return {
+        f"climate.{name}": {
+            "off_state": {"state": "off"},
+            "occupancy_sensor": f"binary_sensor.{name}_occupancy",
+            "auto_off_hours": hours,
+        }
+        for name, hours in auto_off_hours.items()
+    }
+
+
+def test_replay_turns_off_after_auto_off_hours_unoccupied():
+    records = [
+        record("climate.cabin", 0, attributes=ON),
+        record("binary_sensor.cabin_occupancy", 0, "on"),
+        record("binary_sensor.cabin_occupancy", 1, "off"),
+        # Back, then gone again - the earlier turn off no longer holds
+        record("binary_sensor.cabin_occupancy", 6, "on"),
+        record("binary_sensor.cabin_occupancy", 6.5, "off"),
+        record("binary_sensor.cabin_occupancy", 10, "off"),
+        # Someone turned it on while empty - laston blocks autooff
+        record("climate.garage", 0, attributes=OFF),
+        record("binary_sensor.garage_occupancy", 0, "off"),
+        record("climate.garage", 5, attributes=ON),
+    ]
+    turn_offs = Replay(rules(cabin=2, garage=2)).run(records)
+    assert [(off["climate"], off["time"]) for off in turn_offs] == [
+        # Polls are hourly from the first record. 2h is not > 2h.
+        ("climate.cabin", at(4).isoformat()),
+        ("climate.cabin", at(9).isoformat()),
+    ]
+    assert turn_offs[0]["hours_unoccupied"] == 3
+    assert turn_offs[1]["hours_unoccupied"] == 2.5
+
+
+def test_replay_turned_off_climate_is_not_turned_off_again():
+    records = [
+        record("climate.cabin", 0, attributes=ON),
+        record("binary_sensor.cabin_occupancy", 0, "off"),
+        record("climate.cabin", 12, attributes=ON),  # Still on, per its history
+    ]
+    turn_offs = Replay(rules(cabin=2)).run(records)
+    assert [off["time"] for off in turn_offs] == [at(3).isoformat()]
+
+
+def test_whatif_sweep_saved_hours_and_wrongful():
+    np = pytest.importorskip("numpy")
+    histories = {
+        "climate.cabin": [
+            record("climate.cabin", 0, attributes=ON),
+            record("climate.cabin", 20, attributes=OFF),
+        ],
+        "binary_sensor.cabin_occupancy": [
+            record("binary_sensor.cabin_occupancy", 0, "on"),
+            record("binary_sensor.cabin_occupancy", 2, "off"),
+            record("binary_sensor.cabin_occupancy", 6, "on"),  # Back after 4h
+            record("binary_sensor.cabin_occupancy", 10, "off"),  # Still empty at the end
+        ],
+    }
+    result = analyze(
+        rules(cabin=1),
+        histories,
+        np.array([1, 3, 5, 9], dtype=float),
+        end=at(20.5),
+        wrongful_within=2,
+    )["climate.cabin"]
+    # 02-06 (heat until 06) and 10-20:30 (heat until 20)
+    assert result["turn_offs"] == [2, 2, 1, 1]
+    assert result["saved_hours"] == [3 + 9, 1 + 7, 5, 1]
+    # 3h: off at 05, back at 06 - wrongful. 9h: off at 19, but nobody came back.
+    assert result["wrongful"] == [0, 1, 0, 0]
@@ -0,0 +1,80 @@
+import pytest
+
+from _autoclimate.startup import Startup
+
+
+class StubHass:
+    """run_in runs the callback at once. Events and errors are kept."""
+
+    def __init__(self):
+        self.events = []
+        self.errors = []
+
+    def run_in(self, callback, delay, **kwargs):
+        callback(kwargs)
+
+    def fire_event(self, event, **kwargs):
+        self.events.append((event, kwargs))
+
+    def log(self, msg, *args, **kwargs):
+        pass
+
+    debug = log
+
+    def error(self, msg, *args, **kwargs):
+        self.errors.append(msg)
+
+
+def make_startup(stages: dict, fail=()) -> Startup:
+    """stages - {name: after}. Stages in fail raise."""
+    startup = Startup(StubHass(), "test")  # type: ignore
+    ran = startup.ran = []  # type: ignore
+
+    def stage(name):
+        def run(kwargs):
+            ran.append(name)
+            if name in fail:
+                raise RuntimeError(name)
+
+        return run
+
+    for name, after in stages.items():
+        startup.add(name, stage(name), after=after)
+    return startup
+
+
+def test_stages_run_in_dependency_order_then_ready():
+    startup = make_startup({"c": ["b"], "b": ["a"], "a": [], "d": ["a"]})
+    startup.start()
+    assert startup.ran.index("a") < startup.ran.index("b") < startup.ran.index("c")
+    assert startup.is_ready
+    [(event, data)] = startup.hass.events
+    assert event == "app.test_ready"
+    assert data["failed"] == [] and data["skipped"] == []
+    assert set(data["stages"]) == {"a", "b", "c", "d"}
+
+
+def test_failed_stage_skips_dependents_and_still_fires_ready():
+    startup = make_startup(
+        {"a": [], "b": ["a"], "c": ["b"], "d": []}, fail={"a"}
+    )
+    startup.start()
+    assert "b" not in startup.ran and "c" not in startup.ran
+    assert not startup.is_ready
+    [(event, data)] = startup.hass.events
+    assert data["failed"] == ["a"]
+    assert data["skipped"] == ["b", "c"]
+    assert set(data["stages"]) == {"d"}
+
+
+def test_cycle_is_an_error():
+    startup = make_startup({"a": [], "b": ["a", "d"], "c": ["b"], "d": ["c"]})
+    with pytest.raises(ValueError, match=r"cycle.*\['b', 'c', 'd'\]"):
+        startup.start()
+    assert startup.ran == []
+
+
+def test_unknown_dependency_is_an_error():
+    startup = make_startup({"a": ["missing"]})
+    with pytest.raises(ValueError, match="unknown stage missing"):
+        startup.start()
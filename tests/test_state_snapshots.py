@@ -0,0 +1,195 @@
+import datetime as dt
+import threading
+
+from _autoclimate.mocks import MockLoadGenerator
+from _autoclimate.state import State
+
+CLIMATES = [f"climate.room_{i}" for i in range(6)]
+STATES = ["on", "off", "offline", "error_off"]
+WRITERS = 8
+UPDATES_PER_WRITER = 300
+READERS = 4
+
+
+class StubHass:
+    """What State calls on hass, in memory. Errors are kept for the test to check."""
+
+    def __init__(self):
+        self.errors = []
+        self.entities = {}  # {entity_id: {"state":, "attributes":}} as written
+
+    def get_now(self):
+        return dt.datetime.now(dt.timezone.utc)
+
+    def log(self, msg, *args, **kwargs):
+        pass
+
+    debug = info = lb_log = log
+
+    def error(self, msg, *args, **kwargs):
+        self.errors.append(msg)
+
+    warn = error
+
+    def update_state(self, entity_id, state=None, attributes=None):
+        # Merges, like adplus
+        previous = self.entities.get(entity_id, {}).get("attributes", {})
+        attributes = {**previous, **(attributes or {})}
+        self.entities[entity_id] = {"state": state, "attributes": attributes}
+
+    def set_state(self, entity_id, state=None, attributes=None, replace=False):
+        assert replace
+        self.entities[entity_id] = {"state": state, "attributes": attributes}
+
+    def fire_event(self, event, **kwargs):
+        pass
+
+
+def make_state(publish_mode: str = "flat") -> State:
+    return State(
+        StubHass(),  # type: ignore
+        config={climate: {} for climate in CLIMATES},
+        poll_frequency=1,
+        appname="test",
+        climates=CLIMATES,
+        create_temp_sensors=False,
+        test_mode=True,
+        inactive_period=None,
+        publish_mode=publish_mode,
+    )
+
+
+def tagged_updates(writer: int, seq: int) -> list:
+    """
+    One evaluation of every climate. Every field encodes (writer, seq), so a
+    reader can tell if a snapshot mixes two evaluations.
+    """
+    tag = f"{writer}:{seq}"
+    updates = []
+    for index, climate in enumerate(CLIMATES):
+        state = STATES[(writer + seq + index) % len(STATES)]
+        updates.append(
+            (climate, state, f"{state}|{tag}", writer * 100_000 + seq, seq, tag)
+        )
+    return updates
+
+
+def snapshot_errors(snapshot) -> list:
+    problems = MockLoadGenerator.snapshot_problems(snapshot, 0)
+    tags = set()
+    for climate, rec in snapshot.states.items():
+        if rec["state"] is None:
+            continue  # Not evaluated yet
+        state, _, tag = rec["state_reason"].partition("|")
+        if state != rec["state"]:
+            problems.append(f"{climate}: state {rec['state']} but reason {tag}")
+        writer, seq = map(int, tag.split(":"))
+        if snapshot.temps[climate] != writer * 100_000 + seq:
+            problems.append(f"{climate}: temp {snapshot.temps[climate]} from another update")
+        if snapshot.hvac_modes[climate] != tag or rec["unoccupied"] != seq:
+            problems.append(f"{climate}: fields from different updates: {rec}")
+        tags.add(tag)
+    if len(tags) > 1:
+        problems.append(f"half applied evaluation - climates from {sorted(tags)}")
+    return problems
+
+
+def test_concurrent_submits_always_publish_consistent_snapshots():
+    state = make_state()
+    start = threading.Barrier(WRITERS + READERS)
+    writers_done = threading.Event()
+    reader_problems = []
+    reads = [0] * READERS
+
+    def write(writer: int):
+        start.wait()
+        for seq in range(UPDATES_PER_WRITER):
+            state.submit(state.apply_entity_states, tagged_updates(writer, seq), "poll")
+
+    def read(reader: int):
+        start.wait()
+        last_version = 0
+        while not writers_done.is_set() or reads[reader] == 0:
+            snapshot = state.snapshot
+            if snapshot.version < last_version:
+                reader_problems.append(
+                    f"version went back: {last_version} -> {snapshot.version}"
+                )
+            last_version = snapshot.version
+            reader_problems.extend(snapshot_errors(snapshot))
+            reads[reader] += 1
+
+    writers = [threading.Thread(target=write, args=(i,)) for i in range(WRITERS)]
+    readers = [threading.Thread(target=read, args=(i,)) for i in range(READERS)]
+    for thread in writers + readers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    writers_done.set()
+    for thread in readers:
+        thread.join()
+
+    assert reader_problems == []
+    assert state.hass.errors == []
+    assert all(reads)
+
+    # Every queued change was applied: the last snapshot is the writer's state
+    final = state.snapshot
+    assert snapshot_errors(final) == []
+    assert {climate: dict(rec) for climate, rec in final.states.items()} == state.state
+    assert sum(final.counts.values()) == len(CLIMATES)
+
+
+def test_version_only_moves_on_change():
+    state = make_state()
+    state.submit(state.apply_entity_states, tagged_updates(0, 0), "poll")
+    version = state.snapshot.version
+    state.submit(state.apply_entity_states, tagged_updates(0, 0), "poll")
+    assert state.snapshot.version == version
+    state.submit(state.apply_entity_states, tagged_updates(0, 1), "poll")
+    assert state.snapshot.version == version + 1
+
+
+def test_failing_mutation_is_logged_and_the_rest_still_apply():
+    state = make_state()
+
+    def broken():
+        raise ValueError("boom")
+
+    state.submit(broken)
+    state.submit(state.apply_entity_states, tagged_updates(1, 1), "poll")
+    assert len(state.hass.errors) == 1
+    assert snapshot_errors(state.snapshot) == []
+    assert state.snapshot.states[CLIMATES[0]]["state_reason"].endswith("|1:1")
+
+
+def test_per_climate_publish_ends_on_the_newest_snapshot():
+    state = make_state("per_climate")
+    # Left over from an earlier run in flat mode
+    state.hass.entities[state.app_state_name] = {
+        "state": "on",
+        "attributes": {"room_0_state": "on", "friendly_name": "test State"},
+    }
+    start = threading.Barrier(WRITERS)
+
+    def write(writer: int):
+        start.wait()
+        for seq in range(UPDATES_PER_WRITER // 10):
+            state.submit(state.apply_entity_states, tagged_updates(writer, seq), "poll")
+            state.publish_state()
+
+    writers = [threading.Thread(target=write, args=(i,)) for i in range(WRITERS)]
+    for thread in writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    state.publish_state()
+
+    final = state.snapshot
+    for climate, rec in final.states.items():
+        written = state.hass.entities[state.climate_state_name(climate)]
+        assert written["state"] == rec["state"]
+        assert written["attributes"]["state_reason"] == rec["state_reason"]
+    summary = state.hass.entities[state.app_state_name]["attributes"]
+    assert "room_0_state" not in summary
+    assert summary["summary_state"] == final.summary
@@ -0,0 +1,98 @@
+import pytest
+
+from _autoclimate import temp_sensors
+from _autoclimate.temp_sensors import SensorPolicy, TempSensorPublisher
+
+CLIMATE = "climate.cabin"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class StubHass:
+    def __init__(self):
+        self.published = []
+
+    def run_every(self, callback, start, interval):
+        pass
+
+    def update_state(self, entity_id, state=None, attributes=None):
+        self.published.append((entity_id, state, attributes))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(temp_sensors, "time", clock)
+    return clock
+
+
+def make_publisher(**policy) -> TempSensorPublisher:
+    return TempSensorPublisher(
+        StubHass(), "test", {CLIMATE: {}}, policy  # type: ignore
+    )
+
+
+def test_policy_entity_overrides_global_overrides_defaults():
+    policy = SensorPolicy.from_config({"deadband": 0.5}, {"heartbeat": 0})
+    assert (policy.deadband, policy.min_interval, policy.heartbeat) == (0.5, 0, 0)
+
+
+def test_deadband(clock):
+    publisher = make_publisher(deadband=0.5, heartbeat=0)
+    assert publisher.should_write(CLIMATE, 68.0)  # First value
+    clock.now += 10
+    assert not publisher.should_write(CLIMATE, 68.5)  # Not more than 0.5
+    assert not publisher.should_write(CLIMATE, 67.6)
+    assert publisher.should_write(CLIMATE, 68.6)
+    # Measured from the last written value, not the last evaluated one
+    assert not publisher.should_write(CLIMATE, 68.2)
+    assert publisher.stats["suppressed_deadband"] == 3
+
+
+def test_min_interval(clock):
+    publisher = make_publisher(min_interval=60, heartbeat=0)
+    assert publisher.should_write(CLIMATE, 68.0)
+    clock.now += 59
+    assert not publisher.should_write(CLIMATE, 70.0)
+    clock.now += 1
+    assert publisher.should_write(CLIMATE, 70.0)
+    assert publisher.stats["suppressed_interval"] == 1
+
+
+def test_heartbeat_writes_inside_deadband(clock):
+    publisher = make_publisher(deadband=1.0, heartbeat=600)
+    assert publisher.should_write(CLIMATE, 68.0)
+    clock.now += 599
+    assert not publisher.should_write(CLIMATE, 68.1)
+    clock.now += 1
+    assert publisher.should_write(CLIMATE, 68.1)
+    assert publisher.stats["heartbeats"] == 1
+    # The heartbeat write restarts the clock
+    clock.now += 599
+    assert not publisher.should_write(CLIMATE, 68.1)
+
+
+def test_offline_transitions_always_write(clock):
+    publisher = make_publisher(deadband=1.0, min_interval=60, heartbeat=0)
+    assert publisher.should_write(CLIMATE, 68.0)
+    assert publisher.should_write(CLIMATE, None)  # Inside min_interval
+    assert not publisher.should_write(CLIMATE, None)
+    assert publisher.should_write(CLIMATE, 68.0)
+
+
+def test_publish_stats(clock):
+    publisher = make_publisher(deadband=1.0, heartbeat=0)
+    for value in (68.0, 68.2, 68.4, 70.0):
+        publisher.should_write(CLIMATE, value)
+    publisher.publish_stats({})
+    entity_id, state, attributes = publisher.hass.published[-1]
+    assert entity_id == "sensor.test_temp_sensor_writes"
+    assert state == 50.0
+    assert attributes["cabin_reduction"] == 50.0
+    assert (attributes["evaluated"], attributes["written"]) == (4, 2)
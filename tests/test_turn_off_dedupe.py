@@ -0,0 +1,101 @@
+import pytest
+
+from _autoclimate import turn_off
+from _autoclimate.turn_off import TurnOff
+
+CLIMATES = ["climate.a", "climate.b"]
+ALL_OFF = "app.test_turn_off_all"
+ONE_OFF = "app.test_turn_off_climate"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class StubHass:
+    def listen_event(self, callback, event=None):
+        pass
+
+    def log(self, msg, *args, **kwargs):
+        pass
+
+    debug = log
+
+
+class StubCommands:
+    def __init__(self):
+        self.coalesced = 0
+
+    def coalesced_request(self, count=1):
+        self.coalesced += count
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(turn_off, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def turnoff(clock):
+    return TurnOff(
+        hass=StubHass(),  # type: ignore
+        config={climate: {"off_state": {"state": "off"}} for climate in CLIMATES},
+        inactive_period=None,
+        poll_frequency=1,
+        appname="test",
+        climates=CLIMATES,
+        test_mode=True,
+        state_snapshot=lambda: None,  # type: ignore
+        commands=StubCommands(),  # type: ignore
+        confirmations=None,  # type: ignore
+        health=None,  # type: ignore
+        dedupe_seconds=5,
+    )
+
+
+def test_duplicate_within_the_window_is_coalesced(turnoff, clock):
+    assert turnoff.dedupe(ALL_OFF, {}, CLIMATES) == CLIMATES
+    clock.now += 4.9
+    assert turnoff.dedupe(ALL_OFF, {}, CLIMATES) == []
+    assert turnoff.commands.coalesced == 2
+
+
+def test_same_request_after_the_window_runs_again(turnoff, clock):
+    assert turnoff.dedupe(ALL_OFF, {}, CLIMATES) == CLIMATES
+    clock.now += 5
+    assert turnoff.dedupe(ALL_OFF, {}, CLIMATES) == CLIMATES
+    assert turnoff.commands.coalesced == 0
+
+
+def test_window_is_per_event_climate_and_config(turnoff, clock):
+    assert turnoff.dedupe(ONE_OFF, {"climate": "climate.a"}, ["climate.a"])
+    # Another climate, another event, another config or test_mode: not duplicates
+    assert turnoff.dedupe(ONE_OFF, {"climate": "climate.b"}, ["climate.b"])
+    assert turnoff.dedupe(ALL_OFF, {}, ["climate.a"])
+    assert turnoff.dedupe(
+        ONE_OFF,
+        {"climate": "climate.a", "config": {"off_state": {"state": "away"}}},
+        ["climate.a"],
+    )
+    assert turnoff.dedupe(ONE_OFF, {"climate": "climate.a", "test_mode": True}, ["climate.a"])
+    assert not turnoff.dedupe(ONE_OFF, {"climate": "climate.a"}, ["climate.a"])
+
+
+def test_request_id_is_remembered_until_its_ttl(turnoff, clock):
+    data = {"request_id": "tap-1"}
+    assert turnoff.dedupe(ALL_OFF, data, CLIMATES) == CLIMATES
+    clock.now += 60  # Well past dedupe_seconds - a late retry
+    assert turnoff.dedupe(ALL_OFF, data, CLIMATES) == []
+    clock.now += TurnOff.REQUEST_ID_TTL - 60 - 1
+    assert turnoff.dedupe(ALL_OFF, data, CLIMATES) == []
+    clock.now += 1  # TTL expired
+    assert turnoff.dedupe(ALL_OFF, data, CLIMATES) == CLIMATES
+    # A new request_id still hits the (event, climate, config) window
+    assert turnoff.dedupe(ALL_OFF, {"request_id": "tap-2"}, CLIMATES) == []
+    assert turnoff.commands.coalesced == 6